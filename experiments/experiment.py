@@ -1,8 +1,18 @@
 import os
+import random
+import hashlib
 import contextlib
 from typing import Dict
 from concurrent.futures import ProcessPoolExecutor
 
+import numpy as np
+
+from route_choice_env.metrics import BinaryMetricsSink, MetricsSink, TextMetricsSink
+from route_choice_env.problem import NETWORKS_DIR
+from route_choice_env.shared_network import SharedNetworkSpec, attach_network_spec
+
+from results_store import ResultsStore
+
 
 class Experiment(object):
     """
@@ -57,10 +67,27 @@ class Experiment(object):
         self.LOG_V = '00'
         self.LOGPATH = self.__create_log_path()
 
+        # RESULTS STORE (if given, completed replications are skipped and the running ones are
+        # checkpointed every CHECKPOINT_EVERY episodes, so that they can be resumed)
+        self.SEED = None
+        self.STORE: ResultsStore = None
+        self.CHECKPOINT_EVERY = 100
+
+        # METRICS (the per-episode statistics are either written to a binary file, next to the log, by a background
+        # thread, or printed to the log as text); binary files can be converted to text with convert_metrics_to_text
+        self.METRICS = 'binary'
+
     @property
     def results_summary_filename(self):
         return f'{self.LOGPATH}/results_v{self.LOG_V}_summary.txt'
 
+    # the alternative routes file of the network (None if the default one is used)
+    @property
+    def route_filename(self):
+        if self.NET in ['BBraess_1_2100_10_c1_2100', 'BBraess_3_2100_10_c1_900', 'BBraess_5_2100_10_c1_900', 'BBraess_7_2100_10_c1_900']:
+            return f"{self.NET}.TRC.routes"
+        return None
+
     def __repr__(self):
         return f"""
         Experiment: {self._ID}
@@ -80,26 +107,69 @@ class Experiment(object):
         Preference Distribution Name: {self.PREFERENCE_DIST_NAME}
         """
 
+    # the full configuration of a replication (which identifies it in the results store)
+    def task_config(self, r_id: int) -> dict:
+        return {
+            'algorithm': self.ALG,
+            'network': self.NET,
+            'network_hash': self.__network_hash(),
+            'k': self.K,
+            'episodes': self.ITERATIONS,
+            'alpha_decay': self.ALPHA_DECAY,
+            'epsilon_decay': self.EPSILON_DECAY,
+            'revenue_redistribution_rate': self.REVENUE_REDISTRIBUTION_RATE,
+            'preference_dist_name': self.PREFERENCE_DIST_NAME,
+            'seed': self.SEED,
+            'replication': r_id,
+            'version': self.LOG_V,
+        }
+
+    def task_key(self, r_id: int) -> str:
+        return ResultsStore.get_key(self.task_config(r_id))
+
+    # the stored result of a replication (None if it was not completed or if there is no store)
+    def get_stored_result(self, r_id: int):
+        if self.STORE is None:
+            return None
+        return self.STORE.get_result(self.task_key(r_id))
+
+    # run a replication (unless it was already completed) and store its result; if a seed is given, the
+    # random states are seeded from it and the replication, so that each replication is reproducible by itself
+    # (regardless of the replications run before it, e.g., when some of them are skipped)
+    def run_replication(self, r_id: int):
+        result = self.get_stored_result(r_id)
+        if result is None:
+            if self.SEED is not None:
+                np.random.seed([self.SEED, r_id])
+                random.seed(f'{self.SEED}_{r_id}')
+            result = self.run_experiment(r_id)
+            if self.STORE is not None:
+                self.STORE.put_result(self.task_key(r_id), self.task_config(r_id), result)
+        return result
+
     def run(self):
         results = {}
         for r in range(1, self.REP + 1):
-            results[r] = self.run_experiment(r)
+            results[r] = self.run_replication(r)
 
         with contextlib.suppress(Exception):
-            self.__log_summary(results)
+            self.log_summary(results)
 
+    # run the replications in a pool of processes, where the network is read once (by this process)
+    # and shared with the workers through shared memory
     def run_multiprocess(self, workers):
         futures = {}
         results = {}
-        with ProcessPoolExecutor(max_workers=workers) as ex:
-            for rep in range(1, self.REP + 1):
-                futures[rep] = ex.submit(self.run_experiment, r_id=rep)
+        with SharedNetworkSpec(self.NET, self.K, self.route_filename) as network_spec:
+            with ProcessPoolExecutor(max_workers=workers, initializer=attach_network_spec, initargs=(network_spec.descriptor,)) as ex:
+                for rep in range(1, self.REP + 1):
+                    futures[rep] = ex.submit(self.run_replication, r_id=rep)
 
         for rep, future in futures.items():
             results[rep] = future.result()
 
         with contextlib.suppress(Exception):
-            self.__log_summary(results)
+            self.log_summary(results)
 
     def run_experiment(self, r_id: int) -> tuple:
         """
@@ -107,7 +177,55 @@ class Experiment(object):
         """
         raise NotImplementedError
 
-    def __log_summary(self, results: Dict[int, tuple]):
+    # -- Checkpoints
+    # (used by run_experiment to resume an interrupted replication)
+    # ----------------------------------------
+    # the last checkpoint of a replication, i.e., the number of episodes run and the state saved after them
+    # (None if there is none)
+    def load_checkpoint(self, r_id: int):
+        if self.STORE is None:
+            return None
+        return self.STORE.get_checkpoint(self.task_key(r_id))
+
+    # whether a checkpoint should be saved after the given (0-based) episode (not after the last one,
+    # whose results are stored instead)
+    def is_checkpoint_due(self, episode: int) -> bool:
+        return self.STORE is not None and self.CHECKPOINT_EVERY > 0 and (episode + 1) % self.CHECKPOINT_EVERY == 0 and episode + 1 < self.ITERATIONS
+
+    # save the state of a replication after the given number of episodes (along with the random states and
+    # the positions of its log and metrics, so that they are restored when resuming)
+    def save_checkpoint(self, r_id: int, episode: int, state: dict, log, sink: MetricsSink):
+        sink.flush()
+        log.flush()
+        state = dict(state, np_random=np.random.get_state(), random=random.getstate(), log_size=log.tell(), metrics_position=sink.get_position())
+        self.STORE.put_checkpoint(self.task_key(r_id), episode, state)
+
+    # restore the random states and discard what was logged after the checkpoint (it must be called once the
+    # replication is set up, right before resuming its episodes)
+    def restore_checkpoint(self, state: dict, log, sink: MetricsSink):
+        np.random.set_state(state['np_random'])
+        random.setstate(state['random'])
+        sink.truncate(state['metrics_position'])
+        log.flush()
+        log.truncate(state['log_size'])
+
+    # open the log (a text file) and the metrics sink of a replication, appending to them if the replication is resumed
+    def open_log(self, r_id: int, resume: bool = False):
+        log = open(f'{self.LOGPATH}/results_v{self.LOG_V}_r{r_id}.txt', 'a' if resume else 'w')
+        if self.METRICS == 'binary':
+            sink = BinaryMetricsSink(self.metrics_filename(r_id), background=True, resume=resume)
+        else:
+            sink = TextMetricsSink(log)
+        return log, sink
+
+    def close_log(self, log, sink: MetricsSink):
+        sink.close()
+        log.close()
+
+    def metrics_filename(self, r_id: int):
+        return f'{self.LOGPATH}/results_v{self.LOG_V}_r{r_id}.metrics'
+
+    def log_summary(self, results: Dict[int, tuple]):
         with open(self.results_summary_filename, 'a+') as log:
             log.write(f'Results\t{self.ALG}\t{self.NET}\n')
             log.write('rep\tavg-tt\treal\test\tabsdiff\treldiff\n')  # \tproximityUE\n')
@@ -120,6 +238,16 @@ class Experiment(object):
                 # 4:    relative diff between the est and real regrets
                 log.write(f'{rep}\t{result[0]}\t{result[1]}\t{result[2]}\t{result[3]}\t{result[4]}\n')
 
+    # the hash of the network files (so that results are not reused once the network changes)
+    def __network_hash(self):
+        h = hashlib.sha1()
+        fnames = [f'{NETWORKS_DIR}/{self.NET}.net', f'{NETWORKS_DIR}/{self.route_filename or self.NET + ".routes"}']
+        for fname in fnames:
+            if os.path.exists(fname):
+                with open(fname, 'rb') as f:
+                    h.update(f.read())
+        return h.hexdigest()
+
     def __create_log_path(self):
         logpath = f'{os.path.dirname(os.path.abspath(__file__))}'
         paths = ['/results', f'/{self.ALG}', f'/{self.NET}', f'/K_{self.K}', f'/DECAY_{self.DECAY}', f'/REV_{self.REVENUE_REDISTRIBUTION_RATE}', f'/PREF_{self.PREFERENCE_DIST_NAME}']
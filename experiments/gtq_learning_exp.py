@@ -1,5 +1,3 @@
-import sys
-
 from route_choice_env.core import Policy
 from route_choice_env.route_choice import RouteChoicePZ
 from route_choice_env.statistics import Statistics
@@ -54,16 +52,15 @@ class GTQLearningExperiment(Experiment):
         )
 
     def run_experiment(self, r_id: int):
-        sys.stdout = open(f'{self.LOGPATH}/results_v{self.LOG_V}_r{r_id}.txt', 'w')
+        checkpoint = self.load_checkpoint(r_id)
+        log, sink = self.open_log(r_id, resume=checkpoint is not None)
 
-        print('========================================================================')
-        print(f' Experiment {self._ID} of ')
-        print(f' algorithm={self.ALG}, network={self.NET}, replication={r_id}, K={self.K}, decay={self.DECAY}')
-        print('========================================================================\n')
+        print('========================================================================', file=log)
+        print(f' Experiment {self._ID} of ', file=log)
+        print(f' algorithm={self.ALG}, network={self.NET}, replication={r_id}, K={self.K}, decay={self.DECAY}', file=log)
+        print('========================================================================\n', file=log)
 
-        route_filename = None
-        if self.NET in ['BBraess_1_2100_10_c1_2100', 'BBraess_3_2100_10_c1_900', 'BBraess_5_2100_10_c1_900', 'BBraess_7_2100_10_c1_900']:
-            route_filename = f"{self.NET}.TRC.routes"
+        route_filename = self.route_filename
 
         # initiate environment
         env = RouteChoicePZ(self.NET, self.K,
@@ -89,10 +86,21 @@ class GTQLearningExperiment(Experiment):
         # - z the relative difference between them
         sum_regrets = {od: [0.0, 0.0, 0.0, 0.0] for od in env.od_pairs}
 
-        statistics = Statistics(env, drivers, self.ITERATIONS, True, True, True)
+        statistics = Statistics(env, drivers, self.ITERATIONS, True, True, True, sink=sink, out=log)
 
         best = float('inf')
-        for _ in range(self.ITERATIONS):
+        start = 0
+
+        # resume from the last checkpoint (if any)
+        if checkpoint is not None:
+            start, state = checkpoint
+            env.load_checkpoint(state['env'])
+            drivers.update(state['drivers'])
+            policy = state['policy']
+            alpha, best, sum_regrets = state['alpha'], state['best'], state['sum_regrets']
+            self.restore_checkpoint(state, log, sink)
+
+        for _ in range(start, self.ITERATIONS):
 
             # query for action from each agent's policy
             act_n = {d_id: drivers[d_id].choose_action() for d_id in env.agents}
@@ -119,10 +127,11 @@ class GTQLearningExperiment(Experiment):
 
             # -- episode statistics
             # -------------------------
+            # (the minimum average cost of each driver's OD pair, following the drivers' indices)
+            routes_costs_min = env.get_routes_costs_min()[env.drivers.od].tolist()
             for d_id, d in drivers.items():
                 try:
-                    od_pair = env.get_driver_od_pair(d_id)
-                    d.update_real_regret(env.routes_costs_min[od_pair])
+                    d.update_real_regret(routes_costs_min[env.drivers.get_index(d_id)])
                 except AttributeError:  # validation in case driver does not calculate real regret
                     pass
 
@@ -135,10 +144,20 @@ class GTQLearningExperiment(Experiment):
             solution = env.road_network_flow_distribution
             env.reset()
 
-        statistics.print_statistics(solution, env.avg_travel_time, best, sum_regrets, env.routes_costs_sum)
+            if self.is_checkpoint_due(_):
+                self.save_checkpoint(r_id, _ + 1, {
+                    'env': env.get_checkpoint(),
+                    'drivers': drivers,
+                    'policy': policy,
+                    'alpha': alpha,
+                    'best': best,
+                    'sum_regrets': sum_regrets
+                }, log, sink)
+
+        statistics.print_statistics(solution, env.avg_travel_time, best, sum_regrets, env.get_routes_costs_sum())
 
         # env.close()
 
-        sys.stdout = sys.__stdout__
+        self.close_log(log, sink)
 
         return [env.avg_travel_time, gen_real, gen_estimated, gen_diff, gen_relative_diff]
@@ -6,10 +6,16 @@
 import json
 import timeit
 import argparse
+import contextlib
 import numpy as np
 from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from route_choice_env.problem import read_network_spec
+from route_choice_env.shared_network import SharedNetworkSpec, attach_network_spec
 
 from experiment import Experiment
+from results_store import ResultsStore
 
 from rmq_learning_exp import RMQLearningExperiment
 from tq_learning_exp import TQLearningExperiment
@@ -20,7 +26,7 @@ class InvalidAlgorithm(Exception):
     pass
 
 
-def run_experiment(Experiment: Experiment, workers: int):
+def run_experiment(Experiment: Experiment, workers: int, seed: int = None, store: ResultsStore = None, checkpoint_every: int = 100, metrics: str = 'binary'):
     with open(str(Path(__file__).parent.absolute()) + "/experiments_config.json", 'r') as file:
         raw_experiments = json.load(file)
 
@@ -48,17 +54,80 @@ def run_experiment(Experiment: Experiment, workers: int):
                                 )
                     _id += 1
 
-    print(f'Running {len(experiments)} experiments...')
-
     for exp in experiments:
-        print(exp)
+        exp.SEED = seed
+        exp.STORE = store
+        exp.CHECKPOINT_EVERY = checkpoint_every
+        exp.METRICS = metrics
 
-        if workers > 1:
-            exp.run_multiprocess(workers)
-        else:
+    print(f'Running {len(experiments)} experiments...')
+
+    if workers > 1:
+        run_scheduled(experiments, workers)
+    else:
+        for exp in experiments:
+            print(exp)
             exp.run()
 
 
+def attach_network_specs(descriptors: list):
+    for descriptor in descriptors:
+        attach_network_spec(descriptor)
+
+
+# run the replications of all experiments in a single pool of processes, where every (experiment, replication)
+# task is dispatched longest first (by its estimated cost, i.e., the network size times the number of episodes),
+# and the results are reported as the tasks complete (the summary of an experiment is logged as soon as all of
+# its replications are done); each network is read once and shared with the workers through shared memory
+def run_scheduled(experiments: list, workers: int):
+    with contextlib.ExitStack() as stack:
+        network_specs = {}
+        for exp in experiments:
+            key = (exp.NET, exp.K, exp.route_filename)
+            if key not in network_specs:
+                network_specs[key] = stack.enter_context(SharedNetworkSpec(*key))
+
+        # the size of each network (its number of vehicles and routes)
+        network_size = {}
+        for key in network_specs:
+            spec = read_network_spec(*key)
+            network_size[key] = float(np.sum(spec['od_flows'])) + len(spec['route_strs'])
+
+        # the replications already completed (i.e., in the results store) are not run again
+        results = {id(exp): {} for exp in experiments}
+        tasks = []
+        for exp in experiments:
+            for rep in range(1, exp.REP + 1):
+                result = exp.get_stored_result(rep)
+                if result is None:
+                    tasks.append((exp, rep))
+                else:
+                    results[id(exp)][rep] = result
+        for exp in experiments:
+            if len(results[id(exp)]) == exp.REP:
+                with contextlib.suppress(Exception):
+                    exp.log_summary(dict(sorted(results[id(exp)].items())))
+
+        tasks.sort(key=lambda t: network_size[(t[0].NET, t[0].K, t[0].route_filename)] * t[0].ITERATIONS, reverse=True)
+
+        print(f'Running {len(tasks)} replications on {workers} workers ({sum(map(len, results.values()))} already completed)...')
+
+        descriptors = [network_spec.descriptor for network_spec in network_specs.values()]
+        pending = {id(exp): exp.REP - len(results[id(exp)]) for exp in experiments}
+        with ProcessPoolExecutor(max_workers=workers, initializer=attach_network_specs, initargs=(descriptors,)) as ex:
+            futures = {ex.submit(exp.run_replication, r_id=rep): (exp, rep) for exp, rep in tasks}
+            for done, future in enumerate(as_completed(futures), 1):
+                exp, rep = futures[future]
+                result = future.result()
+                print(f'[{done}/{len(tasks)}] experiment {exp._ID} ({exp.ALG}, {exp.NET}, K={exp.K}), replication {rep}: avg-tt {result[0]}')
+
+                results[id(exp)][rep] = result
+                pending[id(exp)] -= 1
+                if pending[id(exp)] == 0:
+                    with contextlib.suppress(Exception):
+                        exp.log_summary(dict(sorted(results[id(exp)].items())))
+
+
 def main():
     valid_experiments_alg = {
         'RMQLearning': RMQLearningExperiment,
@@ -70,6 +139,13 @@ def main():
     parser.add_argument("--alg", required=True)
     parser.add_argument("--workers", type=int, default=1)
     parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--store", default=str(Path(__file__).parent.absolute()) + "/results/results.sqlite",
+                        help="SQLite file storing the results of the completed replications (which are skipped when re-running) "
+                             "and the checkpoints of the running ones (from which they are resumed); 'none' disables it")
+    parser.add_argument("--checkpoint_every", type=int, default=100, help="Number of episodes between checkpoints (0 disables them)")
+    parser.add_argument("--metrics", choices=['binary', 'text'], default='binary',
+                        help="Write the per-episode statistics to a binary .metrics file (convertible to text with "
+                             "route_choice_env.metrics.convert_metrics_to_text) or as text to the replication's log")
     args = parser.parse_args()
 
     try:
@@ -88,7 +164,11 @@ def main():
 
     starttime = timeit.default_timer()
     print("The start time is :", starttime)
-    run_experiment(EXP, workers)
+    store = None
+    if args.store.lower() != 'none':
+        Path(args.store).parent.mkdir(parents=True, exist_ok=True)
+        store = ResultsStore(args.store)
+    run_experiment(EXP, workers, seed, store, args.checkpoint_every, args.metrics)
     print("The time difference is :", timeit.default_timer() - starttime)
 
 
@@ -0,0 +1,65 @@
+"""
+    Store of experiment results, backed by SQLite.
+
+    Every task (i.e., a replication of an experiment) is identified by the hash of its full configuration, so
+    that re-running a sweep skips the tasks already completed. The store also keeps the last checkpoint of the
+    tasks in progress, from which they can be resumed.
+"""
+import json
+import time
+import pickle
+import sqlite3
+import hashlib
+import contextlib
+
+
+class ResultsStore(object):
+    """
+        Results (and checkpoints) of experiment tasks, indexed by the key of their configuration.
+
+        Connections are opened on every operation, so that the store can be shared by (and pickled to)
+        the worker processes running the tasks.
+    """
+
+    def __init__(self, fname: str):
+        self.fname = fname
+        with self.__connect() as db:
+            db.execute('CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, config TEXT NOT NULL, result TEXT NOT NULL, created REAL NOT NULL)')
+            db.execute('CREATE TABLE IF NOT EXISTS checkpoints (key TEXT PRIMARY KEY, episode INTEGER NOT NULL, state BLOB NOT NULL, created REAL NOT NULL)')
+
+    # the key of a task given its configuration (a JSON-serialisable dictionary)
+    @staticmethod
+    def get_key(config: dict) -> str:
+        return hashlib.sha1(json.dumps(config, sort_keys=True).encode()).hexdigest()
+
+    @contextlib.contextmanager
+    def __connect(self):
+        db = sqlite3.connect(self.fname, timeout=60)
+        try:
+            with db:  # commits (or rolls back) the transaction
+                yield db
+        finally:
+            db.close()
+
+    # the result of a task (None if it was not completed)
+    def get_result(self, key: str):
+        with self.__connect() as db:
+            row = db.execute('SELECT result FROM results WHERE key = ?', (key,)).fetchone()
+        return None if row is None else json.loads(row[0])
+
+    # store the result of a task (and discard its checkpoint)
+    def put_result(self, key: str, config: dict, result):
+        with self.__connect() as db:
+            db.execute('INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)', (key, json.dumps(config, sort_keys=True), json.dumps(result), time.time()))
+            db.execute('DELETE FROM checkpoints WHERE key = ?', (key,))
+
+    # the last checkpoint of a task, i.e., the (unpickled) state stored after its given number of episodes
+    # (None if there is no checkpoint)
+    def get_checkpoint(self, key: str):
+        with self.__connect() as db:
+            row = db.execute('SELECT episode, state FROM checkpoints WHERE key = ?', (key,)).fetchone()
+        return None if row is None else (row[0], pickle.loads(row[1]))
+
+    def put_checkpoint(self, key: str, episode: int, state):
+        with self.__connect() as db:
+            db.execute('INSERT OR REPLACE INTO checkpoints VALUES (?, ?, ?, ?)', (key, episode, pickle.dumps(state), time.time()))
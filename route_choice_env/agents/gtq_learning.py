@@ -1,4 +1,6 @@
-from route_choice_env.core import Agent, Policy
+import numpy as np
+
+from route_choice_env.core import Agent, AgentPopulation, Policy
 
 
 class GTQLearning(Agent):  # Implementation of Regret Minimisation Q-Learning
@@ -202,3 +204,58 @@ class GTQLearning(Agent):  # Implementation of Regret Minimisation Q-Learning
     # calculate the real regret given the real minimum average cost
     def update_real_regret(self, real_min_avg: float):
         self.__real_regret = self.get_average_cost() - real_min_avg
+
+
+class GTQLearningPopulation(AgentPopulation):
+    """
+        Vectorised implementation of the GTQ-learning algorithm for a population of agents.
+
+        Given the same random stream, it yields the same results of a set of GTQLearning agents (one per row).
+    """
+
+    def __init__(self,
+                 n_actions: np.ndarray,
+                 preference_money_over_time: np.ndarray,
+                 extrapolate_costs=False,
+                 policy: Policy = None,
+                 rng: np.random.Generator = None,
+                 groups: np.ndarray = None
+                 ):
+        super(GTQLearningPopulation, self).__init__(n_actions, None, extrapolate_costs, policy, rng, groups)
+
+        # The time-money trade-off of each agent
+        self.__preference_money_over_time = np.asarray(preference_money_over_time, dtype=float)
+
+        # Current toll dues
+        self.__toll_dues = np.zeros(len(self))
+
+    def update_strategy(self, reward: np.ndarray, marginal_cost: np.ndarray = None, side_payment: np.ndarray = None, alpha: float = None) -> None:
+        """
+        As in GTQLearning.update_strategy, but for all agents.
+
+        :param
+            reward: travel time of each agent
+            marginal_cost: marginal cost of each agent's route
+            side_payment: side payment received by each agent
+            alpha: learning rate
+
+        :return: None
+        """
+        travel_time = reward
+        p = self.__preference_money_over_time
+
+        # Compute toll dues (indifferent MCT, see GTQLearning.compute_toll_dues)
+        self.__toll_dues = (marginal_cost + travel_time * p) / p
+
+        # Compute utility (cost) and update strategy (Q-table)
+        cost = (1.0 - p) * travel_time + p * self.__toll_dues - side_payment
+        self._update_strategy_q_learning(cost, alpha)
+
+        # Update agents history
+        self._update_history(cost, travel_time)
+
+        # Estimate regret
+        self._estimate_regret()
+
+    def get_toll_dues(self):
+        return self.__toll_dues
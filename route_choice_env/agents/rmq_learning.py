@@ -1,5 +1,8 @@
 from typing import List
-from route_choice_env.core import Agent, Policy
+
+import numpy as np
+
+from route_choice_env.core import Agent, AgentPopulation, Policy
 
 
 class RMQLearning(Agent):  # Implementation of Regret Minimisation Q-Learning
@@ -170,3 +173,41 @@ class RMQLearning(Agent):  # Implementation of Regret Minimisation Q-Learning
     # calculate the real regret given the real minimum average cost
     def update_real_regret(self, real_min_avg: float):
         self.__real_regret = self.get_average_cost() - real_min_avg
+
+
+class RMQLearningPopulation(AgentPopulation):
+    """
+        Vectorised implementation of the RMQ-learning algorithm for a population of agents.
+
+        Given the same random stream, it yields the same results of a set of RMQLearning agents (one per row).
+    """
+
+    def __init__(self,
+                 n_actions: np.ndarray,
+                 initial_costs: np.ndarray = None,
+                 extrapolate_costs=True,
+                 policy: Policy = None,
+                 rng: np.random.Generator = None,
+                 groups: np.ndarray = None
+                 ):
+        super(RMQLearningPopulation, self).__init__(n_actions, initial_costs, extrapolate_costs, policy, rng, groups)
+
+    def update_strategy(self, reward: np.ndarray, marginal_cost: np.ndarray = None, side_payment: np.ndarray = None, alpha: float = None) -> None:
+        """
+        As in RMQLearning.update_strategy, but for all agents.
+
+        :param
+            reward: travel time of each agent
+            alpha: learning rate
+
+        :return: None
+        """
+        travel_cost = reward
+
+        # Update agents history
+        self._update_history(travel_cost, travel_cost)
+
+        # Estimate regret, compute reward and update strategy (Q-table)
+        self._estimate_regret()
+        cost = self.get_estimated_regret(self.get_last_actions())
+        self._update_strategy_q_learning(cost, alpha)
@@ -1,4 +1,6 @@
-from route_choice_env.core import Agent, Policy
+import numpy as np
+
+from route_choice_env.core import Agent, AgentPopulation, Policy
 
 
 class TQLearning(Agent):  # Implementation of Toll-based Q-Learning
@@ -199,3 +201,52 @@ class TQLearning(Agent):  # Implementation of Toll-based Q-Learning
     # calculate the real regret given the real minimum average cost
     def update_real_regret(self, real_min_avg: float):
         self.__real_regret = self.get_average_cost() - real_min_avg
+
+
+class TQLearningPopulation(AgentPopulation):
+    """
+        Vectorised implementation of the TQ-learning algorithm for a population of agents.
+
+        Given the same random stream, it yields the same results of a set of TQLearning agents (one per row).
+    """
+
+    def __init__(self,
+                 n_actions: np.ndarray,
+                 extrapolate_costs=False,
+                 policy: Policy = None,
+                 rng: np.random.Generator = None,
+                 groups: np.ndarray = None
+                 ):
+        super(TQLearningPopulation, self).__init__(n_actions, None, extrapolate_costs, policy, rng, groups)
+
+        # Current toll dues
+        self.__toll_dues = np.zeros(len(self))
+
+    def update_strategy(self, reward: np.ndarray, marginal_cost: np.ndarray = None, side_payment: np.ndarray = None, alpha: float = None) -> None:
+        """
+        As in TQLearning.update_strategy, but for all agents.
+
+        :param
+            reward: travel time of each agent
+            marginal_cost: marginal cost of each agent's route (i.e., its travel time minus its free flow travel time)
+            alpha: learning rate
+
+        :return: None
+        """
+        travel_time = reward
+
+        # Compute toll dues
+        self.__toll_dues = marginal_cost
+
+        # Compute utility (cost) and update strategy (Q-table)
+        cost = travel_time + self.__toll_dues
+        self._update_strategy_q_learning(cost, alpha)
+
+        # Update agents history
+        self._update_history(cost, travel_time)
+
+        # Estimate regret
+        self._estimate_regret()
+
+    def get_toll_dues(self):
+        return self.__toll_dues
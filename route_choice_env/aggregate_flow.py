@@ -0,0 +1,149 @@
+"""
+    Aggregate-flow simulation of non-atomic route choice populations.
+
+    Rather than simulating each driver, the drivers of each OD pair are represented by a probability
+    distribution over the OD pair's routes. In each episode, the route flows are either sampled (one
+    multinomial draw per OD pair, over the OD pair's drivers) or set to their expected values, and the
+    distributions are then updated from the routes' costs with replicator or logit dynamics. As such,
+    the cost of an episode depends on the number of OD pairs and routes, not on the number of drivers.
+"""
+import numpy as np
+
+from route_choice_env.core import split_od_flow
+from route_choice_env.problem import Network
+
+
+DYNAMICS_REPLICATOR = 'replicator'
+DYNAMICS_LOGIT = 'logit'
+
+
+class AggregateRouteChoice(object):
+    """
+        Route choice of the drivers of a network as (number of OD pairs x number of routes) probabilities, where
+        - dynamics is either 'replicator' (Euler step of the replicator dynamics) or 'logit' (step towards the
+          logit response to the routes' costs), both over the routes' normalised costs
+        - step_size is the step of the dynamics (in (0, 1])
+        - temperature is the temperature of the logit response (unused by the replicator dynamics)
+        - sample defines whether the flows are sampled (otherwise, the expected flows are used)
+        - agent_vehicles_factor is the number of vehicles of each (sampled) driver, as in RouteChoicePZ
+        - rng is the generator of the random numbers (a new, unseeded generator is used if None)
+    """
+
+    def __init__(self, network: Network, dynamics: str = DYNAMICS_REPLICATOR, step_size: float = 0.1, temperature: float = 0.05,
+                 sample: bool = True, agent_vehicles_factor: float = 1.0, rng: np.random.Generator = None):
+        if dynamics not in (DYNAMICS_REPLICATOR, DYNAMICS_LOGIT):
+            raise ValueError(f'Unknown dynamics {dynamics}!')
+        if not 0 < step_size <= 1:
+            raise ValueError('The step size must be in (0, 1]!')
+        if dynamics == DYNAMICS_LOGIT and temperature <= 0:
+            raise ValueError('The temperature of the logit dynamics must be positive!')
+
+        self.__network = network
+        self.__dynamics = dynamics
+        self.__step_size = step_size
+        self.__temperature = temperature
+        self.__sample = sample
+        self.__rng = np.random.default_rng() if rng is None else rng
+
+        # the routes of each OD pair (the valid entries, following the routes' order when flattened)
+        route_set_sizes = network.get_route_set_sizes()
+        self.__valid_routes = np.arange(int(route_set_sizes.max())) < route_set_sizes[:, None]
+
+        # the flow of each OD pair, split (as in DriverPopulation) into drivers of agent_vehicles_factor
+        # vehicles plus an extra driver with the remainder flow
+        self.__od_flows = np.asarray(network.get_OD_flows(), dtype=float)
+        self.__agent_vehicles_factor = agent_vehicles_factor
+        od_drivers = [split_od_flow(network.get_OD_flow(od), agent_vehicles_factor) for od in network.get_OD_pairs()]
+        self.__od_drivers = np.array([n for n, _ in od_drivers], dtype=np.int64)
+        self.__od_remainder = np.array([remainder for _, remainder in od_drivers], dtype=float)
+
+        self.reset()
+
+    def reset(self):
+        # uniform distributions over the routes of each OD pair
+        self.__probabilities = self.__valid_routes / self.__valid_routes.sum(axis=1, keepdims=True)
+
+        self.__route_flow = np.zeros(self.__network.get_number_of_routes())
+        self.__route_cost = np.zeros(self.__network.get_number_of_routes())
+        self.__avg_travel_time = 0.0
+        self.__normalised_avg_travel_time = 0.0
+        self.__episode = 0
+
+    @property
+    def episode(self):
+        return self.__episode
+
+    @property
+    def avg_travel_time(self):
+        return self.__avg_travel_time
+
+    @property
+    def normalised_avg_travel_time(self):
+        return self.__normalised_avg_travel_time
+
+    # the probability of each route of each OD pair, as a (number of OD pairs x number of routes) array
+    def get_probabilities(self):
+        return self.__probabilities
+
+    # the flow and cost of each route in the last episode (following the routes' order)
+    def get_routes_flow(self):
+        return self.__route_flow
+
+    def get_routes_cost(self):
+        return self.__route_cost
+
+    @property
+    def road_network_flow_distribution(self):
+        routes_offset = self.__network.get_routes_offset()
+        return [self.__route_flow[routes_offset[i]:routes_offset[i + 1]].tolist() for i in range(len(routes_offset) - 1)]
+
+    # the flow of each route of each OD pair, as a (number of OD pairs x number of routes) array
+    def __get_flows(self):
+        p = self.__probabilities
+        if not self.__sample:
+            return p * self.__od_flows[:, None]
+
+        # (the probabilities are renormalised, since multinomial rejects sums slightly greater than 1)
+        p = p / p.sum(axis=1, keepdims=True)
+        flows = self.__rng.multinomial(self.__od_drivers, p) * self.__agent_vehicles_factor
+        if np.any(self.__od_remainder > 0):
+            flows = flows + self.__rng.multinomial((self.__od_remainder > 0).astype(np.int64), p) * self.__od_remainder[:, None]
+        return flows
+
+    # simulate an episode (i.e., assign the flows, evaluate their costs and update the routes' probabilities)
+    # and return the average travel time
+    def step(self) -> float:
+        flows = self.__get_flows()
+        self.__route_flow = flows[self.__valid_routes].astype(float)
+
+        avg_cost, normalised_avg_cost, route_cost = self.__network.evaluate_assignments(self.__route_flow)
+        self.__route_cost = route_cost[0]
+        self.__avg_travel_time = float(avg_cost[0])
+        self.__normalised_avg_travel_time = float(normalised_avg_cost[0])
+
+        cost = np.zeros(self.__probabilities.shape)
+        cost[self.__valid_routes] = self.__route_cost / self.__network.get_normalisation_factor_routes()
+        self.__update_probabilities(cost)
+
+        self.__episode += 1
+        return self.__avg_travel_time
+
+    # run a number of episodes and return the average travel time of each episode
+    def run(self, episodes: int) -> list:
+        return [self.step() for _ in range(episodes)]
+
+    def __update_probabilities(self, cost: np.ndarray):
+        p = self.__probabilities
+        if self.__dynamics == DYNAMICS_REPLICATOR:
+            # p_r += step * p_r * (avg_cost - c_r), which keeps the distributions valid for costs in [0, 1]
+            avg_cost = np.sum(p * cost, axis=1, keepdims=True)
+            p = p + self.__step_size * p * (avg_cost - cost)
+        else:
+            # p += step * (logit(c) - p)
+            utility = np.where(self.__valid_routes, -cost / self.__temperature, -np.inf)
+            logit = np.exp(utility - utility.max(axis=1, keepdims=True))
+            logit /= logit.sum(axis=1, keepdims=True)
+            p = p + self.__step_size * (logit - p)
+
+        p = np.maximum(p, 0.0)
+        self.__probabilities = p / p.sum(axis=1, keepdims=True)
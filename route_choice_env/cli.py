@@ -109,6 +109,20 @@ if __name__ == "__main__":
         default=False,
         )
 
+    parser.add_argument(
+        "--population",
+        help="Run the drivers as a single (vectorised) population of agents",
+        action='store_true',
+        default=False,
+        )
+
+    parser.add_argument(
+        "--shared_strategy",
+        help="Share a single strategy among the drivers of each OD pair (implies --population)",
+        action='store_true',
+        default=False,
+        )
+
     args = parser.parse_args()
 
     simulate(
@@ -125,4 +139,6 @@ if __name__ == "__main__":
         args.episodes,
         args.seed,
         args.render,
+        args.population,
+        args.shared_strategy,
         )
@@ -1,3 +1,9 @@
+from collections.abc import Mapping, Sequence
+from decimal import Decimal
+
+import numpy as np
+
+
 
 class Policy(object):
     """
@@ -12,6 +18,13 @@ class Policy(object):
     def act(self, d):
         raise NotImplementedError
 
+    # choose the actions of a population of agents at once, given their strategies (Q-values) as a
+    # (number of agents x number of actions) array, whose invalid actions (those beyond an agent's
+    # number of actions) are set to -inf, and drawing random numbers from rng (or from NumPy's global
+    # random state, if None)
+    def act_batch(self, q_matrix: np.ndarray, rng: np.random.Generator = None) -> np.ndarray:
+        raise NotImplementedError
+
     def update(self, **kwargs):
         raise NotImplementedError
 
@@ -48,6 +61,212 @@ class Agent(object):
         raise NotImplementedError
 
 
+class AgentPopulation(object):
+    """
+        Interface for a population of (stateless) Q-learning driver agents, whose states are stored as
+        (number of agents x number of actions) arrays, so that all agents act and learn at once.
+
+        Agents may have different numbers of actions; the actions beyond an agent's number of actions are
+        invalid (their Q-values are set to -inf). The history and regret estimation shared by the learning
+        algorithms is implemented here, as the vectorised counterpart of their per-agent implementations.
+
+        If groups (e.g., the OD pair of each agent) is given, the agents of the same group share a single
+        strategy and history (parameter sharing), which are updated from the average cost of the group's agents
+        for each action taken; as such, the memory scales with the number of groups (instead of agents), while
+        each agent still samples its own action.
+    """
+
+    def __init__(self, n_actions: np.ndarray, initial_costs: np.ndarray = None, extrapolate_costs: bool = False, policy: Policy = None,
+                 rng: np.random.Generator = None, groups: np.ndarray = None):
+        self.__n_actions = np.asarray(n_actions, dtype=int)
+        n_agents = len(self.__n_actions)
+        k = int(self.__n_actions.max()) if n_agents else 0
+        self.__agents = np.arange(n_agents)
+
+        # the learners are the rows of the strategy and history arrays (i.e., either the agents or their groups)
+        self.__groups = None if groups is None else np.asarray(groups, dtype=int)
+        if self.__groups is None:
+            n_learners = n_agents
+            learners_n_actions = self.__n_actions
+        else:
+            n_learners = int(self.__groups.max()) + 1 if n_agents else 0
+            learners_n_actions = np.zeros(n_learners, dtype=int)
+            learners_n_actions[self.__groups] = self.__n_actions
+            if initial_costs is not None:
+                learners_initial_costs = np.zeros((n_learners, k))
+                learners_initial_costs[self.__groups] = initial_costs
+                initial_costs = learners_initial_costs
+        self.__k = k
+        self.__valid_actions = np.arange(k) < learners_n_actions[:, None]
+
+        self.__last_action = np.full(n_agents, -1, dtype=int)
+
+        # Strategy (Q table)
+        self.__strategy = np.where(self.__valid_actions, 0.0, -np.inf)
+
+        # Policy used for choosing an action (and the generator of its random numbers; if None, NumPy's
+        # global random state is used, which yields the same actions of the per-agent implementations)
+        self.__policy = policy
+        self.__rng = rng
+
+        # History
+        # For each learner and action, the fields of the per-agent [sum, samples, extrapolated_sum, avg, last, last_time]
+        # array (see RMQLearning), each stored as a (number of learners x number of actions) array
+        self.__history_sum = np.zeros((n_learners, k))
+        self.__history_samples = np.zeros((n_learners, k))
+        self.__history_extrapolated_sum = np.zeros((n_learners, k))
+        self.__history_avg = np.zeros((n_learners, k))
+        self.__history_last = np.zeros((n_learners, k)) if initial_costs is None else np.array(initial_costs, dtype=float)
+        self.__history_last_time = np.zeros((n_learners, k))
+
+        # Whether the average cost estimations should extrapolate the experimented costs
+        self.__extrapolate_costs = extrapolate_costs
+
+        # Sum of the experimented costs (used to obtain the average cost)
+        self.__sum_cost = np.zeros(n_learners)
+
+        # Estimated regret
+        self.__estimated_regret = None
+        self.__estimated_action_regret = np.zeros((n_learners, k))
+
+        # Real regret
+        self.__real_regret = np.zeros(n_agents)
+
+        # Minimum average cost
+        self.__min_avg_cost = np.zeros(n_learners)
+
+        self.__iteration = 0
+
+    def __len__(self):
+        return len(self.__n_actions)
+
+    # -- Agents Properties
+    # ----------------------------------------
+    def get_n_actions(self):
+        return self.__n_actions
+
+    def get_last_actions(self):
+        return self.__last_action
+
+    # the group of each agent (None if the agents do not share their strategies)
+    def get_groups(self):
+        return self.__groups
+
+    # the strategy (Q table) of each agent (with parameter sharing, the agents of a group have the same strategy)
+    def get_strategy(self):
+        if self.__groups is None:
+            return self.__strategy
+        return self.__strategy[self.__groups]
+
+    def get_average_cost(self):
+        return self.__per_agent(self.__sum_cost / self.__iteration)
+
+    # -- Agents functions
+    # ----------------------------------------
+    def choose_actions(self) -> np.ndarray:
+        self.__iteration += 1
+        self.__last_action = self.__policy.act_batch(self.get_strategy(), self.__rng)
+        return self.__last_action
+
+    # update the agents' strategies given the outcome of their last actions, where
+    # - reward is the travel time of each agent
+    # - marginal_cost is the marginal cost of each agent's route
+    # - side_payment is the side payment received by each agent
+    def update_strategy(self, reward: np.ndarray, marginal_cost: np.ndarray = None, side_payment: np.ndarray = None, alpha: float = None) -> None:
+        raise NotImplementedError
+
+    # Q-learning (stateless, so the gamma parameter is not required)
+    def _update_strategy_q_learning(self, utility: np.ndarray, alpha: float):
+        if self.__groups is None:
+            normalised_utility = 1 - utility
+            a = self.__last_action
+            self.__strategy[self.__agents, a] = (1 - alpha) * self.__strategy[self.__agents, a] + alpha * normalised_utility
+        else:
+            utility, taken = self.__aggregate(utility)
+            normalised_utility = 1 - utility[taken]
+            self.__strategy[taken] = (1 - alpha) * self.__strategy[taken] + alpha * normalised_utility
+
+    # History (as in the per-agent implementations, but for all agents at once)
+    def _update_history(self, cost: np.ndarray, travel_time: np.ndarray):
+        if self.__groups is None:
+            a = self.__last_action
+
+            # update the sum of costs (used to compute the average cost)
+            self.__sum_cost += cost
+
+            # update the history of costs
+            # Pt1: for the current action
+            self.__history_sum[self.__agents, a] += cost  # add current cost
+            self.__history_samples[self.__agents, a] += 1  # increment number of samples
+            self.__history_last[self.__agents, a] = cost  # update last cost
+            self.__history_last_time[self.__agents, a] = travel_time  # update most recent travel time of current taken action
+        else:
+            # the average costs (overall and of each action taken) of each group
+            self.__sum_cost += np.bincount(self.__groups, weights=cost, minlength=len(self.__sum_cost)) / np.maximum(np.bincount(self.__groups, minlength=len(self.__sum_cost)), 1)
+            cost, taken = self.__aggregate(cost)
+            travel_time, _ = self.__aggregate(travel_time)
+
+            # Pt1: for the actions taken
+            self.__history_sum[taken] += cost[taken]
+            self.__history_samples[taken] += 1
+            self.__history_last[taken] = cost[taken]
+            self.__history_last_time[taken] = travel_time[taken]
+
+        # Pt2: for all actions...
+        # update the extrapolated sum
+        self.__history_extrapolated_sum += self.__history_last  # add last cost to extrapolate estimation
+
+        # compute the average cost
+        if self.__extrapolate_costs:
+            self.__history_avg = self.__history_extrapolated_sum / self.__iteration
+        else:
+            with np.errstate(divide='ignore', invalid='ignore'):  # just to handle initial cases
+                self.__history_avg = np.where(self.__history_samples > 0, self.__history_sum / self.__history_samples, 0.0)
+
+        self.__min_avg_cost = np.min(np.where(self.__valid_actions, self.__history_avg, np.inf), axis=1)
+
+    # the average of the agents' values for each group and action (among the agents of the group that took the
+    # action in their last choice), along with whether each action was taken by some agent of each group
+    def __aggregate(self, values: np.ndarray):
+        shape = self.__strategy.shape
+        key = self.__groups * self.__k + self.__last_action
+        counts = np.bincount(key, minlength=shape[0] * shape[1]).reshape(shape)
+        sums = np.bincount(key, weights=values, minlength=shape[0] * shape[1]).reshape(shape)
+        taken = counts > 0
+        return np.divide(sums, counts, out=np.zeros(shape), where=taken), taken
+
+    # the value of each agent given the values of the learners
+    def __per_agent(self, values: np.ndarray) -> np.ndarray:
+        if self.__groups is None:
+            return values
+        return values[self.__groups]
+
+    # -- Regret functions
+    # ----------------------------------------
+    # Calculate the agents' estimated regret
+    def _estimate_regret(self):
+        self.__estimated_regret = (self.__sum_cost / self.__iteration) - self.__min_avg_cost
+
+        # Estimated regret per action
+        self.__estimated_action_regret = self.__history_avg - self.__min_avg_cost[:, None]
+        if self.__extrapolate_costs is False:  # to handle initial cases
+            self.__estimated_action_regret = np.where(self.__history_samples == 0, 0.0, self.__estimated_action_regret)
+
+    # the estimated regret of each agent (or of each agent w.r.t. the given actions, one per agent)
+    def get_estimated_regret(self, actions: np.ndarray = None):
+        if actions is None:
+            return self.__per_agent(self.__estimated_regret)
+        learners = self.__agents if self.__groups is None else self.__groups
+        return self.__estimated_action_regret[learners, actions]
+
+    def get_real_regret(self):
+        return self.__real_regret
+
+    # calculate the real regret given the real minimum average cost (of each agent's OD pair)
+    def update_real_regret(self, real_min_avg: np.ndarray):
+        self.__real_regret = self.get_average_cost() - real_min_avg
+
+
 class Driver:
     """
         Class describing adriver in the environment.
@@ -101,3 +320,194 @@ class Driver:
     # ------------
     def set_current_route(self, route_id: int):
         self.current_route = route_id
+
+
+# split the flow of an OD pair into drivers of agent_vehicles_factor vehicles (computed with decimals, so that
+# fractional factors are exact); it returns the number of such drivers and the remainder flow (of an extra driver)
+def split_od_flow(od_flow: float, agent_vehicles_factor: float):
+    n_of_agents = int( Decimal(od_flow) / Decimal(agent_vehicles_factor) )
+    remainder = float( Decimal(od_flow) - Decimal(n_of_agents) * Decimal(agent_vehicles_factor) )
+    return n_of_agents, remainder
+
+
+class DriverPopulation(object):
+    """
+        The drivers of the environment, stored as a struct of arrays indexed by a dense driver index.
+
+        The drivers of each OD pair are contiguous (following the OD pairs' order), so that the
+        string ID of a driver (driver_{od}_{i}) can be mapped to its index (and vice versa)
+        without storing the IDs themselves.
+    """
+
+    def __init__(self, od_pairs: list, od_flows: list, agent_vehicles_factor: float, preference_money_over_time):
+        self.__od_pairs = list(od_pairs)
+        self.__od_order = {od: i for i, od in enumerate(self.__od_pairs)}
+
+        od = []
+        flow = []
+        offset = [0]
+        for od_order, od_flow in enumerate(od_flows):
+            n_of_agents, remainder = split_od_flow(od_flow, agent_vehicles_factor)
+
+            od_flow = np.full(n_of_agents, agent_vehicles_factor, dtype=float)
+            if remainder > 0:
+                od_flow = np.concatenate([[remainder], od_flow])  # extra agent for remainder flow
+
+            od.append(np.full(len(od_flow), od_order, dtype=np.int32))
+            flow.append(od_flow)
+            offset.append(offset[-1] + len(od_flow))
+
+        # the index of the first driver of each OD pair (followed by the number of drivers)
+        self.offset = np.array(offset, dtype=int)
+        self.__offset = offset
+
+        # the OD pair (order) and flow of each driver
+        self.od = np.concatenate(od) if od else np.zeros(0, dtype=np.int32)
+        self.flow = np.concatenate(flow) if flow else np.zeros(0)
+
+        # the time-money trade-off of each driver (sampled in the drivers' order)
+        self.preference_money_over_time = np.fromiter((preference_money_over_time.sample() for _ in range(len(self.od))), dtype=float, count=len(self.od))
+
+        # the route currently taken by each driver (-1 if none)
+        self.current_route = np.full(len(self.od), -1, dtype=np.int32)
+
+    def __len__(self):
+        return len(self.od)
+
+    def get_id(self, index: int) -> str:
+        od_order = int(self.od[index])
+        return f'driver_{self.__od_pairs[od_order]}_{index - self.__offset[od_order]}'
+
+    # the IDs of all drivers, following their indices
+    def iter_ids(self):
+        for od_order, od in enumerate(self.__od_pairs):
+            for i in range(self.__offset[od_order + 1] - self.__offset[od_order]):
+                yield f'driver_{od}_{i}'
+
+    # the index of a driver given its ID (raises KeyError if it does not exist)
+    def get_index(self, d_id: str) -> int:
+        try:
+            pos = d_id.rindex('_')
+            od_order = self.__od_order[d_id[7:pos]]
+            i = int(d_id[pos + 1:])
+        except (AttributeError, ValueError, KeyError):
+            raise KeyError(d_id)
+        if not 0 <= i < self.__offset[od_order + 1] - self.__offset[od_order] or not d_id.startswith('driver_'):
+            raise KeyError(d_id)
+        return self.__offset[od_order] + i
+
+    def get_od_pair(self, index: int) -> str:
+        return self.__od_pairs[self.od[index]]
+
+    # the IDs of all drivers (created lazily, when accessed)
+    def get_ids(self) -> 'DriverIDs':
+        return DriverIDs(self)
+
+
+class DriverIDs(Sequence):
+    """ Read-only sequence of the IDs of a driver population, whose elements are created when accessed. """
+
+    def __init__(self, population: DriverPopulation):
+        self.__population = population
+
+    def __len__(self):
+        return len(self.__population)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self.__population.get_id(i) for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('driver index out of range')
+        return self.__population.get_id(index)
+
+    def __iter__(self):
+        return self.__population.iter_ids()
+
+    def __contains__(self, d_id):
+        try:
+            self.__population.get_index(d_id)
+            return True
+        except (KeyError, AttributeError):
+            return False
+
+    def index(self, d_id, *args):
+        try:
+            return self.__population.get_index(d_id)
+        except (KeyError, AttributeError):
+            raise ValueError(f'{d_id} is not a driver')
+
+
+class DriverMapping(Mapping):
+    """ Read-only mapping from the IDs of a driver population to values computed (by function) when accessed. """
+
+    def __init__(self, ids: DriverIDs, function):
+        self.__ids = ids
+        self.__function = function
+
+    def __getitem__(self, d_id):
+        if d_id not in self.__ids:
+            raise KeyError(d_id)
+        return self.__function(d_id)
+
+    def __iter__(self):
+        return iter(self.__ids)
+
+    def __len__(self):
+        return len(self.__ids)
+
+
+# the keys of the drivers' info (see RouteChoicePZ.step)
+INFO_KEYS = ('preference_money_over_time', 'free_flow_travel_times', 'marginal_cost', 'side_payment')
+
+
+class SharedInfo(object):
+    """
+        Values of the info shared by the drivers of a step (or reset), which are not modified once created:
+        - keys: the info keys included (a subset of INFO_KEYS)
+        - free_flow_travel_times: the free flow travel times (tuple) of the routes of each OD pair
+        - marginal_cost: the marginal cost of each route, following the routes' order
+        - side_payment: the side payment of each OD pair
+    """
+    __slots__ = ('keys', 'free_flow_travel_times', 'marginal_cost', 'side_payment')
+
+    def __init__(self, keys: tuple, free_flow_travel_times: list, marginal_cost: list, side_payment: list):
+        self.keys = keys
+        self.free_flow_travel_times = free_flow_travel_times
+        self.marginal_cost = marginal_cost
+        self.side_payment = side_payment
+
+
+class DriverInfo(Mapping):
+    """
+        Read-only info of a driver, as a view onto the values shared by all drivers (see SharedInfo) given the
+        driver's OD pair (order), route (index in the routes' order, or -1 if it took no route) and preference.
+    """
+    __slots__ = ('__shared', '__od', '__route', '__preference')
+
+    def __init__(self, shared: SharedInfo, od: int, route: int, preference: float):
+        self.__shared = shared
+        self.__od = od
+        self.__route = route
+        self.__preference = preference
+
+    def __getitem__(self, key):
+        if key not in self.__shared.keys:
+            raise KeyError(key)
+        if key == 'preference_money_over_time':
+            return self.__preference
+        if key == 'free_flow_travel_times':
+            return self.__shared.free_flow_travel_times[self.__od]
+        if key == 'marginal_cost':
+            return self.__shared.marginal_cost[self.__route] if self.__route >= 0 else 0.0
+        return self.__shared.side_payment[self.__od]
+
+    def __iter__(self):
+        return iter(self.__shared.keys)
+
+    def __len__(self):
+        return len(self.__shared.keys)
+
+    def __repr__(self):
+        return repr(dict(self))
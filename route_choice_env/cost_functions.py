@@ -0,0 +1,216 @@
+import numpy as np
+from sympy import Poly, Symbol, Wild, diff, lambdify, sympify
+
+
+# =======================================================================
+
+class CostFunction(object):
+    """
+        Interface for a link cost function (the volume-delay function of a link).
+
+        A single instance represents a `function` declaration from the .net file and
+        stores the constants of every link using it, so that the costs (and their
+        first derivatives w.r.t. the flow) of all such links are evaluated with a
+        single NumPy call over an array of flows.
+    """
+
+    def __init__(self, name: str, param: str, constants: list, expr: str):
+        self.name = name
+        self.param = param
+        self.constants = constants
+        self.expr = expr
+
+        # the index (in the network) of each link using this function
+        self.links = []
+
+        # the constants' values of each link using this function (one list per constant)
+        self.__values = [[] for _ in constants]
+
+    def add_link(self, index: int, values: list):
+        if len(values) < len(self.constants):
+            raise Exception('Function %s expects %d constants, but only %d were given!' % (
+                self.name, len(self.constants), len(values)))
+
+        self.links.append(index)
+        for c, v in enumerate(values[:len(self.constants)]):
+            self.__values[c].append(float(v))
+
+    # convert the links' constants into arrays (and compute any coefficient depending on them);
+    # it must be called after all links have been added
+    def compile(self):
+        self.links = np.array(self.links, dtype=int)
+        self.coefficients = self._compile({c: np.array(v, dtype=float) for c, v in zip(self.constants, self.__values)})
+
+    # return the list of coefficients (one array per coefficient, with one value per link) used by
+    # the _evaluate and _evaluate_deriv methods
+    def _compile(self, values: dict) -> list:
+        raise NotImplementedError
+
+    # evaluate the function for the links' flows, where positions (if given) selects a subset of
+    # the links (by their position in self.links) to which the flows correspond
+    def evaluate(self, flow: np.ndarray, positions: np.ndarray = None) -> np.ndarray:
+        return self._evaluate(flow, *self.__get_coefficients(positions))
+
+    # the derivative is assumed to be zero wherever it is undefined at zero flow
+    # (e.g., when the flow is a divisor, as in the BPR function)
+    def evaluate_deriv(self, flow: np.ndarray, positions: np.ndarray = None) -> np.ndarray:
+        return self._evaluate_deriv(flow, *self.__get_coefficients(positions))
+
+    def _evaluate(self, flow, *coefficients):
+        raise NotImplementedError
+
+    def _evaluate_deriv(self, flow, *coefficients):
+        raise NotImplementedError
+
+    def __get_coefficients(self, positions):
+        if positions is None:
+            return self.coefficients
+        return [c[positions] for c in self.coefficients]
+
+    # evaluate a sympy expression (defined over the constants) for every link of the function
+    def _evaluate_coefficient(self, coefficient, values: dict) -> np.ndarray:
+        symbols = [Symbol(c) for c in self.constants]
+        result = lambdify(symbols, coefficient, 'numpy')(*[values[c] for c in self.constants])
+        return np.broadcast_to(np.asarray(result, dtype=float), (len(self.links),)).copy()
+
+
+class LinearFunction(CostFunction):
+    """ Linear cost function m*f+n (e.g., the BraessG and OW functions). """
+
+    def __init__(self, name, param, constants, expr, m, n):
+        super(LinearFunction, self).__init__(name, param, constants, expr)
+        self.__coefficients_expr = (m, n)
+
+    def _compile(self, values):
+        return [self._evaluate_coefficient(e, values) for e in self.__coefficients_expr]
+
+    def _evaluate(self, flow, m, n):
+        return m * flow + n
+
+    def _evaluate_deriv(self, flow, m, n):
+        return m.copy()
+
+
+class BPRFunction(CostFunction):
+    """ Bureau of Public Roads cost function t*(1+a*(f/c)^b). """
+
+    def __init__(self, name, param, constants, expr, t, a, c, b):
+        super(BPRFunction, self).__init__(name, param, constants, expr)
+        self.__coefficients_expr = (t, a, c, b)
+
+    def _compile(self, values):
+        return [self._evaluate_coefficient(e, values) for e in self.__coefficients_expr]
+
+    def _evaluate(self, flow, t, a, c, b):
+        return t * (1 + a * (flow / c) ** b)
+
+    def _evaluate_deriv(self, flow, t, a, c, b):
+        # a*b*t*(f/c)^b/f, as computed by sympy (the flow is a divisor)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            deriv = a * b * t * (flow / c) ** b / flow
+        return np.where(flow == 0.0, 0.0, deriv)
+
+
+class GenericFunction(CostFunction):
+    """ Any other cost function, evaluated through its (and its derivative's) lambdified sympy expression. """
+
+    def __init__(self, name, param, constants, expr, sympy_expr):
+        super(GenericFunction, self).__init__(name, param, constants, expr)
+        symbols = [Symbol(param)] + [Symbol(c) for c in constants]
+        self.__function = lambdify(symbols, sympy_expr, 'numpy')
+        self.__function_deriv = lambdify(symbols, diff(sympy_expr, Symbol(param)), 'numpy')
+
+    def _compile(self, values):
+        return [values[c] for c in self.constants]
+
+    def _evaluate(self, flow, *values):
+        return np.broadcast_to(np.asarray(self.__function(flow, *values), dtype=float), flow.shape).copy()
+
+    def _evaluate_deriv(self, flow, *values):
+        with np.errstate(divide='ignore', invalid='ignore'):
+            deriv = np.broadcast_to(np.asarray(self.__function_deriv(flow, *values), dtype=float), flow.shape)
+        if not np.all(np.isfinite(deriv[flow != 0.0])):
+            raise Exception('Error on evaluating the derivative of function %s (%s)!' % (self.name, self.expr))
+        return np.where(np.isfinite(deriv), deriv, 0.0)
+
+
+# recognise the family of a cost function from its expression
+def create_cost_function(name: str, param: str, constants: list, expr: str) -> CostFunction:
+    f = Symbol(param)
+    sympy_expr = sympify(expr.replace('^', '**'))
+
+    # linear functions (m*f+n)
+    if sympy_expr.is_polynomial(f) and Poly(sympy_expr, f).degree() <= 1:
+        return LinearFunction(name, param, constants, expr, sympy_expr.coeff(f, 1), sympy_expr.coeff(f, 0))
+
+    # BPR functions (t*(1+a*(f/c)^b))
+    t, a, c, b = [Wild(w, exclude=[f]) for w in 'tacb']
+    match = sympy_expr.match(t * (1 + a * (f / c) ** b))
+    if match is not None and all(w in match for w in (t, a, c, b)):
+        return BPRFunction(name, param, constants, expr, match[t], match[a], match[c], match[b])
+
+    return GenericFunction(name, param, constants, expr, sympy_expr)
+
+
+# =======================================================================
+
+class LinkCostEngine(object):
+    """
+        Evaluates the costs of all links of a network at once.
+
+        Links are identified by their (dense) index in the network, and their flows are
+        given as an array aligned with these indices (or with a given subset of them).
+    """
+
+    def __init__(self):
+        self.__functions = {}
+
+        # the function (by its order of declaration) of each link and the link's position in the function
+        self.__link_function = []
+        self.__link_position = []
+
+    def add_function(self, name: str, param: str, constants: list, expr: str) -> CostFunction:
+        self.__functions[name] = create_cost_function(name, param, constants, expr)
+        return self.__functions[name]
+
+    def get_function(self, name: str) -> CostFunction:
+        return self.__functions[name]
+
+    # register a link using the given function and return its index
+    def add_link(self, function_name: str, values: list) -> int:
+        index = len(self.__link_function)
+        function = self.__functions[function_name]
+        self.__link_function.append(list(self.__functions).index(function_name))
+        self.__link_position.append(len(function.links))
+        function.add_link(index, values)
+        return index
+
+    def compile(self):
+        for function in self.__functions.values():
+            function.compile()
+        self.__link_function = np.array(self.__link_function, dtype=int)
+        self.__link_position = np.array(self.__link_position, dtype=int)
+
+    def get_number_of_links(self) -> int:
+        return len(self.__link_function)
+
+    # evaluate the costs of the links given their flows, where links (if given) are the
+    # indices of the links to which the flows correspond
+    # (the flows may also be a 2D array, with one assignment per row)
+    def evaluate(self, flow: np.ndarray, links: np.ndarray = None) -> np.ndarray:
+        return self.__evaluate(flow, links, False)
+
+    def evaluate_deriv(self, flow: np.ndarray, links: np.ndarray = None) -> np.ndarray:
+        return self.__evaluate(flow, links, True)
+
+    def __evaluate(self, flow, links, deriv):
+        result = np.empty(flow.shape)
+        for i, function in enumerate(self.__functions.values()):
+            evaluate = function.evaluate_deriv if deriv else function.evaluate
+            if links is None:
+                result[..., function.links] = evaluate(flow[..., function.links])
+            else:
+                mask = self.__link_function[links] == i
+                if mask.any():
+                    result[..., mask] = evaluate(flow[..., mask], self.__link_position[links[mask]])
+        return result
@@ -0,0 +1,212 @@
+"""
+    Sinks for the per-episode metrics of experiments (see Statistics).
+
+    A sink receives the columns' names once and then one row of values per episode. The text sink writes
+    tab-separated lines (the format printed by the experiments), whereas the binary sink appends the rows,
+    in batches, to a file of float64 records (optionally from a background thread); binary files can be
+    converted to the text format on demand (see convert_metrics_to_text).
+"""
+import sys
+import json
+import queue
+import struct
+import threading
+
+import numpy as np
+
+
+METRICS_MAGIC = b'RCEMETRICS1\n'
+
+
+class MetricsSink(object):
+    """
+        Interface for a sink of per-episode metrics.
+
+        Positions (as returned by get_position) identify the rows written so far, so that a sink
+        can be truncated back to them (e.g., when an experiment is resumed from a checkpoint).
+    """
+
+    def write_header(self, columns: list, int_columns: list = ()):
+        raise NotImplementedError
+
+    def write(self, row: list):
+        raise NotImplementedError
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.flush()
+
+    def get_position(self):
+        raise NotImplementedError
+
+    def truncate(self, position):
+        raise NotImplementedError
+
+
+class TextMetricsSink(MetricsSink):
+    """ Writes the metrics as tab-separated lines to a (text) file object (the current sys.stdout, if None). """
+
+    def __init__(self, file=None):
+        self.__file = file
+
+    @property
+    def file(self):
+        return sys.stdout if self.__file is None else self.__file
+
+    def write_header(self, columns, int_columns=()):
+        print('\t'.join(map(str, columns)), file=self.file)
+
+    def write(self, row):
+        print('\t'.join(map(str, row)), file=self.file)
+
+    def flush(self):
+        self.file.flush()
+
+    def get_position(self):
+        self.file.flush()
+        return self.file.tell()
+
+    def truncate(self, position):
+        self.file.flush()
+        self.file.truncate(position)
+
+
+class BinaryMetricsSink(MetricsSink):
+    """
+        Appends the metrics to a binary file, whose header (the magic string followed by the length of a JSON
+        object with the columns' names) is followed by the rows, each one stored as float64 values.
+
+        The rows are buffered and written in batches of batch_size rows; if background is True, the batches
+        are written by a background thread. If resume is True, the rows of an existing file are kept (and
+        new rows are appended to them), as long as its columns match.
+    """
+
+    def __init__(self, fname: str, batch_size: int = 1000, background: bool = False, resume: bool = False):
+        self.fname = fname
+        self.__batch_size = batch_size
+        self.__resume = resume
+        self.__file = None
+        self.__columns = None
+        self.__batch = None
+        self.__batch_rows = 0
+        self.__rows = 0
+        self.__header_size = 0
+
+        self.__queue = None
+        self.__thread = None
+        self.__error = None
+        if background:
+            self.__queue = queue.Queue()
+            self.__thread = threading.Thread(target=self.__write_batches, daemon=True)
+            self.__thread.start()
+
+    def __len__(self):
+        return self.__rows
+
+    def write_header(self, columns, int_columns=()):
+        self.__columns = list(columns)
+        header = json.dumps({'columns': self.__columns, 'int_columns': list(int_columns)}).encode()
+        header = METRICS_MAGIC + struct.pack('<I', len(header)) + header
+        self.__header_size = len(header)
+        self.__batch = np.empty((self.__batch_size, len(self.__columns)))
+
+        if self.__resume:
+            self.__file = open(self.fname, 'r+b')
+            if self.__file.read(len(header)) != header:
+                raise ValueError(f'The metrics file {self.fname} has different columns!')
+            size = self.__file.seek(0, 2)
+            self.__rows = (size - len(header)) // (8 * len(self.__columns))
+            self.__file.truncate(len(header) + self.__rows * 8 * len(self.__columns))  # discard partial rows
+        else:
+            self.__file = open(self.fname, 'wb')
+            self.__file.write(header)
+
+    def write(self, row):
+        self.__batch[self.__batch_rows] = row
+        self.__batch_rows += 1
+        self.__rows += 1
+        if self.__batch_rows == self.__batch_size:
+            self.__submit_batch()
+
+    # write the buffered rows (and wait for them to be written, if writing in background)
+    def flush(self):
+        if self.__file is None:
+            return
+        self.__submit_batch()
+        if self.__queue is not None:
+            self.__queue.join()
+        if self.__error is not None:
+            raise self.__error
+        self.__file.flush()
+
+    def close(self):
+        if self.__file is None:
+            return
+        self.flush()
+        if self.__thread is not None:
+            self.__queue.put(None)
+            self.__thread.join()
+        self.__file.close()
+        self.__file = None
+
+    def get_position(self):
+        return self.__rows
+
+    def truncate(self, position):
+        self.flush()
+        self.__rows = position
+        self.__file.truncate(self.__header_size + position * 8 * len(self.__columns))
+        self.__file.seek(0, 2)
+
+    def __submit_batch(self):
+        if self.__batch_rows == 0:
+            return
+        batch = self.__batch[:self.__batch_rows].astype('<f8').tobytes()
+        self.__batch_rows = 0
+        if self.__queue is None:
+            self.__file.write(batch)
+        else:
+            self.__queue.put(batch)
+
+    def __write_batches(self):
+        while True:
+            batch = self.__queue.get()
+            try:
+                if batch is None:
+                    return
+                if self.__error is None:
+                    self.__file.write(batch)
+            except Exception as e:
+                self.__error = e
+            finally:
+                self.__queue.task_done()
+
+
+# read a binary metrics file, returning the columns' names, the integer columns and the rows (as a 2D array)
+def read_metrics(fname: str):
+    with open(fname, 'rb') as f:
+        if f.read(len(METRICS_MAGIC)) != METRICS_MAGIC:
+            raise ValueError(f'{fname} is not a metrics file!')
+        header = json.loads(f.read(struct.unpack('<I', f.read(4))[0]))
+        data = np.frombuffer(f.read(), dtype='<f8')
+    columns = header['columns']
+    n_rows = len(data) // len(columns)
+    return columns, header['int_columns'], data[:n_rows * len(columns)].reshape(n_rows, len(columns))
+
+
+# convert a binary metrics file to the text format (i.e., as written by TextMetricsSink) and write it to out
+# (a file object) or return it (if out is None)
+def convert_metrics_to_text(fname: str, out=None):
+    columns, int_columns, rows = read_metrics(fname)
+    is_int = [c in int_columns for c in columns]
+
+    lines = ['\t'.join(map(str, columns))]
+    for row in rows.tolist():
+        lines.append('\t'.join(str(int(v)) if i else str(v) for v, i in zip(row, is_int)))
+    text = '\n'.join(lines) + '\n'
+
+    if out is None:
+        return text
+    out.write(text)
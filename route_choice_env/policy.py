@@ -12,6 +12,12 @@ class Random(Policy):
     def act(self, d: Agent):
         return int(np.random.random() * len(d.get_strategy()))  # slower than random.random, but less biased
 
+    # (without rng, it draws the same random numbers as calling act for each agent, in order)
+    def act_batch(self, q_matrix: np.ndarray, rng: np.random.Generator = None) -> np.ndarray:
+        n_actions = np.isfinite(q_matrix).sum(axis=1)
+        draws = np.random.random(len(q_matrix)) if rng is None else rng.random(len(q_matrix))
+        return (draws * n_actions).astype(int)
+
     def update(self):
         pass
 
@@ -38,8 +44,97 @@ class EpsilonGreedy(Policy):
         else:
             return max(d.get_strategy(), key=d.get_strategy().get)
 
+    # (without rng, it draws the same random numbers as calling act for each agent, in order;
+    # otherwise, two random numbers per agent are drawn from rng in a single call)
+    def act_batch(self, q_matrix: np.ndarray, rng: np.random.Generator = None) -> np.ndarray:
+        n_agents = len(q_matrix)
+        n_actions = np.isfinite(q_matrix).sum(axis=1)
+
+        if rng is not None:
+            draws = rng.random((n_agents, 2))
+            explore = draws[:, 0] < self.__epsilon
+            actions = np.argmax(q_matrix, axis=1)
+            actions[explore] = (draws[explore, 1] * n_actions[explore]).astype(int)
+            return actions
+
+        # each agent consumes one random number (to decide whether to explore) or two (if it explores, the second
+        # one chooses the action); as such, the numbers of all agents are drawn at once (at most two per agent)
+        # and then the (global) random state is advanced only by the amount actually consumed
+        state = np.random.get_state()
+        draws = np.random.random(2 * n_agents + 1)
+        explore = draws < self.__epsilon
+
+        # the position (in draws) of the first number of each agent, i.e., the n-th position reached by
+        # following (the position of the next agent's first number) from 0, computed by pointer doubling over the bits of n
+        following = np.minimum(np.arange(len(draws)) + 1 + explore, len(draws) - 1)
+        position = np.zeros(n_agents, dtype=int)
+        agents = np.arange(n_agents)
+        bit = 0
+        while (1 << bit) < n_agents:
+            jump = (agents >> bit) & 1 == 1
+            position[jump] = following[position[jump]]
+            following = following[following]
+            bit += 1
+
+        explore = explore[position]
+        actions = np.argmax(q_matrix, axis=1)
+        actions[explore] = (draws[position[explore] + 1] * n_actions[explore]).astype(int)
+
+        np.random.set_state(state)
+        if n_agents > 0:
+            np.random.random(position[-1] + 1 + explore[-1])
+        return actions
+
     def update(self, epsilon_decay: float = 0.99):
         if self.__epsilon > self.__min_epsilon:
             self.__epsilon = self.__epsilon * epsilon_decay
         else:
             self.__epsilon = self.__min_epsilon
+
+
+class Boltzmann(Policy):
+    """
+        Boltzmann (softmax) policy class.
+
+        Act method receives a Driver Agent and selects an action from its strategy (which is generally the q-table)
+        with probability proportional to exp(Q/temperature).
+    """
+
+    def __init__(self, temperature: float, min_temperature: float = 0.0):
+        super(Boltzmann, self).__init__()
+
+        self.__temperature = temperature
+        self.__min_temperature = min_temperature
+
+    def act(self, d: Agent):
+        return int(self.__choose(np.array([list(d.get_strategy().values())]), np.array([np.random.random()]))[0])
+
+    # (without rng, it draws the same random numbers as calling act for each agent, in order)
+    def act_batch(self, q_matrix: np.ndarray, rng: np.random.Generator = None) -> np.ndarray:
+        draws = np.random.random(len(q_matrix)) if rng is None else rng.random(len(q_matrix))
+        return self.__choose(q_matrix, draws)
+
+    # choose an action per row of q_matrix (invalid actions are -inf) by inverse transform sampling, given a
+    # random number per row
+    def __choose(self, q_matrix: np.ndarray, draws: np.ndarray) -> np.ndarray:
+        n_actions = np.isfinite(q_matrix).sum(axis=1)
+        if len(q_matrix) == 0:
+            return np.zeros(0, dtype=int)
+
+        # the (cumulative) weights of the actions, shifted by the highest Q-value for numerical stability
+        # (a temperature of zero yields the greedy policy)
+        q_max = np.max(q_matrix, axis=1, keepdims=True)
+        if self.__temperature > 0.0:
+            weights = np.exp((q_matrix - q_max) / self.__temperature)
+        else:
+            weights = (q_matrix == q_max).astype(float)
+        cumulative = np.cumsum(weights, axis=1)
+
+        actions = np.sum(cumulative <= draws[:, None] * cumulative[:, -1:], axis=1)
+        return np.minimum(actions, n_actions - 1)
+
+    def update(self, temperature_decay: float = 0.99):
+        if self.__temperature > self.__min_temperature:
+            self.__temperature = self.__temperature * temperature_decay
+        else:
+            self.__temperature = self.__min_temperature
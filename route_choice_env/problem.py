@@ -1,25 +1,54 @@
 import os
+import hashlib
+import zipfile
+import contextlib
+import numpy as np
+from scipy.sparse import csr_matrix
 from py_expression_eval import Parser
-from sympy import diff
+from sympy import diff, nan, zoo
+
+from route_choice_env.cost_functions import LinkCostEngine
+from route_choice_env.route_generation import generate_routes, write_routes_file
+
+
+NETWORKS_DIR = f'{os.path.dirname(os.path.abspath(__file__))}/networks'
+
+# version of the compiled network cache (must be increased whenever its contents change)
+NETWORK_CACHE_VERSION = 1
+
+# number of routes generated for each OD pair of networks without a .routes file
+# (when the number of routes per OD pair is not defined)
+DEFAULT_GENERATED_ROUTES_PER_OD = 8
 
 
 # =======================================================================
 
 class Network:
 
-    def __init__(self, network_name, routes_per_OD=None, alt_route_file_name=None):
+    def __init__(self, network_name, routes_per_OD=None, alt_route_file_name=None, cache=True):
         self.name = network_name
 
         self.__N = {}
         self.__L = {}
         self.__routes = {}
+
+        # links and routes are interned to dense integer indices (their position in the networks' arrays),
+        # which are used internally; the name-based accessors are kept for compatibility
+        self.__links_by_index = []
+        self.__routes_by_index = []
         self.__normalisation_factor_routes = float('-inf')
         self.__expr = None
+        self.__link_costs = LinkCostEngine()
+        self.__last_assignment = None
+        self.__free_flow_graph = None
         self.render_order = []
 
-        self.__create_graph(network_name)
+        # read the network (or load it from the compiled cache, if cache is True)
+        spec = read_network_spec(network_name, routes_per_OD, alt_route_file_name, cache)
+
+        self.__create_graph(spec)
 
-        self.__create_routes(network_name, routes_per_OD, alt_route_file_name)
+        self.__create_routes(spec, network_name)
 
         # reset the graph
         # this is necessary because, in order to compute the routes'
@@ -30,9 +59,8 @@ class Network:
         # (it cannot be performed earlier because the graph
         # must be empty; but it was not, since the links are
         # created with maximum flow)
-        for od in self.get_OD_pairs():
-            for r in self.get_routes(od):
-                r.set_free_flow_travel_time(r.get_cost(False), r.get_cost(True))
+        for r in self.__routes_by_index:
+            r.set_free_flow_travel_time(r.get_cost(False), r.get_cost(True))
 
     def get_expr(self):
         return self.__expr
@@ -48,9 +76,14 @@ class Network:
 
     def get_route_set_size(self, od=None):
         if od:
-            return len(self.get_routes(od))
+            od_order = self.__OD_matrix.get_OD_order(od)
         else:
-            return len(self.__routes[self.get_OD_pairs()[0]])
+            od_order = 0
+        return int(self.__routes_offset[od_order + 1] - self.__routes_offset[od_order])
+
+    # the number of routes of each OD pair (following the OD pairs' order)
+    def get_route_set_sizes(self):
+        return np.diff(self.__routes_offset)
 
     def get_OD_order(self, od):
         return self.__OD_matrix.get_OD_order(od)
@@ -65,6 +98,10 @@ class Network:
     def get_OD_flow(self, od):
         return self.__OD_matrix.get_flow(od)
 
+    # the flow of each OD pair (following the OD pairs' order)
+    def get_OD_flows(self):
+        return self.__OD_matrix.get_flows()
+
     def get_links(self):
         return self.__L.keys()
 
@@ -72,7 +109,7 @@ class Network:
         return self.__OD_matrix.get_OD_pairs()
 
     def get_routes_ids(self, od_pair):
-        return range(len(self.get_routes(od_pair)))
+        return range(self.get_route_set_size(od_pair))
 
     def get_routes(self, od_pair=None):
         return self.__routes[od_pair]
@@ -83,270 +120,303 @@ class Network:
     def get_link(self, link_name):
         return self.__L[link_name]
 
-    def get_total_flow(self):
-        return self.__OD_matrix.get_total_flow()
-
-    def get_normalisation_factor_routes(self):
-        return self.__normalisation_factor_routes
+    def get_link_by_index(self, index):
+        return self.__links_by_index[index]
 
-    # read the graph from a file
-    def __create_graph(self, network_name):
+    # the index of a link in the links' arrays
+    def get_link_index(self, link_name):
+        return self.__L[link_name].get_index()
 
-        OD_entries = []
-        for line in open(f'{os.path.dirname(os.path.abspath(__file__))}/networks/%s.net' % network_name, 'r'):
+    def get_route_by_index(self, index):
+        return self.__routes_by_index[index]
 
-            # ignore \n
-            line = line.rstrip()
+    # the index of a route in the routes' arrays
+    def get_route_index(self, od_pair, index):
+        return int(self.__routes_offset[self.__OD_matrix.get_OD_order(od_pair)]) + index
 
-            # ignore comments
-            hash_pos = line.find('#')
-            if hash_pos > -1:
-                line = line[:hash_pos]
+    def get_number_of_routes(self):
+        return self.__routes_links.shape[0]
 
-            # split the line
-            taglist = line.split()
-            if len(taglist) == 0:
-                continue
+    # the route x link incidence matrix (as a sparse CSR matrix)
+    def get_routes_links(self):
+        return self.__routes_links
 
-            if taglist[0] == 'od':
+    # the OD pair (order) of each route
+    def get_routes_od(self):
+        return self.__routes_od
 
-                # if no flow is set for the OD pair, then
-                # it is not created (just to avoid problems
-                # when computing OD-related statistics)
-                if float(taglist[4]) > 0:
-                    OD_entries.append(taglist)
-
-                    # the set of routes is initialised (with the keys) here,
-                    # but populated only in __create_routes
-                    self.__routes[taglist[1]] = []
-
-        # create the OD matrix
-        self.__OD_matrix = ODMatrix(OD_entries)
-        total_flow = self.__OD_matrix.get_total_flow()
-
-        F = {}  # cost functions
-        normalisation_factor = float('-inf')
-        lineid = 0
-        for line in open(f'{os.path.dirname(os.path.abspath(__file__))}/networks/%s.net' % network_name, 'r'):
-
-            lineid += 1
-
-            # ignore \n
-            line = line.rstrip()
-
-            # ignore comments
-            hash_pos = line.find('#')
-            if hash_pos > -1:
-                line = line[:hash_pos]
-
-            # split the line
-            taglist = line.split()
-            if len(taglist) == 0:
-                continue
-
-            if taglist[0] == 'function':
-
-                # process the params
-                params = taglist[2][1:-1].split(',')
-                if len(params) > 1:
-                    raise Exception(
-                        'Cost functions with more than one parameter are not yet acceptable! (parameters defined: %s)' % str(
-                            params)[1:-1])
+    # the index of the first route of each OD pair (followed by the number of routes)
+    def get_routes_offset(self):
+        return self.__routes_offset
 
-                # process the function
-                expr = taglist[3]
-                self.__expr = expr
-                function = Parser().parse(expr)
-
-                # compute the derivative of the function (for tolling)
-                expr_deriv = str(diff(expr, params[0]))  # compute derivative
-                expr_deriv = expr_deriv.replace('**', '^').replace(' ', '')  # convert syntax (from sympy to py_expression_eval)
-                function_deriv = Parser().parse(expr_deriv)  # create the function
-
-                # handle the case where the parameter is not in the formula
-                # (this needs to be handled because py-expression-eval does
-                # not allows simplifying all variables of an expression)
-                if taglist[1] not in function.variables():
-                    expr = '%s+%s-%s' % (expr, params[0], params[0])
-                    function = Parser().parse(expr)
-                    expr_deriv = '%s+%s-%s' % (expr_deriv, params[0], params[0])
-                    function_deriv = Parser().parse(expr_deriv)
-
-                # process the constants
-                constants = function.variables()
-                if params[0] in constants:  # the parameter must be ignored
-                    constants.remove(params[0])
+    def get_total_flow(self):
+        return self.__OD_matrix.get_total_flow()
 
-                # store the function
-                F[taglist[1]] = [params[0], constants, expr, expr_deriv, None]
+    def get_link_costs(self):
+        return self.__link_costs
 
-            elif taglist[0] == 'node':
-                self.__N[taglist[1]] = Node(taglist[1])
+    # the links' flows, costs and marginal costs (as arrays indexed by the links' indices)
+    def get_links_flow(self):
+        return self.__link_flow
 
-            elif taglist[0] == 'dedge' or taglist[0] == 'edge':  # dedge is a directed edge
+    def get_links_cost(self, normalise=False):
+        if normalise:
+            return self.__link_normalised_cost
+        return self.__link_cost
 
-                # process the function
-                func_tuple = F[taglist[4]]  # get the corresponding function
-                param_values = dict(zip(func_tuple[1], map(float, taglist[5:])))  # associate constants and values specified in the line (in order of occurrence)
-                function = Parser().parse(func_tuple[2])  # create the function
-                function = function.simplify(param_values)  # replace constants
-
-                # compute the function's first derivative w.r.t. the parameter
-                function_deriv = Parser().parse(func_tuple[3])
-                function_deriv = function_deriv.simplify(param_values)
-                # check for zero division error, which shall happen when the parameter is a divisor
-                # (e.g., the BPR function)
-                # Note: this is just a warning, since in this case we just need to assume the marginal cost to be zero
-                # (as done later, at link's marginal cost evaluation)
-                try:
-                    function_deriv.evaluate({func_tuple[0]: 0.0})
-                except ZeroDivisionError:
-                    if func_tuple[4] is None:
-                        # store a single warning message to avoid printing multiple ones
-                        func_tuple[
-                            4] = '[WARNING] The derivative (%s) of function %s (%s) has a parameter as divisor!' % (
-                        func_tuple[3], taglist[4], func_tuple[2])
-
-                # create the edge(s)
-                link_name = taglist[1]
-                self.__L[link_name] = Link(link_name, taglist[2], taglist[3], function, function_deriv, func_tuple[0])
-                if taglist[0] == 'edge':
-                    link_name = '%s-%s' % (taglist[3], taglist[2])
-                    self.__L[link_name] = Link(link_name, taglist[3], taglist[2], function, function_deriv, func_tuple[0])
+    def get_links_marginal_cost(self, normalise=False):
+        if normalise:
+            return self.__link_normalised_marginal_cost
+        return self.__link_marginal_cost
 
-                # store the greatest free flow time (used to normalise the links' costs)
-                v = function.evaluate({func_tuple[0]: total_flow})
-                if v > normalisation_factor:
-                    normalisation_factor = v
+    def get_normalisation_factor_links(self):
+        return self.__link_normalisation_factor
 
-            elif taglist[0] == 'od':
-                continue
+    # the routes' costs and weighted marginal costs (as arrays following the routes' order)
+    def get_routes_cost(self, normalise=False):
+        if normalise:
+            return self.__route_normalised_cost
+        return self.__route_cost
 
-            elif taglist[0] == 'order':
-                self.render_order.append(taglist[1])
+    def get_routes_weighted_marginal_cost(self, normalise=False):
+        if normalise:
+            return self.__route_normalised_weighted_marginal_cost
+        return self.__route_weighted_marginal_cost
 
-            else:
-                raise Exception('Network file does not comply with the specification! (line %d: "%s")' % (lineid, line))
+    def get_normalisation_factor_routes(self):
+        return self.__normalisation_factor_routes
 
-        # print function warnings
-        for func in F:
-            if F[func][4]:
-                print(F[func][4])
+    # create the graph (nodes, links and OD matrix) from the network specification
+    def __create_graph(self, spec):
 
-        # define the links' normalisation factor
-        for l in self.__L.values():
-            l.set_normalisation_factor(normalisation_factor)
+        # the set of routes is initialised (with the keys) here,
+        # but populated only in __create_routes
+        for od in spec['od_names']:
+            self.__routes[str(od)] = []
 
-            # set all links with maximum flow (used to calculate the
-            # normalisation factor, in function __create_routes)
-            l.add_flow(self.get_total_flow())
+        # create the OD matrix
+        self.__OD_matrix = ODMatrix([
+            ['od', str(od), str(o), str(d), flow]
+            for od, o, d, flow in zip(spec['od_names'], spec['od_origins'], spec['od_destinations'], spec['od_flows'])
+        ])
+        total_flow = self.__OD_matrix.get_total_flow()
 
-    # read the set of routes from a file
-    def __create_routes(self, network_name, routes_per_OD=None, alt_route_file_name=None):
+        for name, param, expr, constants in zip(spec['function_names'], spec['function_params'], spec['function_exprs'], spec['function_constants']):
+            name, param, expr = str(name), str(param), str(expr)
+            constants = [c for c in str(constants).split(',') if c]
+            self.__expr = expr
+
+            # compute the derivative of the function (for tolling) and check for zero division error,
+            # which shall happen when the parameter is a divisor (e.g., the BPR function)
+            # Note: this is just a warning, since in this case we just need to assume the marginal cost to be zero
+            # (as done by the cost functions, at links' marginal cost evaluation)
+            expr_deriv = diff(expr, param)
+            if expr_deriv.subs(param, 0).has(nan, zoo):
+                print('[WARNING] The derivative (%s) of function %s (%s) has a parameter as divisor!' % (
+                    str(expr_deriv).replace('**', '^').replace(' ', ''), name, expr))
+
+            # store the function
+            self.__link_costs.add_function(name, param, constants, expr)
+
+        for node in spec['nodes']:
+            self.__N[str(node)] = Node(str(node))
+        self.render_order = [str(node) for node in spec['render_order']]
+
+        # create the links (in the order of the specification, which defines their indices)
+        for name, origin, destination, function, values in zip(spec['link_names'], spec['link_origins'], spec['link_destinations'], spec['link_functions'], spec['link_values']):
+            index = self.__link_costs.add_link(str(function), values[~np.isnan(values)])
+            self.__L[str(name)] = Link(str(name), str(origin), str(destination), index, self)
+            self.__links_by_index.append(self.__L[str(name)])
+
+        # create the links' non-static variables (those that may change during simulations, like flow and cost)
+        self.__link_costs.compile()
+        n_links = self.__link_costs.get_number_of_links()
+        self.__link_flow = np.zeros(n_links)
+        self.__link_cost = np.zeros(n_links)
+        self.__link_marginal_cost = np.zeros(n_links)
+        # store the sum of time flexibility of all drivers using each link
+        # (required for computing marginal cost tolls)
 
-        if alt_route_file_name is not None:
-            fname = f'{os.path.dirname(os.path.abspath(__file__))}/networks/{alt_route_file_name}'
+        # EXPLANATION: following the MCT definition, the toll on a link is
+        # 		flow * vdf_derivative
+        # a.k.a. the marginal cost; my generalised version includes a time
+        # flexibility parameter (\eta_i for driver i), which rewrites tolls as
+        # 		((1-\eta_1) * vdf_deriv) + ((1-\eta_2) * vdf_deriv) + ...
+        # for all drivers 1, 2, ... using that link, which is equivalent
+        # to the original definition if \eta=1 for all drivers; to simplify
+        # the process, we can compute this generalised toll value as
+        # 		((1-\eta_1) + (1-\eta_2) + ...) * vdf_derivative
+        # hence, this array is used to store that sum of time flexibility
+        # (for each link), which reduces the complexity of computing the
+        # toll values
+        self.__link_time_flexibility = np.zeros(n_links)
+
+        # define the links' normalisation factor (the greatest cost with maximum flow)
+        self.__link_normalisation_factor = float(np.max(self.__link_costs.evaluate(np.full(n_links, total_flow))))
+
+        # set all links with maximum flow (used to calculate the
+        # normalisation factor, in function __create_routes)
+        self.__link_flow[:] = total_flow
+        self.__update_links_costs()
+
+    # create the routes from the network specification
+    def __create_routes(self, spec, network_name):
+
+        # the routes follow the order of the OD pairs, so that
+        # the routes of each OD pair are contiguous in the routes' arrays
+        self.__routes_offset = spec['routes_offset'].astype(int)
+
+        # the OD pair (order) of each route
+        self.__routes_od = np.repeat(np.arange(len(self.get_OD_pairs())), np.diff(self.__routes_offset))
+
+        # the route x link incidence matrix (the links' indices are kept in
+        # their order in the route, which is the order their costs are summed)
+        n_routes = len(spec['route_strs'])
+        indices = spec['routes_links_indices'].astype(int, copy=False)
+        indptr = spec['routes_links_indptr'].astype(int, copy=False)
+        self.__routes_links = csr_matrix((np.ones(len(indices)), indices, indptr),
+                                         shape=(n_routes, self.__link_costs.get_number_of_links()))
+
+        # create the routes (each one storing the indices of its links)
+        route_strs = spec['route_strs'].tolist()
+        for i_od, od in enumerate(self.get_OD_pairs()):
+            for index in range(self.__routes_offset[i_od], self.__routes_offset[i_od + 1]):
+                route = Route(route_strs[index], index, indices[indptr[index]:indptr[index + 1]], self)
+                self.__routes[od].append(route)
+                self.__routes_by_index.append(route)
+
+        # the reverse (link -> routes) index, i.e., the routes using each link
+        self.__links_routes = self.__routes_links.tocsc()
+
+        # the routes' costs are computed with all links with maximum flow
+        # (as set in __create_graph) to obtain the routes' normalisation factor
+        self.__normalisation_factor_routes = 1.0
+        self.__update_routes_costs()
+        self.__normalisation_factor_routes = float(np.max(self.__route_cost))
+
+        # TODO find a better way of defining this value (OW 0.45, SF 0.05)
+        # I believe this is a topology-demand-based question.
+        if network_name == 'SF':
+            self.__normalisation_factor_routes *= 0.05
+        elif network_name == 'Berlin-Friedrichshain':
+            self.__normalisation_factor_routes *= 0.1
+
+    # update the links' costs given their current flow (and aggregated time flexibility) with a single
+    # evaluation of the cost functions; links without flow keep the marginal cost of an empty link
+    # (if links is given, only the costs of such links are updated)
+    def __update_links_costs(self, links=None):
+        selection = slice(None) if links is None else links
+        flow = self.__link_flow[selection]
+        cost = self.__link_costs.evaluate(flow, links)
+        marginal_cost = self.__link_costs.evaluate_deriv(flow, links)
+        marginal_cost = np.where(flow > 0.0, self.__link_time_flexibility[selection] * marginal_cost, marginal_cost)
+
+        if links is None:
+            self.__link_cost = cost
+            self.__link_marginal_cost = marginal_cost
+            self.__link_normalised_cost = cost / self.__link_normalisation_factor
+            self.__link_normalised_marginal_cost = marginal_cost / self.__link_normalisation_factor
         else:
-            fname = f'{os.path.dirname(os.path.abspath(__file__))}/networks/{network_name}.routes'
-
-        with open(fname, 'r') as f:
-            self.__normalisation_factor_routes = float('-inf')
-
-            for line in f:
-
-                # ignore \n
-                line = line.rstrip()
-
-                # ignore comments
-                hash_pos = line.find('#')
-                if hash_pos > -1:
-                    line = line[:hash_pos]
-
-                # split the line
-                spl = line.split()
-                if len(spl) == 0:
-                    continue
-
-                od = spl[0]
-
-                # if the OD pair is not in the dictionary, it
-                # means that it is invalid (e.g. zero flow)
-                if od not in self.__routes:
-                    continue  # self.__routes[od] = []
-
-                # add the route to the list (up to routes_per_OD routes
-                # are stored for each OD pair)
-                if not routes_per_OD or routes_per_OD <= 0 or len(self.__routes[od]) < routes_per_OD:
-                    route = Route(spl[1], self)
-                    self.__routes[od].append(route)
-
-                    if route.get_cost(False) > self.__normalisation_factor_routes:
-                        self.__normalisation_factor_routes = route.get_cost(False)
-
-            # TODO find a better way of defining this value (OW 0.45, SF 0.05)
-            # I believe this is a topology-demand-based question.
-            if network_name == 'SF':
-                self.__normalisation_factor_routes *= 0.05
-            elif network_name == 'Berlin-Friedrichshain':
-                self.__normalisation_factor_routes *= 0.1
-
-            # set the normalisation factor on the routes
-            for od in self.get_OD_pairs():
-                for r in self.get_routes(od):
-                    r.set_normalisation_factor(self.__normalisation_factor_routes)
-
-            f.close()
+            self.__link_cost[links] = cost
+            self.__link_marginal_cost[links] = marginal_cost
+            self.__link_normalised_cost[links] = cost / self.__link_normalisation_factor
+            self.__link_normalised_marginal_cost[links] = marginal_cost / self.__link_normalisation_factor
+
+    # update the routes' costs (i.e., the sum of their links' costs)
+    # (if routes is given, only the costs of such routes are updated)
+    def __update_routes_costs(self, routes=None):
+        routes_links = self.__routes_links if routes is None else self.__routes_links[routes]
+        cost = routes_links @ self.__link_cost
+        weighted_marginal_cost = routes_links @ self.__link_normalised_marginal_cost
+
+        if routes is None:
+            self.__route_cost = cost
+            self.__route_weighted_marginal_cost = weighted_marginal_cost
+            self.__route_normalised_cost = cost / self.__normalisation_factor_routes
+            self.__route_normalised_weighted_marginal_cost = weighted_marginal_cost / self.__normalisation_factor_routes
+        else:
+            self.__route_cost[routes] = cost
+            self.__route_weighted_marginal_cost[routes] = weighted_marginal_cost
+            self.__route_normalised_cost[routes] = cost / self.__normalisation_factor_routes
+            self.__route_normalised_weighted_marginal_cost[routes] = weighted_marginal_cost / self.__normalisation_factor_routes
+
+    # the graph non-fixed attributes, i.e., the links' flows and costs and the routes' costs
+    def __get_graph_arrays(self):
+        return [
+            self.__link_flow, self.__link_time_flexibility, self.__link_cost, self.__link_marginal_cost,
+            self.__link_normalised_cost, self.__link_normalised_marginal_cost,
+            self.__route_cost, self.__route_weighted_marginal_cost,
+            self.__route_normalised_cost, self.__route_normalised_weighted_marginal_cost
+        ]
+
+    def __set_graph_arrays(self, arrays):
+        [
+            self.__link_flow, self.__link_time_flexibility, self.__link_cost, self.__link_marginal_cost,
+            self.__link_normalised_cost, self.__link_normalised_marginal_cost,
+            self.__route_cost, self.__route_weighted_marginal_cost,
+            self.__route_normalised_cost, self.__route_normalised_weighted_marginal_cost
+        ] = arrays
 
     # reset the graph non-fixed attributes (e.g., flow on each link)
+    # (the last evaluated assignment is kept for incremental evaluations)
     def reset_graph(self):
+        # the graph with no flow is evaluated once (after the normalisation factors are
+        # defined, see __init__) and then copied on every reset
+        if self.__free_flow_graph is not None:
+            self.__set_graph_arrays([x.copy() for x in self.__free_flow_graph])
+            return
+
         # reset the flow and costs on links
-        for l in self.__L:
-            self.__L[l].reset()
+        self.__link_flow = np.zeros(self.__link_costs.get_number_of_links())
+        self.__link_time_flexibility = np.zeros(self.__link_costs.get_number_of_links())
+        self.__update_links_costs()
 
         # reset the costs on routes
-        for od in self.get_OD_pairs():
-            for r in self.get_routes(od):
-                r.update_cost()
+        self.__update_routes_costs()
+
+        self.__free_flow_graph = [x.copy() for x in self.__get_graph_arrays()]
 
     # evaluate the cost of a given assignment, where
     # - solution is the assignment itself (i.e., flow of each OD-route pair)
     # - solution_time_flexibility contains the aggregate time flexibility of agents (useful for tolling)
     # - check_consistency checks if the assignment is valid w.r.t. the total flow of the problem instance
-    def evaluate_assignment(self, solution, solution_time_flexibility, check_consistency=True):
+    # - incremental evaluates only the differences w.r.t. the last evaluated assignment (i.e., only the links
+    #   of the routes whose flow changed and the routes using such links are updated), which is faster
+    #   when few routes change and yields the same results of the full evaluation
+    def evaluate_assignment(self, solution, solution_time_flexibility, check_consistency=True, incremental=False):
+        # the flow (and aggregated time flexibility) of each route, following the routes' order
+        route_flow = self.__flatten_solution(solution)
+        route_time_flexibility = self.__flatten_solution(solution_time_flexibility)
+
         # check if the solution is valid
+        # (the flow is summed per OD pair, in the same order of the nested solution)
         if check_consistency:
-            if sum([sum(x) for x in solution]) != self.get_total_flow():
-                print(f'[WARNING] The solution is not valid! (current flow {sum([sum(x) for x in solution])} differs from the expected one {self.get_total_flow()})')
+            flow = sum([sum(route_flow[self.__routes_offset[i]:self.__routes_offset[i + 1]].tolist()) for i in range(len(self.get_OD_pairs()))])
+            if flow != self.get_total_flow():
+                print(f'[WARNING] The solution is not valid! (current flow {flow} differs from the expected one {self.get_total_flow()})')
 
-        self.reset_graph()
+        if incremental and self.__last_assignment is not None:
+            self.__evaluate_assignment_changes(route_flow, route_time_flexibility)
+        else:
+            # update the flow (and aggregated time flexibility) on each link and then its costs
+            self.__link_flow = self.__routes_links.T @ route_flow
+            self.__link_time_flexibility = self.__routes_links.T @ route_time_flexibility
+            self.__update_links_costs()
+
+            # update the routes' costs
+            self.__update_routes_costs()
+
+        self.__last_assignment = [route_flow, route_time_flexibility] + self.__get_graph_arrays()
 
-        # update the flow (and aggregated time flexibility) on each link
-        for i_od in range(len(solution)):
-            for i_od_route in range(len(solution[i_od])):
-                flow = solution[i_od][i_od_route]
-                time_flexibility = solution_time_flexibility[i_od][i_od_route]
-                if flow > 0.0:
-                    route = self.__routes[self.__OD_matrix.get_order_OD(i_od)][i_od_route]
-                    for link in route.get_links():
-
-                        # time_flexibility needs to be added before flow
-                        self.__L[link].add_time_flexibility(time_flexibility)
-                        self.__L[link].add_flow(flow)
-
-        # update the routes' costs and compute the (normalised and non-normalised)
-        # total costs (i.e., the sum of travel time of all agents)
-        total_cost = 0.0  # non-normalised
-        normalised_total_cost = 0.0  # normalised
-        for i_od in range(len(solution)):
-            for i_od_route in range(len(solution[i_od])):
-                route = self.__routes[self.__OD_matrix.get_order_OD(i_od)][i_od_route]
-                route.update_cost()
-                total_cost += route.get_cost(False) * solution[i_od][i_od_route]
-                normalised_total_cost += route.get_cost(True) * solution[i_od][i_od_route]
+        # compute the (normalised and non-normalised) total costs (i.e., the sum of travel time of all agents)
+        if np.any(self.__route_normalised_cost > 1):
+            self.get_route_by_index(int(np.argmax(self.__route_normalised_cost > 1))).get_cost(True)  # raises the error
+        total_cost = np.dot(self.__route_cost, route_flow)  # non-normalised
+        normalised_total_cost = np.dot(self.__route_normalised_cost, route_flow)  # normalised
 
         # compute the (normalised and non-normalised) average travel times
-        avg_cost = total_cost / self.get_total_flow()
-        normalised_avg_cost = normalised_total_cost / self.get_total_flow()
+        avg_cost = float(total_cost / self.get_total_flow())
+        normalised_avg_cost = float(normalised_total_cost / self.get_total_flow())
 
         # alternative way of calculating the average costs (according to Roughgarden's book, pg. 19)
         # ~ att = 0.0
@@ -356,6 +426,59 @@ class Network:
 
         return avg_cost, normalised_avg_cost
 
+    # evaluate the costs of many assignments at once, where
+    # - solutions is a (number of assignments x number of routes) array, each row
+    #   being an assignment (i.e., the flow of each route, following the routes' order)
+    # as opposed to evaluate_assignment, the graph is not changed by this method; it returns
+    # the (non-normalised and normalised) average costs of each assignment and the cost of
+    # each route in each assignment (as a (number of assignments x number of routes) array)
+    # Note: the normalised costs are not checked against the normalisation factor (i.e., no
+    # exception is raised for costs greater than it), so that a single assignment does not
+    # invalidate the whole batch
+    def evaluate_assignments(self, solutions):
+        route_flow = np.atleast_2d(np.asarray(solutions, dtype=float))
+
+        # the links' flows and costs of each assignment (one assignment per row)
+        link_flow = (self.__routes_links.T @ route_flow.T).T
+        link_cost = self.__link_costs.evaluate(link_flow)
+
+        # the routes' costs of each assignment (one assignment per row)
+        route_cost = (self.__routes_links @ link_cost.T).T
+
+        total_cost = np.sum(route_cost * route_flow, axis=1)
+        avg_cost = total_cost / self.get_total_flow()
+        normalised_avg_cost = avg_cost / self.__normalisation_factor_routes
+
+        return avg_cost, normalised_avg_cost, route_cost
+
+    # update the graph from the last evaluated assignment, considering only the routes whose flow
+    # (or time flexibility) changed, the links of such routes and the routes using those links
+    def __evaluate_assignment_changes(self, route_flow, route_time_flexibility):
+        last_route_flow, last_route_time_flexibility = self.__last_assignment[:2]
+        self.__set_graph_arrays([x.copy() for x in self.__last_assignment[2:]])
+
+        changed_routes = np.flatnonzero((route_flow != last_route_flow) | (route_time_flexibility != last_route_time_flexibility))
+        if len(changed_routes) == 0:
+            return
+
+        # the links of the changed routes (whose flow is recomputed
+        # from scratch, exactly as in the full evaluation)
+        links = np.unique(self.__routes_links[changed_routes].indices)
+        links_routes = self.__links_routes[:, links].T
+        self.__link_flow[links] = links_routes @ route_flow
+        self.__link_time_flexibility[links] = links_routes @ route_time_flexibility
+        self.__update_links_costs(links)
+
+        # the routes using such links
+        self.__update_routes_costs(np.unique(links_routes.indices))
+
+    # convert a solution (i.e., a list with the flow of each route of each OD pair) into
+    # an array following the routes' order
+    def __flatten_solution(self, solution):
+        if isinstance(solution, np.ndarray) and solution.ndim == 1:
+            return solution.astype(float)
+        return np.array([x for S_od in solution for x in S_od], dtype=float)
+
 
 # =======================================================================
 
@@ -372,49 +495,21 @@ class Node:
 # =======================================================================
 
 # represents a link in the graph
+# (its flow and costs are stored by the problem instance, in arrays indexed by the link's index)
 class Link:
-    def __init__(self, name, origin, destination, cost_function, cost_function_deriv, param_name):
+    def __init__(self, name, origin, destination, index, problem_instance):
         self.__name = name
         self.__origin = origin
         self.__destination = destination
 
-        self.__cost_function = cost_function
-        self.__cost_function_deriv = cost_function_deriv
-        self.__param_name = param_name
-
-        # store the sum of time flexibility of all drivers using the present link
-        # (required for computing marginal cost tolls)
-
-        # EXPLANATION: following the MCT definition, the toll on a link is
-        # 		flow * vdf_derivative
-        # a.k.a. the marginal cost; my generalised version includes a time
-        # flexibility parameter (\eta_i for driver i), which rewrites tolls as
-        # 		((1-\eta_1) * vdf_deriv) + ((1-\eta_2) * vdf_deriv) + ...
-        # for all drivers 1, 2, ... using that link, which is equivalent
-        # to the original definition if \eta=1 for all drivers; to simplify
-        # the process, we can compute this generalised toll value as
-        # 		((1-\eta_1) + (1-\eta_2) + ...) * vdf_derivative
-        # hence, this variable is used to store that sum of time flexibility,
-        # which reduces the complexity of computing the toll values
-        self.__sum_time_flexibility = 0.0
-
-        # used to compute the normalised cost
-        self.__normalisation_factor = None
-
-        # create/reset non-static variables (those that may change during simulations, like flow and cost)
-        self.reset()
+        # the link's position in the arrays of the problem instance
+        self.__index = index
 
-    def __get_cost(self, value):
-        return self.__cost_function.evaluate({self.__param_name: value})
+        # store the problem instance for retrieving the link's flow and costs
+        self.__problem_instance = problem_instance
 
-    def __get_cost_deriv(self, value):
-        try:
-            return self.__cost_function_deriv.evaluate({self.__param_name: value})
-        except ZeroDivisionError:
-            if value == 0.0:
-                return 0.0
-            else:
-                raise Exception('Error on evaluating marginal cost of link %s with flow %f!' % (self.__name, value))
+    def get_index(self):
+        return self.__index
 
     def get_origin(self):
         return self.__origin
@@ -422,57 +517,21 @@ class Link:
     def get_destination(self):
         return self.__destination
 
-    def set_normalisation_factor(self, normalisation_factor):
-        self.__normalisation_factor = normalisation_factor
-        self.reset()
-
-    # reset the flow and costs of the link
-    # during instantiation, it is called by the __init__ method without
-    # the normalisation factor, and thus without creating the normalised
-    # cost; the normalised cost is created only after the
-    # set_normalisation_factor method is called
-    def reset(self):
-        self.__flow = 0.0
-        self.__cost = self.__get_cost(self.__flow)
-        self.__marginal_cost = self.__get_cost_deriv(self.__flow)
-        if self.__normalisation_factor:
-            self.__normalised_cost = self.__cost / self.__normalisation_factor
-            self.__normalised_marginal_cost = self.__marginal_cost / self.__normalisation_factor
-        self.__sum_time_flexibility = 0.0
-
-    def add_time_flexibility(self, time_flexibility):
-        self.__sum_time_flexibility += time_flexibility
-
     def get_marginal_cost(self):
-        if self.__normalisation_factor:
-            return self.__normalised_marginal_cost
-        else:
-            return self.__marginal_cost
-
-    def add_flow(self, amount):
-        self.__flow += amount
-
-        # update the costs
-        self.__cost = self.__get_cost(self.__flow)
-        self.__marginal_cost = self.__sum_time_flexibility * self.__get_cost_deriv(self.__flow)
-        if self.__normalisation_factor:
-            self.__normalised_cost = self.__cost / self.__normalisation_factor
-            self.__normalised_marginal_cost = self.__marginal_cost / self.__normalisation_factor
+        return float(self.__problem_instance.get_links_marginal_cost(True)[self.__index])
 
     def get_flow(self):
-        return self.__flow
+        return float(self.__problem_instance.get_links_flow()[self.__index])
 
     def get_cost(self, normalise=False):
         if normalise:
-            if self.__normalisation_factor:
-                if self.__normalised_cost > 1:
-                    raise Exception('Error on cost normalisation of link %s (cost is %f and normalised cost is %f)!' % (
-                    self, self.__cost, self.__normalised_cost))
-                return self.__normalised_cost
-            else:
-                raise Exception('Cost normalisation is not supported on link %s!' % self)
+            normalised_cost = float(self.__problem_instance.get_links_cost(True)[self.__index])
+            if normalised_cost > 1:
+                raise Exception('Error on cost normalisation of link %s (cost is %f and normalised cost is %f)!' % (
+                self, self.get_cost(), normalised_cost))
+            return normalised_cost
         else:
-            return self.__cost
+            return float(self.__problem_instance.get_links_cost()[self.__index])
 
     def __str__(self):
         return self.__name
@@ -481,44 +540,31 @@ class Link:
 # =======================================================================
 
 # represents a route
+# (its costs are stored by the problem instance, in arrays indexed by the route's index)
 class Route:
-    def __init__(self, route_str, problem_instance):
+    def __init__(self, route_str, index, links_indices, problem_instance):
 
-        self.__links = []
-        self.__name = ''
+        # the route's links (their names are only read from route_str when first needed)
+        self.__route_str = route_str
+        self.__links = None
+        self.__links_indices = links_indices
 
-        self.__cost = 0.0
-        self.__normalised_cost = 0.0
+        # the route name (based on nodes) is only created when first needed
+        self.__name = None
 
-        # store the weighted marginal cost of the route (i.e., the marginal
-        # cost considering the individual preferences/flexibility of agents)
-        self.__weighted_marginal_cost = 0.0
-        self.__normalised_weighted_marginal_cost = 0.0
+        # the route's position in the arrays of the problem instance
+        self.__index = index
 
-        # used to compute the normalised cost
-        self.__normalisation_factor = None
-
-        # store the problem instance for updating the route cost
+        # store the problem instance for retrieving the route cost
         self.__problem_instance = problem_instance
 
-        # read the route from links
-        spl = route_str.split(',')
-        for l in spl:
-            self.__links.append(l)
-            link = self.__problem_instance.get_link(l)
-
-            # create the route name (based on nodes)
-            if self.__name == '':
-                self.__name = link.get_origin()
-            self.__name = '%s-%s' % (self.__name, link.get_destination())
-
-        # update the route cost
-        self.update_cost()
-
         # the free flow travel time
         self.__free_flow_travel_time = 0.0
         self.__free_flow_travel_time_normalised = 0.0
 
+    def get_index(self):
+        return self.__index
+
     def set_free_flow_travel_time(self, fftt, fftt_normalised):
         self.__free_flow_travel_time = fftt
         self.__free_flow_travel_time_normalised = fftt_normalised
@@ -529,53 +575,44 @@ class Route:
         else:
             return self.__free_flow_travel_time
 
-    def set_normalisation_factor(self, normalisation_factor):
-        self.__normalisation_factor = normalisation_factor
-        self.update_cost()
-
-    # update the route cost
-    def update_cost(self):
-        self.__cost = 0.0
-        self.__normalised_cost = 0.0
-
-        self.__weighted_marginal_cost = 0.0
-        self.__normalised_weighted_marginal_cost = 0.0
-
-        for l in self.__links:
-            self.__cost += self.__problem_instance.get_link(l).get_cost()
-            self.__weighted_marginal_cost += self.__problem_instance.get_link(l).get_marginal_cost()
-
-        if self.__normalisation_factor:
-            self.__normalised_cost = self.__cost / self.__normalisation_factor
-            self.__normalised_weighted_marginal_cost = self.__weighted_marginal_cost / self.__normalisation_factor
-
     def get_cost(self, normalise=False):
         if normalise:
-            if self.__normalised_cost > 1:
+            normalised_cost = float(self.__problem_instance.get_routes_cost(True)[self.__index])
+            if normalised_cost > 1:
                 # IMPORTANT: do not comment exception below
                 raise Exception(
                     'Error on cost normalisation of route %s (cost is %f, normalised cost is %f and normalisation factor is %f)!' % (
-                    self, self.__cost, self.__normalised_cost, self.__normalisation_factor))
-            return self.__normalised_cost
+                    self, self.get_cost(), normalised_cost, self.__problem_instance.get_normalisation_factor_routes()))
+            return normalised_cost
         else:
-            return self.__cost
+            return float(self.__problem_instance.get_routes_cost()[self.__index])
 
     def get_weighted_marginal_cost(self, normalise=False):
         if normalise:
-            if self.__normalised_weighted_marginal_cost > 1:
+            normalised_weighted_marginal_cost = float(self.__problem_instance.get_routes_weighted_marginal_cost(True)[self.__index])
+            if normalised_weighted_marginal_cost > 1:
                 # IMPORTANT: do not comment exception below
                 raise Exception(
                     'Error on marginal cost normalisation of route %s (cost is %f, normalised cost is %f and normalisation factor is %f)!' % (
-                    self, self.__weighted_marginal_cost, self.__normalised_weighted_marginal_cost,
-                    self.__normalisation_factor))
-            return self.__normalised_weighted_marginal_cost
+                    self, self.get_weighted_marginal_cost(), normalised_weighted_marginal_cost,
+                    self.__problem_instance.get_normalisation_factor_routes()))
+            return normalised_weighted_marginal_cost
         else:
-            return self.__weighted_marginal_cost
+            return float(self.__problem_instance.get_routes_weighted_marginal_cost()[self.__index])
 
     def get_links(self):
+        if self.__links is None:
+            self.__links = self.__route_str.split(',')
         return self.__links
 
+    # the indices of the route's links (in the links' arrays)
+    def get_links_indices(self):
+        return self.__links_indices
+
     def __str__(self):
+        if self.__name is None:
+            links = [self.__problem_instance.get_link_by_index(l) for l in self.__links_indices]
+            self.__name = '-'.join([links[0].get_origin()] + [l.get_destination() for l in links])
         return self.__name
 
 
@@ -594,12 +631,15 @@ class ODMatrix:
         # keeps the order of the OD pairs (used to ensure the ODs correspondence between different representations)
         self.__OD_order = {}
 
-        # keeps the OD of each order (i.e., whereas the order itself is the value in OD_order, here it is the key)
-        self.__order_OD = {}
+        # keeps the OD of each order (i.e., whereas the order itself is the value in OD_order, here it is the index)
+        self.__order_OD = []
 
         # the total number of vehicles
         self.__total_flow = 0.0
 
+        # the flow of each OD pair, as an array (created when first needed)
+        self.__flows = None
+
         self.__create_OD_matrix(OD_entries)
 
     def __create_OD_matrix(self, OD_entries):
@@ -613,7 +653,7 @@ class ODMatrix:
             self.__OD_pairs.append(od_name)
 
             self.__OD_order[od_name] = order
-            self.__order_OD[order] = od_name
+            self.__order_OD.append(od_name)
             order += 1
 
             # compute the total flow
@@ -628,6 +668,12 @@ class ODMatrix:
     def get_flow(self, od):
         return self.__OD_matrix[od]
 
+    # the flow of each OD pair (following the OD pairs' order)
+    def get_flows(self):
+        if self.__flows is None:
+            self.__flows = np.array([self.__OD_matrix[od] for od in self.__OD_pairs], dtype=float)
+        return self.__flows
+
     def get_OD_order(self, od):
         return self.__OD_order[od]
 
@@ -635,3 +681,261 @@ class ODMatrix:
         return self.__order_OD[index]
 
 # =======================================================================
+
+
+# =======================================================================
+
+# read the network specification of a network (from the specifications registered by this process or from the
+# compiled cache, if available and up to date)
+def read_network_spec(network_name, routes_per_OD=None, alt_route_file_name=None, cache=True):
+    net_fname = f'{NETWORKS_DIR}/{network_name}.net'
+    if alt_route_file_name is not None:
+        routes_fname = f'{NETWORKS_DIR}/{alt_route_file_name}'
+    else:
+        routes_fname = f'{NETWORKS_DIR}/{network_name}.routes'
+    if not routes_per_OD or routes_per_OD <= 0:
+        routes_per_OD = 0
+
+    spec = _registered_specs.get((network_name, routes_per_OD, alt_route_file_name))
+    if spec is not None:
+        return spec
+
+    # networks without a .routes file have their routes generated (once) from the network
+    # itself, as the K shortest paths of each OD pair (stored in a .k{K}.routes file)
+    if alt_route_file_name is None and not os.path.exists(routes_fname):
+        k = routes_per_OD or DEFAULT_GENERATED_ROUTES_PER_OD
+        routes_fname = f'{NETWORKS_DIR}/{network_name}.k{k}.routes'
+        if not os.path.exists(routes_fname):
+            generate_routes_file(net_fname, routes_fname, k)
+
+    cache_fname = f'{NETWORKS_DIR}/{alt_route_file_name or network_name}.k{routes_per_OD}.npz'
+    key = None
+    if cache:
+        key = get_network_cache_key(net_fname, routes_fname, routes_per_OD)
+        spec = load_network_cache(cache_fname, key)
+        if spec is not None:
+            return spec
+
+    spec = parse_network_file(net_fname)
+    spec.update(parse_routes_file(routes_fname, spec, routes_per_OD))
+
+    if cache:
+        save_network_cache(cache_fname, key, spec)
+
+    return spec
+
+
+# the network specifications registered by this process (e.g., attached from shared memory), by network
+_registered_specs = {}
+
+
+# make a network specification available to every Network (of the same network, number of routes and
+# route file) created by this process, which is then built from it instead of the network files
+def register_network_spec(network_name, routes_per_OD, alt_route_file_name, spec):
+    if not routes_per_OD or routes_per_OD <= 0:
+        routes_per_OD = 0
+    _registered_specs[(network_name, routes_per_OD, alt_route_file_name)] = spec
+
+
+# read a .net file (in a single pass) into a network specification, i.e., a dictionary of arrays
+def parse_network_file(fname):
+    functions = []  # [name, param, expr, constants]
+    nodes = []
+    render_order = []
+    links = []  # [name, origin, destination, function, values]
+    ODs = []  # [name, origin, destination, flow]
+    constants_of = {}
+
+    lineid = 0
+    with open(fname, 'r') as f:
+        for line in f:
+
+            lineid += 1
+
+            # ignore \n
+            line = line.rstrip()
+
+            # ignore comments
+            hash_pos = line.find('#')
+            if hash_pos > -1:
+                line = line[:hash_pos]
+
+            # split the line
+            taglist = line.split()
+            if len(taglist) == 0:
+                continue
+
+            if taglist[0] == 'function':
+
+                # process the params
+                params = taglist[2][1:-1].split(',')
+                if len(params) > 1:
+                    raise Exception(
+                        'Cost functions with more than one parameter are not yet acceptable! (parameters defined: %s)' % str(
+                            params)[1:-1])
+
+                # process the constants (in order of occurrence, which is
+                # the order of their values in the edges' specification)
+                expr = taglist[3]
+                constants = Parser().parse(expr).variables()
+                if params[0] in constants:  # the parameter must be ignored
+                    constants.remove(params[0])
+
+                constants_of[taglist[1]] = constants
+                functions.append([taglist[1], params[0], expr, ','.join(constants)])
+
+            elif taglist[0] == 'node':
+                nodes.append(taglist[1])
+
+            elif taglist[0] == 'dedge' or taglist[0] == 'edge':  # dedge is a directed edge
+
+                # associate the constants specified in the line with the
+                # corresponding function (in order of occurrence)
+                values = [float(v) for v in taglist[5:5 + len(constants_of[taglist[4]])]]
+                links.append([taglist[1], taglist[2], taglist[3], taglist[4], values])
+                if taglist[0] == 'edge':
+                    links.append(['%s-%s' % (taglist[3], taglist[2]), taglist[3], taglist[2], taglist[4], values])
+
+            elif taglist[0] == 'od':
+
+                # if no flow is set for the OD pair, then
+                # it is not created (just to avoid problems
+                # when computing OD-related statistics)
+                if float(taglist[4]) > 0:
+                    ODs.append([taglist[1], taglist[2], taglist[3], float(taglist[4])])
+
+            elif taglist[0] == 'order':
+                render_order.append(taglist[1])
+
+            else:
+                raise Exception('Network file does not comply with the specification! (line %d: "%s")' % (lineid, line))
+
+    # the constants' values of the links (padded with NaN, since functions may have different numbers of constants)
+    link_values = np.full((len(links), max([len(l[4]) for l in links] + [0])), np.nan)
+    for i, l in enumerate(links):
+        link_values[i, :len(l[4])] = l[4]
+
+    return {
+        'function_names': np.array([f[0] for f in functions], dtype=str),
+        'function_params': np.array([f[1] for f in functions], dtype=str),
+        'function_exprs': np.array([f[2] for f in functions], dtype=str),
+        'function_constants': np.array([f[3] for f in functions], dtype=str),
+        'nodes': np.array(nodes, dtype=str),
+        'render_order': np.array(render_order, dtype=str),
+        'link_names': np.array([l[0] for l in links], dtype=str),
+        'link_origins': np.array([l[1] for l in links], dtype=str),
+        'link_destinations': np.array([l[2] for l in links], dtype=str),
+        'link_functions': np.array([l[3] for l in links], dtype=str),
+        'link_values': link_values,
+        'od_names': np.array([od[0] for od in ODs], dtype=str),
+        'od_origins': np.array([od[1] for od in ODs], dtype=str),
+        'od_destinations': np.array([od[2] for od in ODs], dtype=str),
+        'od_flows': np.array([od[3] for od in ODs], dtype=float),
+    }
+
+
+# read a .routes file into the routes' part of a network specification, where up to routes_per_OD
+# routes (all, if 0) are kept for each OD pair of the (already parsed) network specification
+def parse_routes_file(fname, spec, routes_per_OD=0):
+    routes_str = {str(od): [] for od in spec['od_names']}
+
+    with open(fname, 'r') as f:
+        for line in f:
+
+            # ignore \n
+            line = line.rstrip()
+
+            # ignore comments
+            hash_pos = line.find('#')
+            if hash_pos > -1:
+                line = line[:hash_pos]
+
+            # split the line
+            spl = line.split()
+            if len(spl) == 0:
+                continue
+
+            od = spl[0]
+
+            # if the OD pair is not in the dictionary, it
+            # means that it is invalid (e.g. zero flow)
+            if od not in routes_str:
+                continue
+
+            # add the route to the list (up to routes_per_OD routes
+            # are stored for each OD pair)
+            if routes_per_OD <= 0 or len(routes_str[od]) < routes_per_OD:
+                routes_str[od].append(spl[1])
+
+    # the routes (following the order of the OD pairs) and the links of each route (as a CSR structure)
+    link_index = {str(l): i for i, l in enumerate(spec['link_names'])}
+    route_strs = []
+    routes_offset = [0]
+    indices = []
+    indptr = [0]
+    for od in spec['od_names']:
+        for route_str in routes_str[str(od)]:
+            route_strs.append(route_str)
+            indices.extend(link_index[l] for l in route_str.split(','))
+            indptr.append(len(indices))
+        routes_offset.append(len(route_strs))
+
+    return {
+        'route_strs': np.array(route_strs, dtype=str),
+        'routes_offset': np.array(routes_offset, dtype=int),
+        'routes_links_indices': np.array(indices, dtype=int),
+        'routes_links_indptr': np.array(indptr, dtype=int),
+    }
+
+
+# generate the K shortest paths (on free flow costs) of each OD pair of a .net file and store them as a .routes file
+def generate_routes_file(net_fname, routes_fname, k, workers=None):
+    spec = parse_network_file(net_fname)
+
+    engine = LinkCostEngine()
+    for name, param, expr, constants in zip(spec['function_names'], spec['function_params'], spec['function_exprs'], spec['function_constants']):
+        engine.add_function(str(name), str(param), [c for c in str(constants).split(',') if c], str(expr))
+    for function, values in zip(spec['link_functions'], spec['link_values']):
+        engine.add_link(str(function), values[~np.isnan(values)])
+    engine.compile()
+    free_flow_costs = engine.evaluate(np.zeros(engine.get_number_of_links()))
+
+    routes = generate_routes(spec, free_flow_costs, k, workers)
+
+    # written atomically, so that concurrent processes never read a partial file
+    tmp_fname = f'{routes_fname}.{os.getpid()}.tmp'
+    write_routes_file(tmp_fname, routes)
+    os.replace(tmp_fname, routes_fname)
+
+
+# the key of a compiled network, which changes whenever any of its files (or the number of routes) changes
+def get_network_cache_key(net_fname, routes_fname, routes_per_OD):
+    h = hashlib.sha1()
+    for fname in [net_fname, routes_fname]:
+        with open(fname, 'rb') as f:
+            h.update(f.read())
+    h.update(f'{routes_per_OD}|{NETWORK_CACHE_VERSION}'.encode())
+    return h.hexdigest()
+
+
+# load a compiled network specification (None if it does not exist or if its key does not match)
+def load_network_cache(fname, key):
+    try:
+        with np.load(fname) as data:
+            if str(data['key']) != key:
+                return None
+            return {k: data[k] for k in data.files if k != 'key'}
+    except (OSError, ValueError, KeyError, zipfile.BadZipFile):
+        return None
+
+
+# store a compiled network specification (failures, e.g. due to a read-only directory, are ignored)
+def save_network_cache(fname, key, spec):
+    tmp_fname = f'{fname}.{os.getpid()}.tmp'
+    try:
+        with open(tmp_fname, 'wb') as f:
+            np.savez(f, key=np.array(key), **spec)
+        os.replace(tmp_fname, fname)  # atomic, so that concurrent processes never read a partial file
+    except OSError:
+        with contextlib.suppress(OSError):
+            os.remove(tmp_fname)
@@ -1,10 +1,11 @@
 from gymnasium.spaces import Discrete
 
 import functools
-from decimal import Decimal
-from typing import Mapping, Optional
+from typing import Iterable, Optional
 
-from route_choice_env.core import Driver
+import numpy as np
+
+from route_choice_env.core import INFO_KEYS, DriverInfo, DriverMapping, DriverPopulation, SharedInfo
 from route_choice_env.graphics import EnvViewer
 from route_choice_env.misc import Distribution
 from route_choice_env.problem import Network
@@ -22,6 +23,9 @@ class RouteChoicePZ(ParallelEnv):
             routes_per_od: Number of routes per od.
             agent_vehicles_factor: Number of vehicles controlled by an agent of the environment.
             normalise_costs: Weather it should normalise its costs.
+            incremental_evaluation: Whether each step should only re-evaluate the routes affected by the drivers that
+                switched routes since the previous step (the results are the same of a full evaluation).
+            info_keys: The keys of the drivers' info returned by step and reset (all keys of INFO_KEYS, if None).
 
         __init__:
             - Create the road network and reset the graph.
@@ -45,6 +49,8 @@ class RouteChoicePZ(ParallelEnv):
             route_filename: str = None,
             max_episodes: int = None,
             algorithm: str = None,
+            incremental_evaluation: bool = True,
+            info_keys: Iterable[str] = None,
     ):
         self.__road_network = Network(net_name, routes_per_od, alt_route_file_name=route_filename)
         self.__road_network.reset_graph()
@@ -58,30 +64,68 @@ class RouteChoicePZ(ParallelEnv):
         else:
             self.__preference_money_over_time = Distribution(dist=Distribution.get_dist_id(preference_dist_name), num_of_samples=self.__road_network.get_total_flow())
         self.__normalize_costs = normalise_costs
+        self.__incremental_evaluation = incremental_evaluation
+
+        self.__info_keys = INFO_KEYS if info_keys is None else tuple(info_keys)
+        if not set(self.__info_keys).issubset(INFO_KEYS):
+            raise ValueError(f'Unknown info keys {sorted(set(self.__info_keys) - set(INFO_KEYS))}!')
 
         self.__avg_travel_time = 0
         self.__normalised_avg_travel_time = 0
         self.__avg_flow = 0
 
-        # sum of routes' costs through time (used to compute the averages)
-        self.routes_costs_sum = {od: [0.0 for _ in range(self.__road_network.get_route_set_size(od))] for od in self.od_pairs}
-        self.routes_costs_min = {od: 0.0 for od in self.od_pairs}
+        # sum of routes' costs through time (used to compute the averages), following the routes' order, and the
+        # minimum average cost of the routes of each OD pair (following the OD pairs' order); the routes of each
+        # OD pair are the segments of the routes' order starting at their offsets
+        self.__routes_costs_sum = np.zeros(self.__road_network.get_number_of_routes())
+        self.__routes_costs_min = np.zeros(len(self.od_pairs))
+        self.__routes_segments = self.__road_network.get_routes_offset()[:-1]
 
         self.tolls_share_per_od = [0.0 for _ in range(len(self.__road_network.get_OD_pairs()))]
         self.side_payment_per_od = [0.0 for _ in range(len(self.__road_network.get_OD_pairs()))]
 
-        self.__flow_distribution = self.__road_network.get_empty_solution()
-        self.__flow_distribution_w_preferences = self.__road_network.get_empty_solution()
-
-        self.__drivers: Mapping[AgentID, Driver] = {}
-        self.__create_drivers()
+        # the flow of each OD pair (following the OD pairs' order) and their average
+        self.__od_flows = np.asarray(self.__road_network.get_OD_flows(), dtype=float)
+        self.__od_avg_flow = sum([self.__road_network.get_OD_flow(od) for od in self.od_pairs]) / len(self.od_pairs)
+
+        # the flow (and aggregated time flexibility) of each route, following the routes' order
+        # (persistent buffers, which are zeroed in place on every step and reset)
+        self.__flow_distribution = np.zeros(self.__road_network.get_number_of_routes())
+        self.__flow_distribution_w_preferences = np.zeros(self.__road_network.get_number_of_routes())
+
+        # the free flow travel time of each route, following the routes' order
+        self.__routes_free_flow_travel_time = np.array([
+            self.__road_network.get_route_by_index(i).get_free_flow_travel_time(self.__normalize_costs)
+            for i in range(self.__road_network.get_number_of_routes())
+        ])
+
+        # the free flow travel times of the routes of each OD pair (shared by the info of all drivers of the OD pair)
+        routes_offset = self.__road_network.get_routes_offset()
+        routes_free_flow_travel_time = self.__routes_free_flow_travel_time.tolist()
+        self.__od_free_flow_travel_times = [
+            tuple(routes_free_flow_travel_time[routes_offset[i]:routes_offset[i + 1]]) for i in range(len(self.od_pairs))
+        ]
+
+        # the marginal cost of each route (i.e., its travel time minus its free flow travel time), which is
+        # that of the empty graph after every reset
+        self.__free_flow_routes_marginal_cost = self.__road_network.get_routes_cost(self.__normalize_costs) - self.__routes_free_flow_travel_time
+        self.__routes_marginal_cost = self.__free_flow_routes_marginal_cost
+
+        # the drivers are stored as arrays indexed by the driver index (see DriverPopulation)
+        self.__drivers = DriverPopulation(
+            self.od_pairs,
+            [self.__road_network.get_OD_flow(od) for od in self.od_pairs],
+            self.__agent_vehicles_factor,
+            self.__preference_money_over_time
+        )
 
         # -- Agents
-        self.agents = list(self.__drivers.keys())
-        self.possible_agents = self.agents[:]
+        # (the agents' IDs and spaces are sequences/mappings created lazily from the drivers' indices)
+        self.agents = self.__drivers.get_ids()
+        self.possible_agents = self.__drivers.get_ids()
 
-        self.observation_spaces = {a: self.observation_space(a) for a in self.agents}
-        self.action_spaces = {a: self.action_space(a) for a in self.agents}
+        self.observation_spaces = DriverMapping(self.possible_agents, self.observation_space)
+        self.action_spaces = DriverMapping(self.possible_agents, self.action_space)
 
         self.viewer = None
         self.__iteration = 0
@@ -124,42 +168,42 @@ class RouteChoicePZ(ParallelEnv):
 
     @property
     def road_network_flow_distribution(self):
-        return self.__flow_distribution
+        routes_offset = self.__road_network.get_routes_offset()
+        return [self.__flow_distribution[routes_offset[i]:routes_offset[i + 1]].tolist() for i in range(len(self.od_pairs))]
 
     def get_free_flow_travel_times(self, od: str):
-        routes: list = self.__road_network.get_routes(od)
-        free_flow_travel_times = [r.get_free_flow_travel_time(self.__normalize_costs) for r in routes]
-        return free_flow_travel_times
+        return list(self.__od_free_flow_travel_times[self.__road_network.get_OD_order(od)])
+
+    @property
+    def info_keys(self):
+        return self.__info_keys
+
+    # the sum of the routes' (normalised) costs through time, following the routes' order
+    def get_routes_costs_sum(self) -> np.ndarray:
+        return self.__routes_costs_sum
+
+    # the minimum average cost of the routes of each OD pair, following the OD pairs' order
+    def get_routes_costs_min(self) -> np.ndarray:
+        return self.__routes_costs_min
+
+    # the sum of the routes' costs of each OD pair (for compatibility; see get_routes_costs_sum)
+    @property
+    def routes_costs_sum(self) -> dict:
+        routes_offset = self.__road_network.get_routes_offset()
+        routes_costs_sum = self.__routes_costs_sum.tolist()
+        return {od: routes_costs_sum[routes_offset[i]:routes_offset[i + 1]] for i, od in enumerate(self.od_pairs)}
+
+    # the minimum average cost of each OD pair (for compatibility; see get_routes_costs_min)
+    @property
+    def routes_costs_min(self) -> dict:
+        return dict(zip(self.od_pairs, self.__routes_costs_min.tolist()))
 
     def __update_routes_costs_stats(self):
-        for od in self.od_pairs:
-            for r in range(int(self.__road_network.get_route_set_size(od))):
-                cc = self.__road_network.get_route(od, r).get_cost(True)
-                # if self.__tolling:
-                #     cc = 2 * cc - self.__road_network.get_route(od, r).get_free_flow_travel_time(self.__normalize_costs)
-                self.routes_costs_sum[od][r] += cc
-            self.routes_costs_min[od] = min(self.routes_costs_sum[od]) / (self.__iteration + 1)
-
-    def __create_drivers(self):
-        for od in self.od_pairs:
-            od_flow = self.__road_network.get_OD_flow(od)
-            n_of_agents = int( Decimal(od_flow) / Decimal(self.__agent_vehicles_factor) )
-            remainder = float( Decimal(od_flow) - Decimal(n_of_agents) * Decimal(self.__agent_vehicles_factor) )
-
-            if remainder > 0:
-                n_of_agents += 1  # extra agent for remainder flow
-
-            # n_agents = int(Decimal(str(self.__road_network.get_OD_flow(od))) / Decimal(str(float(self.__agent_vehicles_factor))))
-
-            self.__drivers.update({
-                f'driver_{od}_{i}': Driver(
-                    d_id=f'driver_{od}_{i}',
-                    od_pair=od,
-                    flow=remainder if i == 0 and remainder > 0 else self.__agent_vehicles_factor,
-                    preference_money_over_time=self.__preference_money_over_time.sample()  # agent's preference
-                )
-                for i in range(n_of_agents)
-            })
+        routes_cost = self.__road_network.get_routes_cost(True)
+        # if self.__tolling:
+        #     routes_cost = 2 * routes_cost - self.__routes_free_flow_travel_time
+        self.__routes_costs_sum += routes_cost
+        self.__routes_costs_min = np.minimum.reduceat(self.__routes_costs_sum, self.__routes_segments) / (self.__iteration + 1)
 
     # -- Environment
     # -----------------
@@ -174,87 +218,154 @@ class RouteChoicePZ(ParallelEnv):
             info_n: Info on the action taken (free flow travel time of route).
 
         """
-        obs_n = {}
-        reward_n = {}
-        terminal_n = {}
-        truncated_n = {}
-        info_n = {}
-
-        self.__flow_distribution = self.__road_network.get_empty_solution()
-        self.__flow_distribution_w_preferences = self.__road_network.get_empty_solution()
-
-        # Evaluate solution based on routes taken and flow of drivers
+        d_ids = []
+        indices = []
+        routes = []
         for d_id, route_id in actions.items():
             try:
-                self.__drivers[d_id].current_route = route_id
+                indices.append(self.__drivers.get_index(d_id))
             except KeyError:
                 print(f'Driver {d_id} does not exist in the environment')
                 continue
+            d_ids.append(d_id)
+            routes.append(route_id)
+        indices = np.array(indices, dtype=int)
+        routes = np.array(routes, dtype=int)
+
+        reward, _ = self.__step(indices, routes)
+
+        obs_n = dict.fromkeys(d_ids, None)
+        reward_n = dict(zip(d_ids, reward.tolist()))
+        terminal_n = dict.fromkeys(d_ids, True)
+        truncated_n = dict.fromkeys(d_ids, False)
+        info_n = self.__get_infos(d_ids, indices)
+
+        # As a single state environment, we:
+        # - empty the agents set from the environment
+        # - return 'True' for the terminal variable
+        self.agents = []
+
+        self.__iteration += 1
+        return obs_n, reward_n, terminal_n, truncated_n, info_n
+
+    def step_array(self, actions: np.ndarray):
+        """
+        Array-based alternative to step (both share the same state, so they can be used on the same environment).
+
+        :param actions: Array with the action (route) of each driver, following the drivers' indices (i.e., the
+            order of possible_agents)
+        :return:
+            reward: Array with the travel time of each driver after taking action
+            marginal_cost: Array with the marginal cost of each driver's route
+            side_payment: Array with the side payment of each driver (i.e., of its OD pair)
+        """
+        actions = np.asarray(actions, dtype=int)
+        if actions.shape != (len(self.__drivers),):
+            raise ValueError(f'Expected one action per driver ({len(self.__drivers)}), but got an array of shape {actions.shape}!')
+
+        reward, marginal_cost = self.__step(np.arange(len(self.__drivers)), actions)
+        side_payment = np.array(self.side_payment_per_od, dtype=float)[self.__drivers.od]
+
+        # As a single state environment, the agents set is emptied (see step)
+        self.agents = []
+
+        self.__iteration += 1
+        return reward, marginal_cost, side_payment
+
+    # take the routes of the given drivers (by their indices), evaluate the resulting assignment and
+    # compute the tolls and side payments; it returns the travel time (reward) and the marginal cost
+    # of each driver
+    def __step(self, indices: np.ndarray, routes: np.ndarray):
 
-            d_flow = self.get_driver_flow(d_id)
-            od_order = self.__road_network.get_OD_order(self.get_driver_od_pair(d_id))
-            self.__flow_distribution[od_order][route_id] += d_flow
-            self.__flow_distribution_w_preferences[od_order][route_id] += d_flow * (1 - self.get_driver_preference_money_over_time(d_id))
+        # the index (in the routes' arrays) of the route taken by each driver
+        od_orders = self.__drivers.od[indices]
+        if np.any((routes < 0) | (routes >= self.__road_network.get_route_set_sizes()[od_orders])):
+            raise IndexError('Route out of the route set of the driver\'s OD pair!')
+        route_indices = self.__road_network.get_routes_offset()[od_orders] + routes
+        self.__drivers.current_route[indices] = routes
 
-        self.__avg_travel_time, self.__normalised_avg_travel_time = self.__road_network.evaluate_assignment(self.__flow_distribution, self.__flow_distribution_w_preferences)
-        self.__avg_flow = sum( [ self.road_network.get_OD_flow(od) for od in self.road_network.get_OD_pairs() ] ) / len( self.road_network.get_OD_pairs() )
+        # Evaluate solution based on routes taken and flow of drivers
+        d_flow = self.__drivers.flow[indices]
+        preference = self.__drivers.preference_money_over_time[indices]
+        self.__flow_distribution.fill(0.0)
+        self.__flow_distribution_w_preferences.fill(0.0)
+        np.add.at(self.__flow_distribution, route_indices, d_flow)
+        np.add.at(self.__flow_distribution_w_preferences, route_indices, d_flow * (1 - preference))
+
+        self.__avg_travel_time, self.__normalised_avg_travel_time = self.__road_network.evaluate_assignment(self.__flow_distribution, self.__flow_distribution_w_preferences, incremental=self.__incremental_evaluation)
+        self.__avg_flow = self.__od_avg_flow
 
         # Update the sum of routes' costs (used to compute the averages)
         self.__update_routes_costs_stats()
 
+        # the travel time (reward) and marginal cost of each driver
+        routes_cost = self.__road_network.get_routes_cost(self.__normalize_costs)
+        self.__routes_marginal_cost = routes_cost - self.__routes_free_flow_travel_time
+        reward = routes_cost[route_indices]
+        marginal_cost = self.__routes_marginal_cost[route_indices]
+
         # dev
         # --- calculating tolls for the current iteration
-        self.tolls_share_per_od = [0.0 for _ in range(len(self.__road_network.get_OD_pairs()))]
-
-        for d_id, r_id in actions.items():
-            od = self.get_driver_od_pair(d_id)
-            od_order = self.__road_network.get_OD_order(od)
-            preference = self.get_driver_preference_money_over_time(d_id)
-
-            toll = (self.__get_marginal_cost(od, r_id) + self.__get_reward(d_id) * preference) / preference
-            self.tolls_share_per_od[od_order] += toll
+        # (the tolls of each OD pair are summed in the drivers' order, as the drivers' rewards)
+        tolls = (marginal_cost + reward * preference) / preference
+        tolls_share_per_od = np.bincount(od_orders, weights=tolls, minlength=len(self.__od_flows))
+        self.tolls_share_per_od = tolls_share_per_od.tolist()
 
         # --- calculating side payments for the current iteration
         if self.__revenue_redistribution_rate > 0.0:
-            for od in self.road_network.get_OD_pairs():
-                od_i: int = self.road_network.get_OD_order(od)
-                temp = self.tolls_share_per_od[od_i] * self.__revenue_redistribution_rate
-                self.side_payment_per_od[od_i] = temp / self.road_network.get_OD_flow(od)
+            self.side_payment_per_od = (tolls_share_per_od * self.__revenue_redistribution_rate / self.__od_flows).tolist()
         # ---
 
-        for d_id in actions.keys():
-            obs_n[d_id] = None
-            reward_n[d_id] = self.__get_reward(d_id)
-            terminal_n[d_id] = True
-            truncated_n[d_id] = False
-            info_n[d_id] = self.__get_info(d_id)
-
-        # As a single state environment, we:
-        # - empty the agents set from the environment
-        # - return 'True' for the terminal variable
-        self.agents = []
-
-        self.__iteration += 1
-        return obs_n, reward_n, terminal_n, truncated_n, info_n
+        return reward, marginal_cost
 
     def reset(self, seed: Optional[int] = None, return_info: bool = False, options: Optional[dict] = None):
-        self.agents = list(self.__drivers.keys())
+        self.agents = self.__drivers.get_ids()
 
         self.__road_network.reset_graph()
+        self.__routes_marginal_cost = self.__free_flow_routes_marginal_cost
 
-        self.__flow_distribution = self.__road_network.get_empty_solution()
-        self.__flow_distribution_w_preferences = self.__road_network.get_empty_solution()
+        self.__flow_distribution.fill(0.0)
+        self.__flow_distribution_w_preferences.fill(0.0)
 
-        obs_n = {d_id: self.observation_space(d_id) for d_id in self.agents}
+        obs_n = dict.fromkeys(self.agents, None)
         # if not return_info:
         #     return obs_n, {}
 
-        info_n = {d_id: self.__get_info(d_id) for d_id in self.agents}
+        info_n = self.__get_infos(self.agents, np.arange(len(self.__drivers)))
         return obs_n, info_n
 
     def seed(self, seed=None):
         super().seed(seed)
 
+    # the state carried by the environment across episodes (e.g., the routes' costs statistics and the drivers'
+    # preferences), which can be stored (e.g., pickled) and loaded on an environment of the same network, so
+    # that an interrupted run can be resumed
+    def get_checkpoint(self) -> dict:
+        return {
+            'iteration': self.__iteration,
+            'avg_travel_time': self.__avg_travel_time,
+            'normalised_avg_travel_time': self.__normalised_avg_travel_time,
+            'avg_flow': self.__avg_flow,
+            'routes_costs_sum': self.__routes_costs_sum.copy(),
+            'routes_costs_min': self.__routes_costs_min.copy(),
+            'tolls_share_per_od': list(self.tolls_share_per_od),
+            'side_payment_per_od': list(self.side_payment_per_od),
+            'preference_money_over_time': self.__drivers.preference_money_over_time.copy(),
+            'current_route': self.__drivers.current_route.copy(),
+        }
+
+    def load_checkpoint(self, checkpoint: dict):
+        self.__iteration = checkpoint['iteration']
+        self.__avg_travel_time = checkpoint['avg_travel_time']
+        self.__normalised_avg_travel_time = checkpoint['normalised_avg_travel_time']
+        self.__avg_flow = checkpoint['avg_flow']
+        self.__routes_costs_sum[:] = checkpoint['routes_costs_sum']
+        self.__routes_costs_min = np.array(checkpoint['routes_costs_min'], dtype=float)
+        self.tolls_share_per_od = list(checkpoint['tolls_share_per_od'])
+        self.side_payment_per_od = list(checkpoint['side_payment_per_od'])
+        self.__drivers.preference_money_over_time[:] = checkpoint['preference_money_over_time']
+        self.__drivers.current_route[:] = checkpoint['current_route']
+
     def render(self):
         if self.viewer is None:
             self.viewer = EnvViewer(self)
@@ -269,7 +380,6 @@ class RouteChoicePZ(ParallelEnv):
         """
         return None
 
-    @functools.lru_cache(maxsize=None)
     def observation_space(self, d_id: AgentID) -> None:
         """
         :param d_id: Agent ID
@@ -277,67 +387,62 @@ class RouteChoicePZ(ParallelEnv):
         """
         return None
 
-    @functools.lru_cache(maxsize=None)
     def action_space(self, d_id: AgentID) -> Discrete:
         """
         :param d_id: Agent ID
-        :return:
+        :return: the action space of the agent (shared by all agents of the same OD pair)
         """
         od_pair: str = self.get_driver_od_pair(d_id)
-        return Discrete(self.__road_network.get_route_set_size(od_pair))
+        return self.__get_od_action_space(od_pair)
 
-    def __get_reward(self, d_id: AgentID) -> float:
-        od_pair = self.__drivers[d_id].get_od_pair()
-        route_id = self.__drivers[d_id].get_current_route()
-        return self.__get_route_travel_time(od_pair, route_id)
+    @functools.lru_cache(maxsize=None)
+    def __get_od_action_space(self, od_pair: str) -> Discrete:
+        return Discrete(self.__road_network.get_route_set_size(od_pair))
 
-    def __get_info(self, d_id: AgentID) -> dict:
+    def __get_infos(self, d_ids, indices: np.ndarray) -> dict:
         """
-        It returns information about the Origin-Destination pair of an agent:
-        - The free flow travel time of an agent's possible routes (actions)
+        It returns the info of the given drivers (by their IDs and indices), i.e., views (see DriverInfo) onto the
+        values of the current step, restricted to the info keys of the environment:
+        - The preference (money over time) of the driver
+        - The free flow travel time of the driver's possible routes (actions)
+        - The marginal cost of the driver's current route
+        - The side payment of the driver's OD pair
 
-        :param d_id:  Agent ID
         :return: dict
         """
-        od_pair: str = self.get_driver_od_pair(d_id)
-        info = {
-            "preference_money_over_time": self.get_driver_preference_money_over_time(d_id),
-            "free_flow_travel_times": self.get_free_flow_travel_times(od_pair),
-            "marginal_cost": self.__get_marginal_cost(od_pair, self.get_driver_current_route(d_id)),
-            "side_payment": self.__get_side_payment_for_od(od_pair)
+        shared = SharedInfo(
+            self.__info_keys,
+            self.__od_free_flow_travel_times,
+            self.__routes_marginal_cost.tolist() if 'marginal_cost' in self.__info_keys else None,
+            list(self.side_payment_per_od)
+        )
+        if not self.__info_keys:
+            return dict.fromkeys(d_ids, DriverInfo(shared, -1, -1, 0.0))
+
+        od_orders = self.__drivers.od[indices]
+        current_route = self.__drivers.current_route[indices]
+        route_indices = np.where(current_route >= 0, self.__road_network.get_routes_offset()[od_orders] + current_route, -1)
+        preference = self.__drivers.preference_money_over_time[indices]
+        return {
+            d_id: DriverInfo(shared, od_order, r, p)
+            for d_id, od_order, r, p in zip(d_ids, od_orders.tolist(), route_indices.tolist(), preference.tolist())
         }
-        return info
-
-    # -- Environment Properties
-    # ----------------------------
-    def __get_route_travel_time(self, od_pair: str, r_id: int):
-        """
-        :param r_id:  Route ID
-        :return: driver's travel time
-        """
-        route = self.__road_network.get_route(od_pair, r_id)
-        cost = route.get_cost(self.__normalize_costs)
-        return cost
-
-    def __get_marginal_cost(self, od_pair: str, r_id: int):
-        if r_id not in self.road_network.get_routes_ids(od_pair):
-            return 0.0
-        return self.__get_route_travel_time(od_pair, r_id) - self.get_free_flow_travel_times(od_pair)[r_id]
-
-    def __get_side_payment_for_od(self, od_pair):
-        od_i: int = self.road_network.get_OD_order(od_pair)
-        return self.side_payment_per_od[od_i]
 
     # -- Driver Properties
     # -----------------------
     def get_driver_flow(self, d_id: AgentID) -> float:
-        return self.__drivers[d_id].get_flow()
+        return float(self.__drivers.flow[self.__drivers.get_index(d_id)])
 
     def get_driver_od_pair(self, d_id: AgentID) -> str:
-        return self.__drivers[d_id].get_od_pair()
+        return self.__drivers.get_od_pair(self.__drivers.get_index(d_id))
 
-    def get_driver_current_route(self, d_id: AgentID) -> str:
-        return self.__drivers[d_id].get_current_route()
+    def get_driver_current_route(self, d_id: AgentID) -> int:
+        return int(self.__drivers.current_route[self.__drivers.get_index(d_id)])
 
     def get_driver_preference_money_over_time(self, d_id: AgentID) -> float:
-        return self.__drivers[d_id].get_preference_money_over_time()
+        return float(self.__drivers.preference_money_over_time[self.__drivers.get_index(d_id)])
+
+    # the drivers of the environment (as a struct of arrays, see DriverPopulation)
+    @property
+    def drivers(self) -> DriverPopulation:
+        return self.__drivers
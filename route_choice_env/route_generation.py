@@ -0,0 +1,157 @@
+"""
+    Generation of route sets for networks shipped without a .routes file.
+
+    For every OD pair, the K shortest loopless paths (Yen's algorithm) are computed on the links'
+    free flow costs. The shortest path tree is computed once per origin (covering all of its
+    destinations), and origins are spread across a process pool.
+"""
+import heapq
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+
+
+class Graph(object):
+    """
+        Directed graph stored as a CSR adjacency (by origin node) over the links of a network.
+    """
+
+    def __init__(self, n_nodes: int, link_origins: np.ndarray, link_destinations: np.ndarray, link_costs: np.ndarray):
+        order = np.argsort(link_origins, kind='stable')
+        self.n_nodes = n_nodes
+        self.indptr = np.concatenate([[0], np.cumsum(np.bincount(link_origins, minlength=n_nodes))]).tolist()
+        self.heads = link_destinations[order].tolist()
+        self.links = order.tolist()
+        self.costs = link_costs[order].tolist()
+        self.link_costs = link_costs.tolist()
+
+    # Dijkstra's algorithm from source, ignoring the blocked nodes and links; if target is given, the search
+    # stops as soon as it is reached; it returns the distance and the link used to reach each node
+    def shortest_paths(self, source: int, target: int = None, blocked_nodes=(), blocked_links=()):
+        dist = [float('inf')] * self.n_nodes
+        pred = [-1] * self.n_nodes
+        dist[source] = 0.0
+        heap = [(0.0, source)]
+        while heap:
+            d, u = heapq.heappop(heap)
+            if d > dist[u]:
+                continue
+            if u == target:
+                break
+            for e in range(self.indptr[u], self.indptr[u + 1]):
+                v = self.heads[e]
+                link = self.links[e]
+                if v in blocked_nodes or link in blocked_links:
+                    continue
+                nd = d + self.costs[e]
+                if nd < dist[v]:
+                    dist[v] = nd
+                    pred[v] = link
+                    heapq.heappush(heap, (nd, v))
+        return dist, pred
+
+    # the links of the path from the shortest paths' tree (None if target was not reached)
+    @staticmethod
+    def get_path(pred, link_origins, source: int, target: int):
+        path = []
+        node = target
+        while node != source:
+            link = pred[node]
+            if link < 0:
+                return None
+            path.append(link)
+            node = link_origins[link]
+        path.reverse()
+        return path
+
+    def get_path_cost(self, path):
+        return sum(self.link_costs[l] for l in path)
+
+
+# the K shortest loopless paths from origin to each of the destinations (as lists of link indices)
+def k_shortest_paths(graph: Graph, link_origins: list, link_destinations: list, origin: int, destinations: list, k: int):
+    _, tree = graph.shortest_paths(origin)
+
+    paths = {}
+    for target in destinations:
+        first = Graph.get_path(tree, link_origins, origin, target)
+        if first is None:
+            paths[target] = []
+            continue
+
+        A = [first]
+        B = []  # candidates (cost, number of links, path)
+        seen = {tuple(first)}
+        while len(A) < k:
+            last = A[-1]
+            last_nodes = [origin] + [link_destinations[l] for l in last]
+
+            # each node of the last path is a spur node for a deviation from it
+            for j in range(len(last)):
+                spur_node = last_nodes[j]
+                root = last[:j]
+
+                # block the links that continue the same root in the paths found so far
+                # (and the root nodes, which ensures the paths are loopless)
+                blocked_links = {p[j] for p in A if len(p) > j and p[:j] == root}
+                blocked_nodes = set(last_nodes[:j])
+
+                _, pred = graph.shortest_paths(spur_node, target, blocked_nodes, blocked_links)
+                spur = Graph.get_path(pred, link_origins, spur_node, target)
+                if spur is None:
+                    continue
+
+                path = root + spur
+                if tuple(path) not in seen:
+                    seen.add(tuple(path))
+                    heapq.heappush(B, (graph.get_path_cost(path), len(path), path))
+
+            if not B:
+                break
+            A.append(heapq.heappop(B)[2])
+
+        paths[target] = A
+    return paths
+
+
+def _k_shortest_paths_from_origin(args):
+    return k_shortest_paths(*args)
+
+
+# generate up to k routes for each OD pair of a network specification (see problem.parse_network_file),
+# given the free flow cost of each link; it returns a dictionary mapping each OD pair to its list of routes
+# (each route being the comma-separated names of its links, as in .routes files)
+def generate_routes(spec: dict, link_costs: np.ndarray, k: int, workers: int = None) -> dict:
+    node_index = {str(n): i for i, n in enumerate(spec['nodes'])}
+    link_origins = [node_index[str(n)] for n in spec['link_origins']]
+    link_destinations = [node_index[str(n)] for n in spec['link_destinations']]
+    graph = Graph(len(node_index), np.array(link_origins, dtype=int), np.array(link_destinations, dtype=int), np.asarray(link_costs, dtype=float))
+
+    # group the OD pairs by origin (so that each origin is processed once)
+    destinations = {}
+    for o, d in zip(spec['od_origins'], spec['od_destinations']):
+        destinations.setdefault(node_index[str(o)], []).append(node_index[str(d)])
+    tasks = [(graph, link_origins, link_destinations, o, ds, k) for o, ds in destinations.items()]
+
+    if workers == 1 or len(tasks) <= 1:
+        results = map(_k_shortest_paths_from_origin, tasks)
+        paths = dict(zip(destinations.keys(), results))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as ex:
+            paths = dict(zip(destinations.keys(), ex.map(_k_shortest_paths_from_origin, tasks, chunksize=max(1, len(tasks) // 64))))
+
+    link_names = [str(l) for l in spec['link_names']]
+    return {
+        str(od): [','.join(link_names[l] for l in path) for path in paths[node_index[str(o)]][node_index[str(d)]]]
+        for od, o, d in zip(spec['od_names'], spec['od_origins'], spec['od_destinations'])
+    }
+
+
+# write a set of routes (as returned by generate_routes) in the .routes format
+def write_routes_file(fname: str, routes: dict):
+    with open(fname, 'w') as f:
+        f.write('#OD route\n')
+        for od, od_routes in routes.items():
+            for route in od_routes:
+                f.write(f'{od} {route}\n')
@@ -3,14 +3,14 @@ import dearpygui.dearpygui as dpg
 from typing import Dict
 from pettingzoo.utils.conversions import AgentID
 
-from route_choice_env.core import Policy
+from route_choice_env.core import AgentPopulation, Policy
 from route_choice_env.route_choice import RouteChoicePZ
 from route_choice_env.policy import EpsilonGreedy
 
 from route_choice_env.agents.simple_driver import SimpleDriver
-from route_choice_env.agents.rmq_learning import RMQLearning
-from route_choice_env.agents.tq_learning import TQLearning
-from route_choice_env.agents.gtq_learning import GTQLearning
+from route_choice_env.agents.rmq_learning import RMQLearning, RMQLearningPopulation
+from route_choice_env.agents.tq_learning import TQLearning, TQLearningPopulation
+from route_choice_env.agents.gtq_learning import GTQLearning, GTQLearningPopulation
 
 
 def get_simple_driver_agents(env: RouteChoicePZ, policy: Policy) -> Dict[AgentID, SimpleDriver]:
@@ -65,6 +65,74 @@ def get_gtq_learning_agents(env: RouteChoicePZ, policy: Policy) -> Dict[AgentID,
     }
 
 
+# the population helpers below create one strategy per driver or, if shared, one strategy per OD pair
+# (shared by all drivers of the OD pair)
+
+# the free flow travel time of each route (action) of each driver, as a (number of drivers x number of actions) array
+def get_drivers_free_flow_travel_times(env: RouteChoicePZ) -> np.ndarray:
+    route_set_sizes = env.road_network.get_route_set_sizes()
+    free_flow_travel_times = np.zeros((len(env.od_pairs), int(route_set_sizes.max())))
+    for i, od in enumerate(env.od_pairs):
+        free_flow_travel_times[i, :route_set_sizes[i]] = env.get_free_flow_travel_times(od)
+    return free_flow_travel_times[env.drivers.od]
+
+
+def get_rmq_learning_population(env: RouteChoicePZ, policy: Policy, shared: bool = False) -> RMQLearningPopulation:
+    env.reset()
+    return RMQLearningPopulation(
+        n_actions=env.road_network.get_route_set_sizes()[env.drivers.od],
+        initial_costs=get_drivers_free_flow_travel_times(env),
+        extrapolate_costs=True,
+        policy=policy,
+        groups=env.drivers.od if shared else None
+    )
+
+
+def get_tq_learning_population(env: RouteChoicePZ, policy: Policy, shared: bool = False) -> TQLearningPopulation:
+    env.reset()
+    return TQLearningPopulation(
+        n_actions=env.road_network.get_route_set_sizes()[env.drivers.od],
+        extrapolate_costs=False,
+        policy=policy,
+        groups=env.drivers.od if shared else None
+    )
+
+
+def get_gtq_learning_population(env: RouteChoicePZ, policy: Policy, shared: bool = False) -> GTQLearningPopulation:
+    env.reset()
+    return GTQLearningPopulation(
+        n_actions=env.road_network.get_route_set_sizes()[env.drivers.od],
+        preference_money_over_time=env.drivers.preference_money_over_time,
+        extrapolate_costs=False,
+        policy=policy,
+        groups=env.drivers.od if shared else None
+    )
+
+
+# run a learning step of the drivers (which may be a dictionary of agents or a population of agents), i.e.,
+# query the drivers' actions, update the global policy, step the environment and update the drivers' strategies
+def step_drivers(env: RouteChoicePZ, drivers, policy: Policy, epsilon_decay: float, alpha: float):
+    if isinstance(drivers, AgentPopulation):
+        actions = drivers.choose_actions()
+        policy.update(epsilon_decay)
+        reward, marginal_cost, side_payment = env.step_array(actions)
+        drivers.update_strategy(reward, marginal_cost, side_payment, alpha=alpha)
+        return
+
+    # query for action from each agent's policy
+    act_n = {d_id: drivers[d_id].choose_action() for d_id in env.agents}
+
+    # update global policy
+    policy.update(epsilon_decay)
+
+    # step environment
+    obs_n, reward_n, terminal_n, truncated_n, info_n = env.step(act_n)
+
+    # update strategy (Q table)
+    for d_id in drivers.keys():
+        drivers[d_id].update_strategy(obs_n[d_id], reward_n[d_id], info_n[d_id], alpha=alpha)
+
+
 def simulate(
         alg,
         net,
@@ -78,7 +146,9 @@ def simulate(
         preference_dist_name,
         episodes,
         seed,
-        render
+        render,
+        population=False,
+        shared_strategy=False
 ):
     if seed:
         np.random.seed(seed)
@@ -108,7 +178,15 @@ def simulate(
     policy = EpsilonGreedy(epsilon, min_epsilon)
 
     # instantiate learning agents as drivers
-    if alg == 'RMQLearning':
+    # (or a single population of agents, whose strategies are updated at once, possibly shared per OD pair)
+    if population or shared_strategy:
+        if alg == 'RMQLearning':
+            drivers = get_rmq_learning_population(env, policy, shared_strategy)
+        elif alg == 'TQLearning':
+            drivers = get_tq_learning_population(env, policy, shared_strategy)
+        elif alg == 'GTQLearning':
+            drivers = get_gtq_learning_population(env, policy, shared_strategy)
+    elif alg == 'RMQLearning':
         drivers = get_rmq_learning_agents(env, policy)
     elif alg == 'TQLearning':
         drivers = get_tq_learning_agents(env, policy)
@@ -132,14 +210,8 @@ def simulate(
                 # simulation loop
                 for _ in range(episodes):
 
-                    # query for action from each agent's policy
-                    act_n = {d_id: drivers[d_id].choose_action() for d_id in env.agents}
-
-                    # update global policy
-                    policy.update(epsilon_decay)
-
-                    # step environment
-                    obs_n, reward_n, terminal_n, truncated_n, info_n = env.step(act_n)
+                    # query for actions, step environment and update strategies (Q tables)
+                    step_drivers(env, drivers, policy, epsilon_decay, alpha)
 
                     if render:
                         env.render()
@@ -148,10 +220,6 @@ def simulate(
                     if env.avg_travel_time < best:
                         best = env.avg_travel_time
 
-                    # update strategy (Q table)
-                    for d_id in drivers.keys():
-                        drivers[d_id].update_strategy(obs_n[d_id], reward_n[d_id], info_n[d_id], alpha=alpha)
-
                     # update global learning rate (alpha)
                     if alpha > min_alpha:
                         alpha = alpha * alpha_decay
@@ -170,14 +238,8 @@ def simulate(
         best = float('inf')
         for _ in range(episodes):
 
-            # query for action from each agent's policy
-            act_n = {d_id: drivers[d_id].choose_action() for d_id in env.agents}
-
-            # update global policy
-            policy.update(epsilon_decay)
-
-            # step environment
-            obs_n, reward_n, terminal_n, truncated_n, info_n = env.step(act_n)
+            # query for actions, step environment and update strategies (Q tables)
+            step_drivers(env, drivers, policy, epsilon_decay, alpha)
 
             if render:
                 env.render()
@@ -186,10 +248,6 @@ def simulate(
             if env.avg_travel_time < best:
                 best = env.avg_travel_time
 
-            # update strategy (Q table)
-            for d_id in drivers.keys():
-                drivers[d_id].update_strategy(obs_n[d_id], reward_n[d_id], info_n[d_id], alpha=alpha)
-
             # update global learning rate (alpha)
             if alpha > min_alpha:
                 alpha = alpha * alpha_decay
@@ -0,0 +1,77 @@
+"""
+    Sharing of network specifications among processes.
+
+    The parent process reads a network specification (see problem.read_network_spec) once and copies
+    its arrays (the links' cost function constants, the route x link incidence, the OD flows, etc.) into
+    shared memory blocks. Worker processes attach to those blocks, without copying them, and register
+    the resulting specification, so that the networks they create are built from it instead of the
+    network files.
+"""
+import multiprocessing
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+from route_choice_env.problem import read_network_spec, register_network_spec
+
+
+class SharedNetworkSpec(object):
+    """
+        The specification of a network stored in shared memory blocks (one per array), which are owned by
+        the process creating it, i.e., they are released by close (or when leaving its context).
+
+        The descriptor (picklable) is given to the worker processes, which attach to the specification
+        with attach_network_spec (e.g., as the initializer of a ProcessPoolExecutor).
+    """
+
+    def __init__(self, network_name, routes_per_OD=None, alt_route_file_name=None):
+        spec = read_network_spec(network_name, routes_per_OD, alt_route_file_name)
+
+        self.__blocks = []
+        arrays = {}
+        for key, array in spec.items():
+            array = np.ascontiguousarray(array)
+            block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+            np.ndarray(array.shape, array.dtype, buffer=block.buf)[...] = array
+            self.__blocks.append(block)
+            arrays[key] = (block.name, array.shape, array.dtype.str)
+
+        self.descriptor = (network_name, routes_per_OD, alt_route_file_name, arrays)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        for block in self.__blocks:
+            block.close()
+            block.unlink()
+        self.__blocks = []
+
+
+# the blocks attached by this process (which must be kept open while their arrays are in use)
+_attached_blocks = []
+
+
+# attach to a network specification shared by another process (given its descriptor) and register it,
+# so that the networks created by this process are built from it; it returns the (read-only) specification
+def attach_network_spec(descriptor) -> dict:
+    network_name, routes_per_OD, alt_route_file_name, arrays = descriptor
+
+    spec = {}
+    for key, (name, shape, dtype) in arrays.items():
+        block = shared_memory.SharedMemory(name=name)
+
+        # processes not created by fork have their own resource tracker, which would release
+        # the blocks when they exit (the blocks are released by their owner instead)
+        if multiprocessing.get_start_method() != 'fork':
+            resource_tracker.unregister(block._name, 'shared_memory')
+
+        _attached_blocks.append(block)
+        spec[key] = np.ndarray(shape, np.dtype(dtype), buffer=block.buf)
+        spec[key].flags.writeable = False
+
+    register_network_spec(network_name, routes_per_OD, alt_route_file_name, spec)
+    return spec
@@ -1,14 +1,85 @@
+import os
+import shutil
 from pathlib import Path
 from typing import Dict, Union
 
+import numpy as np
 import pandas as pd
 
+from route_choice_env.core import AgentPopulation
+from route_choice_env.metrics import MetricsSink, TextMetricsSink
 from route_choice_env.route_choice import RouteChoicePZ
 
 from route_choice_env.agents.rmq_learning import RMQLearning
 from route_choice_env.agents.tq_learning import TQLearning
 
 
+# the sum of the values in their order (as in a loop over them, unlike the pairwise summation of np.sum), so that
+# the statistics match those computed by iterating over the drivers
+def _sequential_sum(values: np.ndarray) -> float:
+    return float(np.cumsum(values)[-1]) if len(values) else 0.0
+
+
+class EpisodeStatsBuffer(object):
+    """
+        Append-only buffer of per-episode statistics, stored as a preallocated (episodes x columns) array that grows
+        geometrically, so that appending an episode takes (amortised) constant time.
+
+        If flush_filename is given, the buffered episodes are appended to such (CSV) file every flush_every episodes
+        and then discarded, so that only the episodes not yet flushed are kept in memory.
+    """
+
+    def __init__(self, columns: list, int_columns: list = (), capacity: int = 64, flush_filename: str = None, flush_every: int = 1000):
+        self.columns = list(columns)
+        self.__int_columns = [c for c in int_columns if c in self.columns]
+        self.__data = np.empty((max(capacity, 1), len(self.columns)))
+        self.__size = 0
+
+        self.__flush_filename = flush_filename
+        self.__flush_every = flush_every
+        self.__n_flushed = 0
+        if flush_filename is not None and os.path.exists(flush_filename):
+            os.remove(flush_filename)
+
+    # the number of episodes (including those already flushed)
+    def __len__(self):
+        return self.__n_flushed + self.__size
+
+    def append(self, row: list):
+        if self.__size == len(self.__data):
+            data = np.empty((2 * len(self.__data), len(self.columns)))
+            data[:self.__size] = self.__data[:self.__size]
+            self.__data = data
+        self.__data[self.__size] = row
+        self.__size += 1
+
+        if self.__flush_filename is not None and self.__size >= self.__flush_every:
+            self.flush()
+
+    # the episodes kept in memory (i.e., not yet flushed), indexed by their order
+    def to_frame(self) -> pd.DataFrame:
+        df = pd.DataFrame(self.__data[:self.__size], columns=self.columns, index=range(self.__n_flushed, len(self)))
+        return df.astype({c: int for c in self.__int_columns})
+
+    # append the buffered episodes to the flush file (writing the header along with the first episodes)
+    def flush(self):
+        if self.__flush_filename is None or self.__size == 0:
+            return
+        self.to_frame().to_csv(self.__flush_filename, sep=';', mode='a', header=self.__n_flushed == 0)
+        self.__n_flushed += self.__size
+        self.__size = 0
+
+    # write all episodes to a CSV file
+    def save_csv(self, filename: str):
+        if self.__flush_filename is None:
+            self.to_frame().to_csv(filename, sep=';')
+            return
+
+        self.flush()
+        if os.path.abspath(filename) != os.path.abspath(self.__flush_filename):
+            shutil.copyfile(self.__flush_filename, filename)
+
+
 class Statistics(object):
     """
         Class for calculating statistics for experiments, both on every episode or after the experiment is completed.
@@ -20,15 +91,31 @@ class Statistics(object):
 
     def __init__(self,
                  env: RouteChoicePZ,
-                 driver_agents: Dict[str, Union[RMQLearning, TQLearning]],
+                 driver_agents: Union[Dict[str, Union[RMQLearning, TQLearning]], AgentPopulation],
                  iterations,
                  stat_regret_diff,
                  stat_all,
-                 print_od_pairs_every_episode: bool
+                 print_od_pairs_every_episode: bool,
+                 episode_stats_filename: str = None,
+                 sink: MetricsSink = None,
+                 out=None
     ):
         self.__env = env
         self.__road_network = env.road_network
-        self.__driver_agents = driver_agents  # set of drivers
+        self.__driver_agents = driver_agents  # set of drivers (or population of agents)
+
+        # the statistics of each episode are written to sink, and the final statistics are printed to out
+        # (by default, both are printed to the current sys.stdout)
+        self.__out = out
+        self.__sink = TextMetricsSink(out) if sink is None else sink
+
+        # the OD pair (order) of each driver, following the order of driver_agents (the statistics are computed
+        # from arrays following this order, with the values of each OD pair reduced with bincount)
+        if isinstance(driver_agents, AgentPopulation):
+            self.__drivers_od = env.drivers.od
+        else:
+            self.__drivers_od = env.drivers.od[[env.drivers.get_index(d_id) for d_id in driver_agents]]
+        self.__n_ODs = len(self.__road_network.get_OD_pairs())
 
         # parameters of the problem instance
         self.__iterations = iterations
@@ -46,58 +133,62 @@ class Statistics(object):
                 if self.__stat_regret_diff:
                     self.__cols_episode.extend([f'{od}_avg_abs_diff', f'{od}_avg_rel_diff'])  # regret diff
 
-        self.__df_episode_stats = pd.DataFrame(columns=self.__cols_episode)
+        # the statistics of every episode (flushed to episode_stats_filename, if given, as they are computed)
+        self.__episode_stats = EpisodeStatsBuffer(self.__cols_episode, int_columns=['i'], flush_filename=episode_stats_filename)
 
-        print('\t'.join(map(str, [col for col in self.__cols_episode])))
+        self.__sink.write_header(self.__cols_episode, ['i'])
 
     # -------------------------------------------------------------------
 
+    # print the statistics of the experiment, where routes_costs_sum is the sum of the routes' costs through time,
+    # either as an array following the routes' order (see RouteChoicePZ.get_routes_costs_sum) or as a dictionary
+    # with the sums of the routes of each OD pair
     def print_statistics(self, S, v, best, sum_regrets, routes_costs_sum):
+        if isinstance(routes_costs_sum, dict):
+            routes_costs_sum = [c for od in self.__road_network.get_OD_pairs() for c in routes_costs_sum[od]]
+        routes_costs_avg = np.asarray(routes_costs_sum, dtype=float) / self.__iterations
+        routes_offset = self.__road_network.get_routes_offset()
+        routes_od = self.__road_network.get_routes_od()
 
         # print the average regrets of each OD pair along the iterations
         print('\nAverage regrets over all timesteps (real, estimated, absolute difference, relative difference) '
-              'per OD pair:')
+              'per OD pair:', file=self.__out)
         for od in self.__road_network.get_OD_pairs():
             print(f'\t{od}\t{sum_regrets[od][0] / self.__iterations}\t{sum_regrets[od][1] / self.__iterations}'
-                  f'\t{sum_regrets[od][2] / self.__iterations}\t{sum_regrets[od][3] / self.__iterations}')
+                  f'\t{sum_regrets[od][2] / self.__iterations}\t{sum_regrets[od][3] / self.__iterations}', file=self.__out)
 
         # print the average cost of each route of each OD pair along iterations
-        print('\nAverage cost of routes:')
-        for od in self.__road_network.get_OD_pairs():
-            print(od)
-            for r in range(int(self.__road_network.get_route_set_size(od))):
-                routes_costs_sum[od][r] /= self.__iterations
-                print(f'\t{r}\t{routes_costs_sum[od][r]}')
+        print('\nAverage cost of routes:', file=self.__out)
+        for iod, od in enumerate(self.__road_network.get_OD_pairs()):
+            print(od, file=self.__out)
+            for r, cost in enumerate(routes_costs_avg[routes_offset[iod]:routes_offset[iod + 1]].tolist()):
+                print(f'\t{r}\t{cost}', file=self.__out)
 
-        print(f'\nLast solution {S} = {v}')
-        print(f'Best value found was of {best}')
+        print(f'\nLast solution {S} = {v}', file=self.__out)
+        print(f'Best value found was of {best}', file=self.__out)
 
         # print the average strategy (for each OD pair)
-        print('\nAverage strategy per OD pair:')
-        for od in self.__road_network.get_OD_pairs():
-            strategies = {r: 0.0 for r in range(len(self.__road_network.get_routes(od)))}
-            for d_id, d in self.__driver_agents.items():
-                if self.__env.get_driver_od_pair(d_id) == od:
-                    S = d.get_strategy()
-                    for s in S:
-                        strategies[s] += S[s]
-            for s in strategies:
-                strategies[s] = round(strategies[s] / self.__road_network.get_OD_flow(od), 3)
-            print(f'\t{od}\t{strategies}')
-
-        print('\nAverage expected cost of drivers per OD pair')
-        expected_cost_sum = {od: 0.0 for od in self.__road_network.get_OD_pairs()}
-        for d_id, d in self.__driver_agents.items():
-            _od_pair = self.__env.get_driver_od_pair(d_id)
-            _sum = 0.0
-            for r in d.get_strategy():
-                _sum += d.get_strategy()[r] * routes_costs_sum[_od_pair][r]
-            expected_cost_sum[_od_pair] += _sum
+        print('\nAverage strategy per OD pair:', file=self.__out)
+        strategies = self.__get_strategies()
+        strategies_sum = self.__sum_per_OD(strategies).tolist()
+        for iod, od in enumerate(self.__road_network.get_OD_pairs()):
+            od_strategies = {r: round(strategies_sum[iod][r] / self.__road_network.get_OD_flow(od), 3) for r in range(len(self.__road_network.get_routes(od)))}
+            print(f'\t{od}\t{od_strategies}', file=self.__out)
+
+        print('\nAverage expected cost of drivers per OD pair', file=self.__out)
+        routes_costs = np.zeros((self.__n_ODs, strategies.shape[1]))
+        routes_costs[routes_od, np.arange(len(routes_od)) - routes_offset[routes_od]] = routes_costs_avg
+
+        # (the expected cost of each driver is summed route by route, and the drivers' invalid routes add zero)
+        expected_cost = np.zeros(len(self.__drivers_od))
+        for r in range(strategies.shape[1]):
+            expected_cost += strategies[:, r] * routes_costs[self.__drivers_od, r]
+        expected_cost_sum = dict(zip(self.__road_network.get_OD_pairs(), self.__sum_per_OD(expected_cost).tolist()))
         total = 0.0
         for od in self.__road_network.get_OD_pairs():
             total += expected_cost_sum[od]
-            print(f'{od}\t{expected_cost_sum[od] / self.__road_network.get_OD_flow(od)}')
-        print(f'Average: {total / self.__road_network.get_total_flow()}')
+            print(f'{od}\t{expected_cost_sum[od] / self.__road_network.get_OD_flow(od)}', file=self.__out)
+        print(f'Average: {total / self.__road_network.get_total_flow()}', file=self.__out)
 
     def print_statistics_episode(self, iteration, avg_travel_time, sum_regrets):
 
@@ -105,43 +196,26 @@ class Statistics(object):
         # for each od [w, x, y, z], where w and x represent the real and estimated
         # regrets, and y and z represent absolute and relative difference between
         # the estimated and real regrets
-        regrets = {od: [0.0, 0.0, 0.0, 0.0] for od in self.__road_network.get_OD_pairs()}
+        real, estimated = self.__get_regrets()
+        regrets = [self.__sum_per_OD(real), self.__sum_per_OD(estimated)]
 
-        gen_real = 0.0
-        gen_estimated = 0.0
+        gen_real = _sequential_sum(real)
+        gen_estimated = _sequential_sum(estimated)
         gen_diff = 0.0
         gen_relative_diff = 0.0
 
-        # compute the drivers' regret on CURRENT iteration
-        for d_id, d in self.__driver_agents.items():
-            _od_pair = self.__env.get_driver_od_pair(d_id)
-
-            # get the regrets
-            real = d.get_real_regret()
-            estimated = d.get_estimated_regret()
-
-            # store in the appropriate space
-            regrets[_od_pair][0] += real
-            regrets[_od_pair][1] += estimated
-
-            gen_real += real
-            gen_estimated += estimated
+        if self.__stat_regret_diff:
+            # compute the regrets' differences (https://en.wikipedia.org/wiki/Relative_change_and_difference)
+            diff = np.abs(estimated - real)
+            fxy = np.maximum(np.abs(estimated), np.abs(real))
+            relative_diff = np.divide(diff, fxy, out=np.zeros(len(diff)), where=fxy != 0)
 
-            if self.__stat_regret_diff:
-                # compute the regrets
-                diff = abs(estimated - real)
-                fxy = max(abs(estimated), abs(real))
-                try:
-                    relative_diff = (diff / fxy)  # https://en.wikipedia.org/wiki/Relative_change_and_difference
-                except ZeroDivisionError:
-                    relative_diff = 0.0
+            regrets.extend([self.__sum_per_OD(diff), self.__sum_per_OD(relative_diff)])
 
-                # store in the appropriate space
-                regrets[_od_pair][2] += diff
-                regrets[_od_pair][3] += relative_diff
+            gen_diff = _sequential_sum(diff)
+            gen_relative_diff = _sequential_sum(relative_diff)
 
-                gen_diff += diff
-                gen_relative_diff += relative_diff
+        regrets = dict(zip(self.__road_network.get_OD_pairs(), np.column_stack(regrets).tolist()))
 
         # calculate the total averages
         gen_real /= self.__road_network.get_total_flow()
@@ -189,15 +263,48 @@ class Statistics(object):
             if self.__print_od_pairs_every_episode:
                 [episode_stats.extend(stats) for od, stats in episode_stats_per_od.items()]
 
-            self.__df_episode_stats = pd.concat([
-                self.__df_episode_stats,
-                pd.DataFrame([episode_stats], columns=self.__cols_episode)
-            ])
+            self.__episode_stats.append(episode_stats)
 
-            print('\t'.join(map(str, [stats for stats in episode_stats])))
+            self.__sink.write(episode_stats)
 
         return gen_real, gen_estimated, gen_diff, gen_relative_diff, sum_regrets
 
+    # the real and estimated regrets of the drivers (as arrays following the drivers' order)
+    def __get_regrets(self):
+        if isinstance(self.__driver_agents, AgentPopulation):
+            return np.asarray(self.__driver_agents.get_real_regret(), dtype=float), np.asarray(self.__driver_agents.get_estimated_regret(), dtype=float)
+
+        n = len(self.__driver_agents)
+        real = np.fromiter((d.get_real_regret() for d in self.__driver_agents.values()), dtype=float, count=n)
+        estimated = np.fromiter((d.get_estimated_regret() for d in self.__driver_agents.values()), dtype=float, count=n)
+        return real, estimated
+
+    # the strategies of the drivers, as a (number of drivers x number of actions) array (zero for invalid actions)
+    def __get_strategies(self):
+        if isinstance(self.__driver_agents, AgentPopulation):
+            strategies = self.__driver_agents.get_strategy()
+            return np.where(np.isfinite(strategies), strategies, 0.0)
+
+        k = int(self.__road_network.get_route_set_sizes().max())
+        strategies = np.zeros((len(self.__driver_agents), k))
+        for i, d in enumerate(self.__driver_agents.values()):
+            S = d.get_strategy()
+            strategies[i, list(S.keys())] = list(S.values())
+        return strategies
+
+    # the sum of the drivers' values per OD pair (summed in the drivers' order, as in a loop over them)
+    def __sum_per_OD(self, values: np.ndarray) -> np.ndarray:
+        if values.ndim == 1:
+            return np.bincount(self.__drivers_od, weights=values, minlength=self.__n_ODs)
+        return np.column_stack([np.bincount(self.__drivers_od, weights=values[:, c], minlength=self.__n_ODs) for c in range(values.shape[1])])
+
     def save_episode_stats_csv(self, filename):
         filepath = str(Path(__file__).parent.parent.absolute()) + f"/analytics/data/{filename}.csv"
-        self.__df_episode_stats.to_csv(filepath, sep=';')
+        self.__episode_stats.save_csv(filepath)
+
+    def get_sink(self) -> MetricsSink:
+        return self.__sink
+
+    # the statistics of the episodes not yet flushed (all of them, if not flushing)
+    def get_episode_stats(self) -> pd.DataFrame:
+        return self.__episode_stats.to_frame()
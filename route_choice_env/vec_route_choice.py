@@ -0,0 +1,224 @@
+"""
+    Vectorised route choice environment, running many independent replications of the same network at once.
+
+    The replications share the network and the drivers (i.e., their OD pairs and flows), but each one has its own
+    drivers' preferences, routes' flows and costs and tolls. The state of all replications is stored as stacked
+    (number of replications x number of routes/drivers) arrays and a step evaluates the links' costs of all
+    replications with a single batched evaluation (see Network.evaluate_assignments), so that the interpreter
+    overhead of a step is shared by all replications (which pays off for small networks, like OW or the Braess
+    family, where such overhead dominates the cost of an episode).
+"""
+import numpy as np
+
+from route_choice_env.core import DriverPopulation
+from route_choice_env.misc import Distribution
+from route_choice_env.problem import Network
+
+
+class VecRouteChoice(object):
+    """
+        R independent replications of RouteChoicePZ (see its parameters), stepped together with array actions
+        (as in RouteChoicePZ.step_array), where
+        - n_replications is the number of replications (R)
+        - the drivers follow the order of RouteChoicePZ's drivers (see DriverPopulation), and their preferences
+          are sampled for each replication
+        - the actions and the values returned by step are (R x number of drivers) arrays, and the per-OD and
+          per-route values are (R x number of OD pairs) and (R x number of routes) arrays
+
+        The costs are computed as in RouteChoicePZ, except for the floating-point rounding of the batched evaluation.
+    """
+
+    def __init__(
+            self,
+            net_name: str,
+            routes_per_od: int,
+            n_replications: int,
+            agent_vehicles_factor: float = 1.0,
+            revenue_redistribution_rate: float = 0.0,
+            normalise_costs: bool = True,
+            preference_dist_name: str = None,
+            route_filename: str = None,
+    ):
+        if n_replications < 1:
+            raise ValueError('The number of replications must be positive!')
+
+        self.__road_network = Network(net_name, routes_per_od, alt_route_file_name=route_filename)
+        self.__road_network.reset_graph()
+
+        self.__n_replications = n_replications
+        self.__revenue_redistribution_rate = revenue_redistribution_rate
+        self.__normalize_costs = normalise_costs
+
+        if preference_dist_name is None:
+            preference_money_over_time = Distribution(Distribution.DIST_FIXED)
+        else:
+            preference_money_over_time = Distribution(dist=Distribution.get_dist_id(preference_dist_name), num_of_samples=self.__road_network.get_total_flow())
+
+        # the drivers (shared by all replications), whose preferences are those of the first replication; the
+        # preferences of the other replications are sampled next (as if each replication was a new environment)
+        self.__drivers = DriverPopulation(
+            self.od_pairs,
+            [self.__road_network.get_OD_flow(od) for od in self.od_pairs],
+            agent_vehicles_factor,
+            preference_money_over_time
+        )
+        n_drivers = len(self.__drivers)
+        self.__preference_money_over_time = np.empty((n_replications, n_drivers))
+        self.__preference_money_over_time[0] = self.__drivers.preference_money_over_time
+        for r in range(1, n_replications):
+            self.__preference_money_over_time[r] = np.fromiter((preference_money_over_time.sample() for _ in range(n_drivers)), dtype=float, count=n_drivers)
+        self.__current_route = np.full((n_replications, n_drivers), -1, dtype=np.int32)
+
+        # the keys of the drivers' routes and OD pairs of every replication, as used by bincount (i.e., the
+        # index of a route/OD pair in the flattened (replications x routes/OD pairs) arrays)
+        n_routes = self.__road_network.get_number_of_routes()
+        self.__replication_routes = np.arange(n_replications)[:, None] * n_routes
+        self.__drivers_od_keys = (np.arange(n_replications)[:, None] * len(self.od_pairs) + self.__drivers.od).ravel()
+        self.__drivers_flow = np.broadcast_to(self.__drivers.flow, (n_replications, n_drivers)).ravel()
+
+        self.__routes_offset = self.__road_network.get_routes_offset()
+        self.__route_set_sizes = self.__road_network.get_route_set_sizes()
+        self.__od_flows = np.asarray(self.__road_network.get_OD_flows(), dtype=float)
+
+        # the free flow travel time and cost of each route, following the routes' order
+        self.__routes_free_flow_travel_time = np.array([
+            self.__road_network.get_route_by_index(i).get_free_flow_travel_time(self.__normalize_costs)
+            for i in range(n_routes)
+        ])
+        self.__free_flow_routes_cost = self.__road_network.get_routes_cost().copy()
+
+        # the routes' flows and costs of each replication, and their average travel time
+        self.__flow_distribution = None
+        self.__routes_cost = None
+        self.__avg_travel_time = np.zeros(n_replications)
+        self.__normalised_avg_travel_time = np.zeros(n_replications)
+
+        # sum of routes' costs through time and minimum average cost of each OD pair (see RouteChoicePZ)
+        self.__routes_costs_sum = np.zeros((n_replications, n_routes))
+        self.__routes_costs_min = np.zeros((n_replications, len(self.od_pairs)))
+
+        self.tolls_share_per_od = np.zeros((n_replications, len(self.od_pairs)))
+        self.side_payment_per_od = np.zeros((n_replications, len(self.od_pairs)))
+
+        self.possible_agents = self.__drivers.get_ids()
+
+        self.__iteration = 0
+        self.reset()
+
+    # -- Properties
+    # ----------------
+    @property
+    def n_replications(self):
+        return self.__n_replications
+
+    # the average travel time (and its normalised value) of each replication in the last step
+    @property
+    def avg_travel_time(self) -> np.ndarray:
+        return self.__avg_travel_time
+
+    @property
+    def normalised_avg_travel_time(self) -> np.ndarray:
+        return self.__normalised_avg_travel_time
+
+    @property
+    def iteration(self):
+        return self.__iteration
+
+    @property
+    def od_pairs(self):
+        return self.__road_network.get_OD_pairs()
+
+    @property
+    def road_network(self):
+        return self.__road_network
+
+    # the drivers of the environment (whose preferences are those of the first replication)
+    @property
+    def drivers(self) -> DriverPopulation:
+        return self.__drivers
+
+    # the preference (money over time) of each driver of each replication
+    @property
+    def preference_money_over_time(self) -> np.ndarray:
+        return self.__preference_money_over_time
+
+    # the route currently taken by each driver of each replication (-1 if none)
+    @property
+    def current_route(self) -> np.ndarray:
+        return self.__current_route
+
+    def get_free_flow_travel_times(self, od: str):
+        od_order = self.__road_network.get_OD_order(od)
+        return self.__routes_free_flow_travel_time[self.__routes_offset[od_order]:self.__routes_offset[od_order + 1]].tolist()
+
+    # the flow and (non-normalised) cost of each route of each replication in the last step
+    def get_routes_flow(self) -> np.ndarray:
+        return self.__flow_distribution
+
+    def get_routes_cost(self) -> np.ndarray:
+        return self.__routes_cost
+
+    def get_routes_costs_sum(self) -> np.ndarray:
+        return self.__routes_costs_sum
+
+    def get_routes_costs_min(self) -> np.ndarray:
+        return self.__routes_costs_min
+
+    # -- Environment
+    # -----------------
+    def step(self, actions: np.ndarray):
+        """
+        :param actions: (R x number of drivers) array with the action (route) of each driver of each replication
+        :return:
+            reward: (R x number of drivers) array with the travel time of each driver after taking action
+            marginal_cost: (R x number of drivers) array with the marginal cost of each driver's route
+            side_payment: (R x number of drivers) array with the side payment of each driver (i.e., of its OD pair)
+        """
+        actions = np.asarray(actions, dtype=int)
+        if actions.shape != self.__current_route.shape:
+            raise ValueError(f'Expected an array of shape {self.__current_route.shape} (replications x drivers), but got one of shape {actions.shape}!')
+        if np.any((actions < 0) | (actions >= self.__route_set_sizes[self.__drivers.od])):
+            raise IndexError('Route out of the route set of the driver\'s OD pair!')
+        route_indices = self.__routes_offset[self.__drivers.od] + actions
+        self.__current_route[:] = actions
+
+        # the routes' flows of all replications, evaluated at once
+        n_routes = self.__road_network.get_number_of_routes()
+        self.__flow_distribution = np.bincount(
+            (self.__replication_routes + route_indices).ravel(), weights=self.__drivers_flow, minlength=self.__n_replications * n_routes
+        ).reshape(self.__n_replications, n_routes)
+        self.__avg_travel_time, self.__normalised_avg_travel_time, self.__routes_cost = self.__road_network.evaluate_assignments(self.__flow_distribution)
+
+        routes_normalised_cost = self.__routes_cost / self.__road_network.get_normalisation_factor_routes()
+        if np.any(routes_normalised_cost > 1):
+            r, i = np.argwhere(routes_normalised_cost > 1)[0]
+            raise Exception('Error on cost normalisation of route %s in replication %d (cost is %f, normalised cost is %f and normalisation factor is %f)!' % (
+                self.__road_network.get_route_by_index(int(i)), r, self.__routes_cost[r, i], routes_normalised_cost[r, i], self.__road_network.get_normalisation_factor_routes()))
+
+        # Update the sum of routes' costs (used to compute the averages)
+        self.__routes_costs_sum += routes_normalised_cost
+        self.__routes_costs_min = np.minimum.reduceat(self.__routes_costs_sum, self.__routes_offset[:-1], axis=1) / (self.__iteration + 1)
+
+        # the travel time (reward) and marginal cost of each driver
+        routes_cost = routes_normalised_cost if self.__normalize_costs else self.__routes_cost
+        reward = np.take_along_axis(routes_cost, route_indices, axis=1)
+        marginal_cost = reward - self.__routes_free_flow_travel_time[route_indices]
+
+        # the tolls and side payments of each OD pair (see RouteChoicePZ.step)
+        preference = self.__preference_money_over_time
+        tolls = (marginal_cost + reward * preference) / preference
+        self.tolls_share_per_od = np.bincount(
+            self.__drivers_od_keys, weights=tolls.ravel(), minlength=self.tolls_share_per_od.size
+        ).reshape(self.tolls_share_per_od.shape)
+        if self.__revenue_redistribution_rate > 0.0:
+            self.side_payment_per_od = self.tolls_share_per_od * self.__revenue_redistribution_rate / self.__od_flows
+        side_payment = self.side_payment_per_od[:, self.__drivers.od]
+
+        self.__iteration += 1
+        return reward, marginal_cost, side_payment
+
+    # reset the routes' flows and costs of all replications (i.e., the network of every replication is empty)
+    # (new arrays are created, so that those returned by previous steps are not changed)
+    def reset(self):
+        self.__flow_distribution = np.zeros((self.__n_replications, self.__road_network.get_number_of_routes()))
+        self.__routes_cost = np.tile(self.__free_flow_routes_cost, (self.__n_replications, 1))
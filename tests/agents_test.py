@@ -0,0 +1,62 @@
+import random
+
+import numpy as np
+import pytest
+
+from route_choice_env.route_choice import RouteChoicePZ
+from route_choice_env.policy import EpsilonGreedy
+from route_choice_env.services import (
+    get_rmq_learning_agents, get_rmq_learning_population,
+    get_tq_learning_agents, get_tq_learning_population,
+    get_gtq_learning_agents, get_gtq_learning_population,
+    step_drivers
+)
+
+
+def run(drivers_factory, episodes=20, seed=0, **env_kwargs):
+    random.seed(seed)
+    np.random.seed(seed)
+    env = RouteChoicePZ('OW', 8, **env_kwargs)
+    policy = EpsilonGreedy(1.0, 0.0)
+    drivers = drivers_factory(env, policy)
+    alpha = 1.0
+    avg_travel_times = []
+    for _ in range(episodes):
+        step_drivers(env, drivers, policy, 0.9, alpha)
+        avg_travel_times.append(env.avg_travel_time)
+        alpha *= 0.9
+        env.reset()
+    return env, drivers, avg_travel_times
+
+
+@pytest.mark.parametrize('agents_factory, population_factory, env_kwargs', [
+    (get_rmq_learning_agents, get_rmq_learning_population, {}),
+    (get_tq_learning_agents, get_tq_learning_population, {}),
+    (get_gtq_learning_agents, get_gtq_learning_population, {'preference_dist_name': 'DIST_UNIFORM', 'revenue_redistribution_rate': 0.5}),
+])
+def test_population_matches_agents(agents_factory, population_factory, env_kwargs):
+    env, agents, expected = run(agents_factory, **env_kwargs)
+    _, population, avg_travel_times = run(population_factory, **env_kwargs)
+
+    assert avg_travel_times == expected
+    for i, d_id in enumerate(env.possible_agents):
+        d = agents[d_id]
+        assert population.get_last_actions()[i] == d.get_last_action()
+        assert population.get_strategy()[i, :len(d.get_strategy())].tolist() == list(d.get_strategy().values())
+        assert population.get_estimated_regret()[i] == d.get_estimated_regret()
+        assert population.get_average_cost()[i] == d.get_average_cost()
+
+
+@pytest.mark.parametrize('population_factory', [get_rmq_learning_population, get_tq_learning_population, get_gtq_learning_population])
+def test_shared_population(population_factory):
+    env, population, avg_travel_times = run(lambda env, policy: population_factory(env, policy, shared=True))
+
+    n_actions = env.road_network.get_route_set_sizes()[env.drivers.od]
+    strategy = population.get_strategy()
+    assert strategy.shape == (len(env.possible_agents), n_actions.max())
+    assert np.all((population.get_last_actions() >= 0) & (population.get_last_actions() < n_actions))
+    assert all(np.isfinite(t) for t in avg_travel_times)
+
+    # the drivers of the same OD pair share their strategy
+    for od in range(len(env.od_pairs)):
+        assert np.all(strategy[env.drivers.od == od] == strategy[env.drivers.od == od][0])
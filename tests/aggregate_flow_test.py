@@ -0,0 +1,46 @@
+import numpy as np
+import pytest
+
+from route_choice_env.aggregate_flow import AggregateRouteChoice
+from route_choice_env.core import DriverPopulation
+from route_choice_env.misc import Distribution
+from route_choice_env.problem import Network
+
+
+@pytest.mark.parametrize('dynamics', ['replicator', 'logit'])
+@pytest.mark.parametrize('sample', [True, False])
+def test_aggregate_route_choice(dynamics, sample):
+    net = Network('OW', 8)
+    model = AggregateRouteChoice(net, dynamics, step_size=0.5, temperature=0.01, sample=sample, rng=np.random.default_rng(0))
+
+    avg_travel_times = model.run(100)
+
+    # the flows of each OD pair are assigned to its routes
+    flows = model.road_network_flow_distribution
+    assert np.allclose([sum(f) for f in flows], net.get_OD_flows())
+    if sample:
+        assert np.all(model.get_routes_flow() == np.round(model.get_routes_flow()))
+
+    # the distributions remain valid and the travel time decreases towards the equilibrium
+    p = model.get_probabilities()
+    assert np.allclose(p.sum(axis=1), 1.0) and np.all(p >= 0)
+    assert avg_travel_times[-1] < avg_travel_times[0]
+
+
+def test_aggregate_route_choice_is_reproducible():
+    net = Network('OW', 8)
+    runs = [AggregateRouteChoice(net, rng=np.random.default_rng(1)).run(10) for _ in range(2)]
+    assert runs[0] == runs[1]
+
+
+@pytest.mark.parametrize('agent_vehicles_factor', [0.1, 0.3])
+def test_drivers_match_driver_population(agent_vehicles_factor):
+    net = Network('OW', 8)
+    model = AggregateRouteChoice(net, agent_vehicles_factor=agent_vehicles_factor)
+    drivers = DriverPopulation(net.get_OD_pairs(), [net.get_OD_flow(od) for od in net.get_OD_pairs()], agent_vehicles_factor, Distribution(Distribution.DIST_FIXED))
+
+    # (the first driver of each OD pair carries the remainder flow, if any)
+    first_flow = drivers.flow[drivers.offset[:-1]]
+    remainder = np.where(first_flow != agent_vehicles_factor, first_flow, 0.0)
+    assert np.array_equal(model._AggregateRouteChoice__od_remainder, remainder)
+    assert np.array_equal(model._AggregateRouteChoice__od_drivers, np.diff(drivers.offset) - (remainder > 0))
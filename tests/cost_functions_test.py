@@ -0,0 +1,38 @@
+import numpy as np
+from py_expression_eval import Parser
+
+from route_choice_env.cost_functions import LinkCostEngine, BPRFunction, LinearFunction, GenericFunction
+
+
+def test_cost_functions_are_recognised():
+    engine = LinkCostEngine()
+    assert isinstance(engine.add_function('BPR', 'f', ['t', 'a', 'c', 'b'], 't*(1+a*(f/c)^b)'), BPRFunction)
+    assert isinstance(engine.add_function('OW', 'f', ['t'], 't+0.02*f'), LinearFunction)
+    assert isinstance(engine.add_function('BraessG', 'f', ['m', 'n'], 'm*f+n'), LinearFunction)
+    assert isinstance(engine.add_function('Quad', 'f', ['t'], 't+f^2'), GenericFunction)
+
+
+def test_cost_functions_match_expression_evaluation():
+    functions = {
+        'BPR': ('t*(1+a*(f/c)^b)', ['t', 'a', 'c', 'b'], [[1.09, 0.15, 9000, 4], [2.5, 0.15, 4500, 4]]),
+        'OW': ('t+0.02*f', ['t'], [[7], [11]]),
+        'BraessG': ('m*f+n', ['m', 'n'], [[0.00238095238095, 0.0], [0.0, 10.0]]),
+        'Quad': ('t+f^2', ['t'], [[3], [5]]),
+    }
+    engine = LinkCostEngine()
+    links = []
+    for name, (expr, constants, values) in functions.items():
+        engine.add_function(name, 'f', constants, expr)
+        for v in values:
+            engine.add_link(name, v)
+            links.append((expr, dict(zip(constants, map(float, v)))))
+    engine.compile()
+
+    for value in [0.0, 100.0, 4200.0]:
+        flow = np.full(len(links), value)
+        expected = [Parser().parse(expr).evaluate({**constants, 'f': value}) for expr, constants in links]
+        assert np.allclose(engine.evaluate(flow), expected)
+
+    # the derivatives (the BPR one is zero at zero flow, since the flow is a divisor)
+    deriv = engine.evaluate_deriv(np.array([0.0, 9000.0, 10.0, 10.0, 1.0, 1.0, 0.0, 2.0]))
+    assert np.allclose(deriv, [0.0, 0.15 * 4 * 2.5 * 2 ** 4 / 9000, 0.02, 0.02, 0.00238095238095, 0.0, 0.0, 4.0])
@@ -1,5 +1,113 @@
+import pickle
+
+import numpy as np
 from pettingzoo.test import parallel_api_test
 
+from route_choice_env.route_choice import RouteChoicePZ
+
 
 def test_pz_env(ow_8_env):
     parallel_api_test(ow_8_env, num_cycles=1000)
+
+
+def test_driver_population(ow_8_env):
+    drivers = ow_8_env.drivers
+    assert len(drivers) == len(ow_8_env.possible_agents)
+    for index, d_id in enumerate(ow_8_env.possible_agents):
+        assert drivers.get_index(d_id) == index
+        assert drivers.get_id(index) == d_id
+    for od in ow_8_env.od_pairs:
+        od_order = ow_8_env.road_network.get_OD_order(od)
+        assert drivers.flow[drivers.od == od_order].sum() == ow_8_env.road_network.get_OD_flow(od)
+    assert 'driver_unknown_0' not in ow_8_env.possible_agents
+
+
+def test_step_array_matches_step():
+    env = RouteChoicePZ('OW', 8, revenue_redistribution_rate=0.5)
+    rng = np.random.default_rng(0)
+    for _ in range(3):
+        actions = rng.integers(0, 8, len(env.possible_agents))
+
+        env.reset()
+        reward, marginal_cost, side_payment = env.step_array(actions)
+        avg_travel_time = env.avg_travel_time
+
+        env.reset()
+        _, reward_n, _, _, info_n = env.step(dict(zip(env.possible_agents, actions.tolist())))
+
+        assert env.avg_travel_time == avg_travel_time
+        assert list(reward_n.values()) == reward.tolist()
+        assert [info['marginal_cost'] for info in info_n.values()] == marginal_cost.tolist()
+        assert [info['side_payment'] for info in info_n.values()] == side_payment.tolist()
+
+
+def test_checkpoint():
+    env = RouteChoicePZ('OW', 8, preference_dist_name='DIST_UNIFORM', revenue_redistribution_rate=0.5)
+    env.reset()
+    env.step_array(np.random.randint(0, env.road_network.get_route_set_sizes()[env.drivers.od]))
+    env.reset()
+
+    restored = RouteChoicePZ('OW', 8, preference_dist_name='DIST_UNIFORM', revenue_redistribution_rate=0.5)
+    restored.load_checkpoint(pickle.loads(pickle.dumps(env.get_checkpoint())))
+
+    assert restored.iteration == env.iteration
+    assert restored.routes_costs_sum == env.routes_costs_sum
+    assert restored.side_payment_per_od == env.side_payment_per_od
+    assert np.array_equal(restored.drivers.preference_money_over_time, env.drivers.preference_money_over_time)
+
+
+def test_info_keys():
+    env = RouteChoicePZ('OW', 8, info_keys=['free_flow_travel_times', 'marginal_cost'])
+    _, info_n = env.reset()
+    actions = dict.fromkeys(env.possible_agents, 1)
+    _, reward_n, _, _, step_info_n = env.step(actions)
+
+    for d_id in env.possible_agents:
+        od = env.get_driver_od_pair(d_id)
+        assert set(info_n[d_id]) == {'free_flow_travel_times', 'marginal_cost'}
+        assert info_n[d_id]['free_flow_travel_times'] == tuple(env.get_free_flow_travel_times(od))
+        assert step_info_n[d_id]['marginal_cost'] == reward_n[d_id] - env.get_free_flow_travel_times(od)[1]
+        assert 'side_payment' not in step_info_n[d_id]
+
+    # the info of a step is not changed by the following steps
+    info = dict(step_info_n[env.possible_agents[0]])
+    env.reset()
+    env.step(dict.fromkeys(env.possible_agents, 0))
+    assert dict(step_info_n[env.possible_agents[0]]) == info
+
+    _, info_n = RouteChoicePZ('OW', 8, info_keys=()).reset()
+    assert all(len(info) == 0 for info in info_n.values())
+
+
+def test_tolls_and_side_payments():
+    env = RouteChoicePZ('OW', 8, preference_dist_name='DIST_UNIFORM', revenue_redistribution_rate=0.5)
+    env.reset()
+    actions = np.random.default_rng(1).integers(0, 8, len(env.possible_agents))
+    _, reward_n, _, _, info_n = env.step(dict(zip(env.possible_agents, actions.tolist())))
+
+    tolls_share_per_od = [0.0 for _ in env.od_pairs]
+    for d_id, tt in reward_n.items():
+        od_order = env.road_network.get_OD_order(env.get_driver_od_pair(d_id))
+        p = info_n[d_id]['preference_money_over_time']
+        tolls_share_per_od[od_order] += (info_n[d_id]['marginal_cost'] + tt * p) / p
+
+    assert env.tolls_share_per_od == tolls_share_per_od
+    assert env.side_payment_per_od == [
+        tolls_share_per_od[env.road_network.get_OD_order(od)] * 0.5 / env.road_network.get_OD_flow(od) for od in env.od_pairs
+    ]
+
+
+def test_routes_costs_stats():
+    env = RouteChoicePZ('OW', 8)
+    rng = np.random.default_rng(2)
+    routes_costs_sum = {od: [0.0] * 8 for od in env.od_pairs}
+    for i in range(3):
+        env.reset()
+        env.step_array(rng.integers(0, 8, len(env.possible_agents)))
+        for od in env.od_pairs:
+            for r in range(8):
+                routes_costs_sum[od][r] += env.road_network.get_route(od, r).get_cost(True)
+
+    assert env.routes_costs_sum == routes_costs_sum
+    assert env.get_routes_costs_min().tolist() == [min(routes_costs_sum[od]) / 3 for od in env.od_pairs]
+    assert env.routes_costs_min == dict(zip(env.od_pairs, env.get_routes_costs_min().tolist()))
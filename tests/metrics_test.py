@@ -0,0 +1,52 @@
+import io
+
+import numpy as np
+import pytest
+
+from route_choice_env.metrics import BinaryMetricsSink, TextMetricsSink, convert_metrics_to_text, read_metrics
+
+
+COLUMNS = ['i', 'avg_tt', 'real_reg', 'est_reg']
+
+
+def rows(n, start=0):
+    rng = np.random.default_rng(start)
+    return [[i] + rng.random(3).tolist() for i in range(start, start + n)]
+
+
+@pytest.mark.parametrize('background', [False, True])
+def test_binary_sink_converts_to_text(tmp_path, background):
+    text = io.StringIO()
+    text_sink = TextMetricsSink(text)
+    sink = BinaryMetricsSink(f'{tmp_path}/r.metrics', batch_size=7, background=background)
+    for s in [text_sink, sink]:
+        s.write_header(COLUMNS, ['i'])
+        for row in rows(50):
+            s.write(row)
+        s.close()
+
+    assert convert_metrics_to_text(f'{tmp_path}/r.metrics') == text.getvalue()
+
+
+def test_binary_sink_truncate_and_resume(tmp_path):
+    fname = f'{tmp_path}/r.metrics'
+    sink = BinaryMetricsSink(fname, batch_size=4, background=True)
+    sink.write_header(COLUMNS, ['i'])
+    for row in rows(10):
+        sink.write(row)
+    position = sink.get_position()
+    for row in rows(5, 10):
+        sink.write(row)
+    sink.flush()  # (e.g., interrupted after writing rows beyond the position)
+
+    resumed = BinaryMetricsSink(fname, batch_size=4, resume=True)
+    resumed.write_header(COLUMNS, ['i'])
+    resumed.truncate(position)
+    for row in rows(5, 10):
+        resumed.write(row)
+    resumed.close()
+    sink.close()
+
+    columns, int_columns, data = read_metrics(fname)
+    assert columns == COLUMNS and int_columns == ['i']
+    assert np.array_equal(data, np.array(rows(10) + rows(5, 10)))
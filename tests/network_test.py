@@ -0,0 +1,124 @@
+import numpy as np
+
+from route_choice_env.problem import Network
+
+
+def random_solution(net: Network, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    S = []
+    for od in net.get_OD_pairs():
+        p = rng.dirichlet(np.ones(net.get_route_set_size(od)))
+        S.append(list(p * net.get_OD_flow(od)))
+    return S
+
+
+def test_evaluate_assignment_matches_route_link_sums():
+    net = Network('OW', 8)
+    S = random_solution(net)
+    S_tf = [[x * 0.5 for x in S_od] for S_od in S]
+    avg_cost, _ = net.evaluate_assignment(S, S_tf, check_consistency=False)
+
+    link_flow = {l: 0.0 for l in net.get_links()}
+    total_cost = 0.0
+    for i_od, od in enumerate(net.get_OD_pairs()):
+        for r, route in enumerate(net.get_routes(od)):
+            for l in route.get_links():
+                link_flow[l] += S[i_od][r]
+    for i_od, od in enumerate(net.get_OD_pairs()):
+        for r, route in enumerate(net.get_routes(od)):
+            assert np.isclose(route.get_cost(), sum(net.get_link(l).get_cost() for l in route.get_links()))
+            total_cost += route.get_cost() * S[i_od][r]
+
+    assert all(np.isclose(net.get_link(l).get_flow(), f) for l, f in link_flow.items())
+    assert np.isclose(avg_cost, total_cost / net.get_total_flow())
+
+
+def test_routes_follow_od_order():
+    net = Network('OW', 8)
+    offset = net.get_routes_offset()
+    for i_od, od in enumerate(net.get_OD_pairs()):
+        assert offset[i_od + 1] - offset[i_od] == net.get_route_set_size(od)
+        for r, route in enumerate(net.get_routes(od)):
+            assert net.get_route_index(od, r) == route.get_index()
+            assert net.get_route_by_index(route.get_index()) is route
+            assert net.get_routes_od()[route.get_index()] == i_od
+
+
+def test_incremental_evaluation_matches_full_evaluation():
+    net = Network('SF', 4)
+    full = Network('SF', 4)
+    rng = np.random.default_rng(1)
+
+    S = random_solution(net)
+    for _ in range(5):
+        # move the flow of a few OD pairs to other routes
+        for i_od in rng.choice(len(S), size=10, replace=False):
+            S[i_od] = list(np.roll(S[i_od], 1))
+        S_tf = [[x * 0.5 for x in S_od] for S_od in S]
+
+        assert net.evaluate_assignment(S, S_tf, incremental=True) == full.evaluate_assignment(S, S_tf)
+        assert np.array_equal(net.get_links_flow(), full.get_links_flow())
+        assert np.array_equal(net.get_links_marginal_cost(), full.get_links_marginal_cost())
+        assert np.array_equal(net.get_routes_cost(), full.get_routes_cost())
+        assert np.array_equal(net.get_routes_weighted_marginal_cost(), full.get_routes_weighted_marginal_cost())
+
+        # resetting the graph does not affect the next incremental evaluation
+        net.reset_graph()
+
+
+def test_reset_graph_restores_free_flow():
+    net = Network('OW', 8)
+    free_flow_cost = net.get_routes_cost().copy()
+    free_flow_marginal_cost = net.get_links_marginal_cost().copy()
+
+    for seed in range(2):
+        S = random_solution(net, seed)
+        net.evaluate_assignment(S, S)
+        net.reset_graph()
+
+        assert np.all(net.get_links_flow() == 0.0)
+        assert np.array_equal(net.get_routes_cost(), free_flow_cost)
+        assert np.array_equal(net.get_links_marginal_cost(), free_flow_marginal_cost)
+
+
+def test_batched_evaluation_matches_evaluate_assignment():
+    net = Network('OW', 8)
+    solutions = [random_solution(net, seed) for seed in range(4)]
+    batch = np.array([[x for S_od in S for x in S_od] for S in solutions])
+
+    avg_costs, normalised_avg_costs, route_costs = net.evaluate_assignments(batch)
+    assert route_costs.shape == (4, net.get_number_of_routes())
+
+    # the batched evaluation does not change the graph
+    assert np.all(net.get_links_flow() == 0.0)
+
+    for i, S in enumerate(solutions):
+        avg_cost, normalised_avg_cost = net.evaluate_assignment(S, S, check_consistency=False)
+        assert np.isclose(avg_costs[i], avg_cost)
+        assert np.isclose(normalised_avg_costs[i], normalised_avg_cost)
+        assert np.allclose(route_costs[i], net.get_routes_cost())
+
+
+def test_cached_network_matches_parsed_network():
+    parsed = Network('Braess_2_4200_10_c1', 4, cache=False)
+    Network('Braess_2_4200_10_c1', 4)  # ensure the cache exists
+    cached = Network('Braess_2_4200_10_c1', 4)
+
+    assert list(cached.get_links()) == list(parsed.get_links())
+    assert cached.get_OD_pairs() == parsed.get_OD_pairs()
+    assert [str(r) for r in cached.get_routes(cached.get_OD_pairs()[0])] == [str(r) for r in parsed.get_routes(parsed.get_OD_pairs()[0])]
+    assert (cached.get_routes_links() != parsed.get_routes_links()).nnz == 0
+    assert np.array_equal(cached.get_routes_cost(), parsed.get_routes_cost())
+    assert cached.get_normalisation_factor_routes() == parsed.get_normalisation_factor_routes()
+
+
+def test_integer_identifiers_match_names():
+    net = Network('OW', 8)
+    for l in net.get_links():
+        assert net.get_link_by_index(net.get_link_index(l)) is net.get_link(l)
+    assert np.array_equal(net.get_OD_flows(), [net.get_OD_flow(od) for od in net.get_OD_pairs()])
+    for od in net.get_OD_pairs():
+        assert net.get_route_set_sizes()[net.get_OD_order(od)] == net.get_route_set_size(od)
+        for r, route in enumerate(net.get_routes(od)):
+            assert net.get_route_by_index(net.get_route_index(od, r)) is route
+            assert [str(net.get_link_by_index(l)) for l in route.get_links_indices()] == route.get_links()
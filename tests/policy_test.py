@@ -0,0 +1,54 @@
+import numpy as np
+import pytest
+
+from route_choice_env.policy import Boltzmann, EpsilonGreedy, Random
+
+
+class StrategyAgent(object):
+    def __init__(self, q):
+        self.__strategy = {a: v for a, v in enumerate(q) if np.isfinite(v)}
+
+    def get_strategy(self):
+        return self.__strategy
+
+
+def q_matrix(n_agents, k=5, seed=0):
+    rng = np.random.default_rng(seed)
+    q = rng.random((n_agents, k))
+    q[:, 1][:n_agents // 3] = q[:, 0][:n_agents // 3]  # ties
+    n_actions = rng.integers(1, k + 1, n_agents)
+    return np.where(np.arange(k) < n_actions[:, None], q, -np.inf)
+
+
+@pytest.mark.parametrize('policy', [EpsilonGreedy(0.0), EpsilonGreedy(0.4), EpsilonGreedy(1.0), Random(), Boltzmann(0.1), Boltzmann(0.0)])
+def test_act_batch_matches_act(policy):
+    q = q_matrix(500)
+
+    np.random.seed(1)
+    expected = [policy.act(StrategyAgent(row)) for row in q]
+    expected_next = np.random.random()
+
+    np.random.seed(1)
+    actions = policy.act_batch(q)
+
+    assert actions.tolist() == expected
+    assert np.random.random() == expected_next  # the same random numbers were consumed
+
+
+@pytest.mark.parametrize('policy', [EpsilonGreedy(0.4), Random(), Boltzmann(0.1)])
+def test_act_batch_with_generator(policy):
+    q = q_matrix(1000)
+    n_actions = np.isfinite(q).sum(axis=1)
+
+    actions = policy.act_batch(q, np.random.default_rng(2))
+
+    assert np.all((actions >= 0) & (actions < n_actions))
+    assert np.array_equal(actions, policy.act_batch(q, np.random.default_rng(2)))
+
+
+def test_boltzmann_probabilities():
+    q = np.tile([[0.5, 0.4, 0.1, -np.inf]], (100000, 1))
+    actions = Boltzmann(0.1).act_batch(q, np.random.default_rng(3))
+
+    p = np.exp(q[0, :3] / 0.1) / np.exp(q[0, :3] / 0.1).sum()
+    assert np.allclose(np.bincount(actions, minlength=4), np.append(p, 0.0) * len(q), rtol=0.05, atol=50)
@@ -0,0 +1,31 @@
+import numpy as np
+
+from route_choice_env.problem import Network, NETWORKS_DIR, generate_routes_file
+
+
+def test_generated_routes_are_the_k_shortest(tmp_path):
+    net = Network('OW', 16)
+    k = 8
+    fname = f'{tmp_path}/OW.k{k}.routes'
+    generate_routes_file(f'{NETWORKS_DIR}/OW.net', fname, k, workers=1)
+
+    generated = {}
+    with open(fname) as f:
+        for line in f.readlines()[1:]:
+            od, route = line.split()
+            generated.setdefault(od, []).append(route.split(','))
+
+    for od in net.get_OD_pairs():
+        assert len(generated[od]) == k
+
+        # the routes are loopless paths from the origin to the destination
+        origin, destination = od.split('|')
+        for route in generated[od]:
+            nodes = [net.get_link(route[0]).get_origin()] + [net.get_link(l).get_destination() for l in route]
+            assert nodes[0] == origin and nodes[-1] == destination
+            assert len(set(nodes)) == len(nodes)
+
+        # with the same free flow costs of the (shipped) K shortest routes
+        costs = sorted(sum(net.get_link(l).get_cost() for l in route) for route in generated[od])
+        expected = sorted(r.get_free_flow_travel_time() for r in net.get_routes(od))[:k]
+        assert np.allclose(costs, expected)
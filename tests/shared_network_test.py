@@ -0,0 +1,26 @@
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from route_choice_env.problem import Network
+from route_choice_env.shared_network import SharedNetworkSpec, attach_network_spec
+
+
+def worker_network_summary(net_name, k):
+    from route_choice_env import problem
+    net = Network(net_name, k, cache=False)
+    # the specification was registered by the initializer, so the network files are not read
+    registered = problem._registered_specs[(net_name, k, None)]
+    return registered['routes_links_indices'].flags.writeable, net.get_routes_cost().tolist(), net.get_OD_flows().tolist()
+
+
+def test_shared_network_spec():
+    expected = Network('OW', 8)
+    with SharedNetworkSpec('OW', 8) as spec:
+        with ProcessPoolExecutor(max_workers=2, initializer=attach_network_spec, initargs=(spec.descriptor,)) as ex:
+            results = list(ex.map(worker_network_summary, ['OW', 'OW'], [8, 8]))
+
+    for writeable, routes_cost, od_flows in results:
+        assert not writeable
+        assert np.array_equal(routes_cost, expected.get_routes_cost())
+        assert np.array_equal(od_flows, expected.get_OD_flows())
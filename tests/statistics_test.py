@@ -0,0 +1,76 @@
+import random
+
+import numpy as np
+import pandas as pd
+
+from route_choice_env.policy import EpsilonGreedy
+from route_choice_env.route_choice import RouteChoicePZ
+from route_choice_env.services import get_rmq_learning_agents, get_rmq_learning_population, step_drivers
+from route_choice_env.statistics import EpisodeStatsBuffer, Statistics
+
+
+def episode_rows(n):
+    rng = np.random.default_rng(0)
+    return [[i] + rng.random(3).tolist() for i in range(n)]
+
+
+def test_episode_stats_buffer(tmp_path):
+    rows = episode_rows(1000)
+    buffer = EpisodeStatsBuffer(['i', 'avg_tt', 'real_reg', 'est_reg'], int_columns=['i'], capacity=4)
+    for row in rows:
+        buffer.append(row)
+
+    df = buffer.to_frame()
+    assert len(buffer) == 1000
+    assert df['i'].dtype.kind == 'i'
+    assert np.array_equal(df.to_numpy(), np.array(rows))
+
+    buffer.save_csv(f'{tmp_path}/stats.csv')
+    assert np.allclose(pd.read_csv(f'{tmp_path}/stats.csv', sep=';', index_col=0).to_numpy(), np.array(rows))
+
+
+def test_episode_stats_buffer_flush(tmp_path):
+    rows = episode_rows(1050)
+    buffer = EpisodeStatsBuffer(['i', 'avg_tt', 'real_reg', 'est_reg'], int_columns=['i'], flush_filename=f'{tmp_path}/flushed.csv', flush_every=100)
+    for row in rows:
+        buffer.append(row)
+
+    # only the episodes not yet flushed are kept in memory
+    assert len(buffer) == 1050 and len(buffer.to_frame()) == 50
+
+    buffer.save_csv(f'{tmp_path}/stats.csv')
+    df = pd.read_csv(f'{tmp_path}/stats.csv', sep=';', index_col=0)
+    assert df.index.tolist() == list(range(1050))
+    assert np.allclose(df.to_numpy(), np.array(rows))
+
+
+def run_statistics(drivers_factory, episodes=5):
+    random.seed(0)
+    np.random.seed(0)
+    env = RouteChoicePZ('OW', 8)
+    policy = EpsilonGreedy(1.0, 0.0)
+    drivers = drivers_factory(env, policy)
+    statistics = Statistics(env, drivers, episodes, True, True, True)
+    sum_regrets = {od: [0.0, 0.0, 0.0, 0.0] for od in env.od_pairs}
+    for i in range(episodes):
+        step_drivers(env, drivers, policy, 0.9, 0.5)
+        if isinstance(drivers, dict):
+            for d_id, d in drivers.items():
+                d.update_real_regret(env.routes_costs_min[env.get_driver_od_pair(d_id)])
+        else:
+            drivers.update_real_regret(env.get_routes_costs_min()[env.drivers.od])
+        statistics.print_statistics_episode(i, env.avg_travel_time, sum_regrets)
+        solution = env.road_network_flow_distribution
+        env.reset()
+    statistics.print_statistics(solution, env.avg_travel_time, 0.0, sum_regrets, env.routes_costs_sum)
+    return statistics.get_episode_stats()
+
+
+def test_statistics_of_population_match_agents(capsys):
+    expected = run_statistics(get_rmq_learning_agents)
+    expected_output = capsys.readouterr().out
+
+    stats = run_statistics(get_rmq_learning_population)
+
+    assert capsys.readouterr().out == expected_output
+    assert stats.equals(expected)
@@ -0,0 +1,42 @@
+import random
+
+import numpy as np
+import pytest
+
+from route_choice_env.route_choice import RouteChoicePZ
+from route_choice_env.vec_route_choice import VecRouteChoice
+
+
+@pytest.mark.parametrize('net, k', [('OW', 8), ('Braess_3_4200_10_c1', 4)])
+def test_replications_match_environments(net, k):
+    random.seed(1)
+    vec_env = VecRouteChoice(net, k, 3, preference_dist_name='DIST_UNIFORM', revenue_redistribution_rate=0.5)
+    random.seed(1)
+    envs = [RouteChoicePZ(net, k, preference_dist_name='DIST_UNIFORM', revenue_redistribution_rate=0.5) for _ in range(3)]
+
+    assert np.array_equal(vec_env.preference_money_over_time, np.stack([env.drivers.preference_money_over_time for env in envs]))
+
+    rng = np.random.default_rng(0)
+    sizes = vec_env.road_network.get_route_set_sizes()[vec_env.drivers.od]
+    for _ in range(4):
+        actions = rng.integers(0, sizes, (3, len(sizes)))
+        reward, marginal_cost, side_payment = vec_env.step(actions)
+        assert reward.shape == marginal_cost.shape == side_payment.shape == actions.shape
+
+        for r, env in enumerate(envs):
+            env_reward, env_marginal_cost, env_side_payment = env.step_array(actions[r])
+            assert np.allclose(reward[r], env_reward)
+            assert np.allclose(marginal_cost[r], env_marginal_cost)
+            assert np.allclose(side_payment[r], env_side_payment)
+            assert np.isclose(vec_env.avg_travel_time[r], env.avg_travel_time)
+            assert np.allclose(vec_env.get_routes_costs_min()[r], env.get_routes_costs_min())
+            env.reset()
+        vec_env.reset()
+
+
+def test_invalid_actions():
+    vec_env = VecRouteChoice('OW', 4, 2)
+    with pytest.raises(ValueError):
+        vec_env.step(np.zeros(len(vec_env.possible_agents), dtype=int))
+    with pytest.raises(IndexError):
+        vec_env.step(np.full((2, len(vec_env.possible_agents)), 4))